@@ -2,15 +2,43 @@ from flask_sqlalchemy import SQLAlchemy
 from config import ApplicationConfig
 from flask_session import Session
 from .app_instance import app
+from .replicas import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
-def create_app():
+def create_app(config: dict = None):
+    """
+    Configures the app and registers its extensions, routes and commands.
+
+    :param config: Settings that override ApplicationConfig, for tools like the benchmarks that run their own database and Redis.
+
+    :return: The app.
+    """
     app.config.from_object(ApplicationConfig)
+    app.config.update(config or {})
     server_session = Session(app)
+
+    from .json_provider import init_json
+    init_json(app)
+
+    from .metrics import configure_engine, init_metrics
+    from .replicas import configure_replicas, init_replicas
+    configure_engine(app)
+    configure_replicas(app)
     db.init_app(app)
+    init_metrics(app)
+    init_replicas(app)
+
+    from .profiler import init_profiler
+    init_profiler(app)
+
+    from .services.cart_store import check_config
+    check_config(app)
 
     from .routes import api_bp
     app.register_blueprint(api_bp)
 
+    from .cli import register_commands
+    register_commands(app)
+
     return app
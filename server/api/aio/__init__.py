@@ -0,0 +1,50 @@
+from flask import Flask
+
+try:
+    import quart
+except ImportError:
+    quart = None
+
+try:
+    import asgiref
+except ImportError:
+    asgiref = None
+
+def create_async_app(app: Flask):
+    """
+    Builds the ASGI app of asgi.py around the Flask app.
+    Item, user and cart reads, cart changes and image uploads are served by async routes on an async engine
+    and Redis client, so one process keeps thousands of requests in flight while they wait on the database,
+    Redis or the disk. Every other route is served by the Flask app on a thread pool.
+
+    :param app: The Flask app from create_app.
+
+    :return: The ASGI app.
+    :raises RuntimeError: If quart or asgiref is not installed.
+    """
+    if quart is None or asgiref is None:
+        raise RuntimeError('The async routes need quart, asgiref and asyncpg or aiosqlite installed')
+    from .database import dispose, init_database
+    from .dispatcher import AsyncDispatcher
+    from .profiler import init_profiler
+    from .routes import api_bp
+    from .sessions import SharedSessionInterface
+
+    async_app = quart.Quart(__name__)
+    # Quart keeps its own defaults, like MAX_CONTENT_LENGTH, where Flask leaves a setting unset
+    async_app.config.update({key: value for key, value in app.config.items() if value is not None})
+    # responses are encoded the same way as the sync routes'
+    async_app.json = type(app.json)(async_app)
+
+    init_database(app)
+    async_app.session_interface = SharedSessionInterface(app)
+    init_profiler(async_app, app)
+    async_app.register_blueprint(api_bp)
+
+    @async_app.after_serving
+    async def close_connections():
+        await dispose(app)
+
+    # carts kept in Redis by the cart store are served by the sync routes, which read through the store
+    sync_endpoints = ('api.cart.',) if app.config['CART_STORE'] != 'database' else ()
+    return AsyncDispatcher(app, async_app, sync_endpoints)
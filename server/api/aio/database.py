@@ -0,0 +1,95 @@
+import redis.asyncio
+from flask import Flask, current_app, g
+from sqlalchemy import event
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from api.profiler import watch_engine
+
+# backend -> the async driver its URLs are switched to
+ASYNC_DRIVERS = {'postgresql': 'asyncpg', 'sqlite': 'aiosqlite'}
+
+def async_url(uri: str) -> URL:
+    """
+    Switches a database URL to the async driver of its backend.
+
+    :param uri: The URL of the sync engine.
+
+    :return: The URL with the async driver.
+    :raises ValueError: If the backend has no known async driver.
+    """
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No async driver for {backend}, set ASYNC_DATABASE_URL')
+    return url.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}')
+
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # the listener of the models only knows sqlite3 connections, aiosqlite wraps them
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
+def init_database(app: Flask):
+    """
+    Creates the async engine and Redis client of the async routes.
+    They are stored with the Flask app, whose context every async request runs in.
+
+    :param app: The Flask app.
+    """
+    if app.config['ASYNC_DATABASE_URL']:
+        url = make_url(app.config['ASYNC_DATABASE_URL'])
+    else:
+        url = async_url(app.config['SQLALCHEMY_DATABASE_URI'])
+
+    if url.get_backend_name() == 'sqlite':
+        # SQLite keeps its default pool, like the sync engine
+        engine = create_async_engine(url)
+        event.listen(engine.sync_engine, 'connect', _enable_sqlite_foreign_keys)
+    else:
+        engine = create_async_engine(url, pool_size=app.config['ASYNC_POOL_SIZE'], max_overflow=app.config['ASYNC_MAX_OVERFLOW'])
+    watch_engine(app, engine.sync_engine)
+
+    app.extensions['async_database'] = {
+        'engine': engine,
+        'sessions': async_sessionmaker(engine, expire_on_commit=False),
+        'redis': redis.asyncio.Redis(connection_pool=redis.asyncio.BlockingConnectionPool.from_url(
+            app.config['ASYNC_REDIS_URL'], max_connections=app.config['ASYNC_REDIS_MAX_CONNECTIONS']
+        ))
+    }
+
+async def dispose(app: Flask):
+    """
+    Closes the connections of the async engine and Redis client.
+
+    :param app: The Flask app.
+    """
+    database = app.extensions['async_database']
+    await database['engine'].dispose()
+    await database['redis'].aclose()
+
+def get_session() -> AsyncSession:
+    """
+    Gets the async session of the current request, opened on first use.
+
+    :return: The session.
+    """
+    session = g.get('async_session')
+    if session is None:
+        session = g.async_session = current_app.extensions['async_database']['sessions']()
+    return session
+
+async def close_session():
+    """
+    Closes the async session of the current request, if it opened one.
+    """
+    session = g.pop('async_session', None)
+    if session is not None:
+        await session.close()
+
+def get_redis() -> redis.asyncio.Redis:
+    """
+    Gets the async Redis client.
+
+    :return: The client.
+    """
+    return current_app.extensions['async_database']['redis']
@@ -0,0 +1,83 @@
+import sys
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgiInstance
+from flask import Flask
+from flask.ctx import RequestContext
+from flask.sessions import NullSession
+from quart import Quart
+from werkzeug.exceptions import HTTPException
+from api.aio.database import close_session
+
+class _ThreadedWsgiInstance(WsgiToAsgiInstance):
+    # asgiref runs every wrapped request on one shared thread, these run on the event loop's thread pool
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__['run_wsgi_app'].func, thread_sensitive=False)
+
+def _environ(scope: dict, root_path: str, path: str) -> dict:
+    """
+    Builds the WSGI environ of the Flask request context an async request runs in.
+    It only has what url_for and the logs need, the body is read through Quart.
+    """
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path,
+        'PATH_INFO': path,
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        # Flask's default log handler writes to the errors stream of the current request
+        'wsgi.errors': sys.stderr
+    }
+    for name, value in scope['headers']:
+        if name == b'host':
+            environ['HTTP_HOST'] = value.decode('latin-1')
+    return environ
+
+class AsyncDispatcher:
+    """
+    The ASGI app of asgi.py. Requests to a route of the Quart app are handled on the event loop,
+    every other request is handled by the Flask app on a worker thread.
+    """
+
+    def __init__(self, app: Flask, async_app: Quart, sync_endpoints: tuple[str] = ()):
+        """
+        :param app: The Flask app.
+        :param async_app: The Quart app with the async routes.
+        :param sync_endpoints: Prefixes of the endpoints of the Quart app to leave to the Flask app.
+        """
+        self.app = app
+        self.async_app = async_app
+        self.sync_endpoints = sync_endpoints
+        self.routes = async_app.url_map.bind('localhost')
+
+    def _is_async(self, method: str, path: str) -> bool:
+        try:
+            endpoint, _ = self.routes.match(path, method)
+        except HTTPException:
+            # unknown URLs, other methods and redirects to the canonical URL are answered by the Flask app
+            return False
+        return not endpoint.startswith(self.sync_endpoints)
+
+    async def __call__(self, scope: dict, receive, send):
+        if scope['type'] != 'http':
+            # lifespan events open and close the connections of the Quart app
+            await self.async_app(scope, receive, send)
+            return
+
+        root_path = scope.get('root_path', '')
+        path = scope['path'][len(root_path):] if scope['path'].startswith(root_path) else scope['path']
+        if not self._is_async(scope['method'], path):
+            await _ThreadedWsgiInstance(self.app)(scope, receive, send)
+            return
+
+        # the sync code the async routes share, like url_for, the config and the services run with
+        # asyncio.to_thread, needs a Flask request context. Its session is Quart's, loaded asynchronously
+        context = RequestContext(self.app, _environ(scope, root_path, path), session=NullSession())
+        context.push()
+        try:
+            await self.async_app(scope, receive, send)
+        finally:
+            await close_session()
+            context.pop()
@@ -0,0 +1,31 @@
+from flask import Flask
+from quart import Quart, Response, g, request
+from api.profiler import add_profile_headers, start_profile, stop_profile
+
+def init_profiler(async_app: Quart, app: Flask):
+    """
+    Adds the query count and database time of each request of the async routes to its response, like profiler.init_profiler.
+    The statements of the async engine are timed by database.init_database.
+
+    :param async_app: The Quart app with the async routes.
+    :param app: The Flask app, whose settings apply.
+    """
+    mode = app.config['SQL_PROFILING']
+    if mode == 'off':
+        return
+
+    @async_app.before_request
+    async def start_request_profile():
+        g.sql_profiling_mode = mode
+        start_profile(g, request)
+
+    @async_app.after_request
+    async def add_request_profile(response: Response) -> Response:
+        profile = stop_profile(g)
+        if profile is not None:
+            add_profile_headers(app, response, profile, request.method, request.path)
+        return response
+
+    @async_app.teardown_request
+    async def discard_profile(exception):
+        stop_profile(g)
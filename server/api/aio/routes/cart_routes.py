@@ -0,0 +1,140 @@
+from quart import Blueprint, Response, jsonify, make_response, request
+from api.aio.services import cart_service
+from api.aio.routes.conditional import not_modified
+from api.routes.conditional import with_validators
+
+bp = Blueprint('cart', __name__, url_prefix='/cart')
+
+@bp.route('/', methods=['GET'])
+async def get_carts() -> Response:
+    """
+    Response to a GET request to /cart. Gets a page of carts from the database.
+
+    :param limit: Maximum number of carts to return.
+    :param cursor: Cursor of the page to get, from the next field of the previous page.
+    :param sort: Column to order the carts by, id or updated_at.
+
+    :return: Response with HTTP status of OK, a list of carts and the cursor of the next page.
+    Response with HTTP status of NOT MODIFIED if the client's copy of the page is current.
+    Response with HTTP status of BAD REQUEST if the cursor or sort is invalid.
+    """
+    limit, cursor, sort = request.args.get('limit', type=int), request.args.get('cursor'), request.args.get('sort', 'id')
+    try:
+        # removed lines do not move the latest update time, so carts are only validated by ETag
+        _, etag = await cart_service.get_carts_version(limit, cursor, sort)
+        response = not_modified(None, etag)
+        if response:
+            return response
+        carts, next_cursor = await cart_service.get_carts_serialized(limit, cursor, sort)
+    except ValueError as e:
+        return await make_response(jsonify({'error': str(e)}), 400)
+    return with_validators(await make_response(jsonify({'data': carts, 'next': next_cursor}), 200), None, etag)
+
+@bp.route('/<int:id>/', methods=['GET'])
+async def get_cart(id: int) -> Response:
+    """
+    Response to a GET request to /cart/<id>. Gets a cart from the database by its ID.
+
+    :param id: ID of the cart to get.
+
+    :return: Response with HTTP status of OK and the cart with the given ID.
+    Response with HTTP status of NOT MODIFIED if the client's copy of the cart is current.
+    Response with HTTP status of NOT FOUND if no cart exists with the given ID.
+    """
+    version = await cart_service.get_cart_version(id)
+    if version is None:
+        return await make_response(jsonify({'error': f'Cart with id {id} not found'}), 404)
+
+    _, etag = version
+    response = not_modified(None, etag)
+    if response:
+        return response
+
+    cart = await cart_service.get_cart_serialized(id)
+
+    if cart is None:
+        return await make_response(jsonify({'error': f'Cart with id {id} not found'}), 404)
+
+    return with_validators(await make_response(jsonify(cart), 200), None, etag)
+
+@bp.route('/<int:id>/', methods=['POST'])
+async def create_cart(id: int) -> Response:
+    """
+    Response to a POST request to /cart. Creates a cart in the database.
+
+    :return: Response with HTTP status of CREATED and the created cart.
+    Response with HTTP status of BAD REQUEST if the cart already exists.
+    Response with HTTP status of NOT FOUND if the user does not exist.
+    """
+    if await cart_service.get_cart_version(id):
+        return await make_response(jsonify({'error': f'Cart with id {id} already exists'}), 400)
+
+    cart = await cart_service.create_cart(id)
+    if not cart:
+        return await make_response(jsonify({'error': f'User with id {id} not found'}), 404)
+
+    return await make_response(jsonify(cart), 201)
+
+@bp.route('/<int:id>/', methods=['DELETE'])
+async def delete_cart(id: int) -> Response:
+    """
+    Response to a DELETE request to /cart/<id>. Deletes a cart from the database by its ID.
+
+    :param id: ID of the cart to delete.
+
+    :return: Response with HTTP status of OK and the deleted cart.
+    Response with HTTP status of NOT FOUND if no cart exists with the given ID.
+    """
+    deleted = await cart_service.delete_cart(id)
+
+    if not deleted:
+        return await make_response(jsonify({'error': f'Cart with id {id} not found'}), 404)
+
+    return await make_response(jsonify({'message': 'cart deleted'}), 200)
+
+@bp.route('/item/<int:id>/', methods=['PUT'])
+async def add_to_cart(id: int) -> Response:
+    """
+    Response to a PUT request to /cart/item/<id>. Adds an item to a cart in the database.
+
+    :param id: ID of the cart to add the item to.
+    :param item_id: ID of the item to add to the cart.
+    :param quantity: Quantity of the item to add to the cart.
+
+    :return: Response with HTTP status of OK and the updated cart.
+    Response with HTTP status of NOT FOUND if no cart exists with the given ID.
+    Response with HTTP status of BAD REQUEST if the quantity is less than 1.
+    Response with HTTP status of NOT FOUND if the item does not exist.
+    """
+    data = await request.get_json()
+    item_id = data.get('item_id')
+    quantity = data.get('quantity')
+    if quantity < 1:
+        return await make_response(jsonify({'error': 'Quantity must be greater than 0'}), 400)
+
+    cart, error = await cart_service.add_to_cart(id, item_id, quantity)
+    if error:
+        return await make_response(jsonify({'error': error}), 404)
+
+    return await make_response(jsonify(cart), 200)
+
+@bp.route('/item/<int:id>/', methods=['DELETE'])
+async def remove_from_cart(id: int) -> Response:
+    """
+    Response to a DELETE request to /cart/item/<id>. Removes an item from a cart in the database.
+
+    :param id: ID of the cart to remove the item from.
+    :param item_id: ID of the item to remove from the cart.
+
+    :return: Response with HTTP status of OK and the updated cart.
+    Response with HTTP status of NOT FOUND if no cart exists with the given ID.
+    Response with HTTP status of NOT FOUND if the item does not exist.
+    """
+    data = await request.get_json()
+    item_id = data.get('item_id')
+
+    cart, error = await cart_service.remove_from_cart(id, item_id)
+    if error:
+        return await make_response(jsonify({'error': error}), 404)
+
+    return await make_response(jsonify(cart), 200)
@@ -0,0 +1,14 @@
+from datetime import datetime
+from quart import Response, request
+from api.routes.conditional import not_modified_response
+
+def not_modified(last_modified: datetime, etag: str) -> Response:
+    """
+    Checks the conditional headers of the request against the validators of a resource, like conditional.not_modified.
+
+    :param last_modified: When the resource was last modified, None if it cannot be compared by date.
+    :param etag: The strong entity tag of the resource.
+
+    :return: Response with HTTP status of NOT MODIFIED if the client's copy is current, None otherwise.
+    """
+    return not_modified_response(request, Response, last_modified, etag)
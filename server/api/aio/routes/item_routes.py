@@ -0,0 +1,106 @@
+from flask import current_app
+from quart import Blueprint, Response, jsonify, make_response, request
+from api.aio.services import item_service, listing_snapshot
+from api.aio.routes.conditional import not_modified
+from api.routes.conditional import with_validators
+from api.services.image_service import ImageTooLarge, InvalidImage
+from api.services.listing_snapshot import Listing
+
+bp = Blueprint('item', __name__, url_prefix='/item')
+
+async def _listing_response(listing: Listing) -> Response:
+    """
+    Sends the listing in the best content coding the client accepts.
+
+    :param listing: The listing.
+
+    :return: Response with HTTP status of OK and the listing.
+    Response with HTTP status of NOT MODIFIED if the client's copy of the listing is current.
+    """
+    encoding = listing.negotiate(request.accept_encodings)
+    etag = listing.etag(encoding)
+    response = not_modified(None, etag)
+    if not response:
+        response = await make_response(listing.bodies[encoding], 200)
+        response.mimetype = current_app.json.mimetype
+        if encoding != 'identity':
+            response.content_encoding = encoding
+    response.vary.add('Accept-Encoding')
+    return with_validators(response, None, etag)
+
+@bp.route('/', methods=['GET'])
+async def get_items() -> Response:
+    """
+    Response to a GET request to /item. Gets a page of items from the database.
+    Without arguments the precompressed listing is sent, with an ETag of its version.
+
+    :param limit: The maximum number of items to return.
+    :param cursor: The cursor of the page to get, from the next field of the previous page.
+    :param sort: The column to order the items by, id or updated_at.
+
+    :return: Response with HTTP status of OK, a list of items and the cursor of the next page.
+    Response with HTTP status of NOT_MODIFIED if the client's copy of the page is current.
+    Response with HTTP status of BAD_REQUEST if the cursor or sort is invalid.
+    """
+    limit, cursor, sort = request.args.get('limit', type=int), request.args.get('cursor'), request.args.get('sort', 'id')
+    if limit is None and cursor is None and sort == 'id':
+        listing = await listing_snapshot.get_listing()
+        if listing:
+            return await _listing_response(listing)
+    try:
+        # deletions do not move the latest update time, so pages are only validated by ETag
+        _, etag = await item_service.get_items_version(limit, cursor, sort)
+        response = not_modified(None, etag)
+        if response:
+            return response
+        items, next_cursor = await item_service.get_items_serialized(limit, cursor, sort)
+    except ValueError as e:
+        return await make_response(jsonify({'error': str(e)}), 400)
+    return with_validators(await make_response(jsonify({'data': items, 'next': next_cursor}), 200), None, etag)
+
+@bp.route('/<int:id>/', methods=['GET'])
+async def get_item(id: int) -> Response:
+    """
+    Response to a GET request to /item/<item_id>. Gets an item from the database.
+
+    :param id: The ID of the item to get.
+
+    :return: Response with HTTP status of OK and the item.
+    Response with HTTP status of NOT_MODIFIED if the client's copy of the item is current.
+    Response with HTTP status of NOT_FOUND if the item does not exist.
+    """
+    version = await item_service.get_item_version(id)
+    if not version:
+        return await make_response(jsonify({'error': 'Item not found'}), 404)
+    response = not_modified(*version)
+    if response:
+        return response
+
+    item = await item_service.get_item_serialized(id)
+    if not item:
+        return await make_response(jsonify({'error': 'Item not found'}), 404)
+    return with_validators(await make_response(jsonify(item), 200), *version)
+
+@bp.route('/image/<int:id>/', methods=['PUT'])
+async def update_item_image(id: int) -> Response:
+    """
+    Response to a PUT request to /item/image/<item_id>. Updates an item's image in the database.
+
+    :param id: The ID of the item to update.
+    :param image: An image file to upload.
+
+    :return: Response with HTTP status of OK and the updated item.
+    Response with HTTP status of BAD_REQUEST if the image is not a JPEG, PNG, GIF or WebP file.
+    Response with HTTP status of NOT_FOUND if the item does not exist.
+    Response with HTTP status of REQUEST_ENTITY_TOO_LARGE if the image is larger than IMAGE_MAX_BYTES.
+    """
+    image = (await request.files).get('image')
+    try:
+        item = await item_service.update_item_image(id, image)
+    except InvalidImage as e:
+        return await make_response(jsonify({'error': str(e)}), 400)
+    except ImageTooLarge as e:
+        return await make_response(jsonify({'error': str(e)}), 413)
+    if not item:
+        return await make_response(jsonify({'error': 'Item not found'}), 404)
+    return await make_response(jsonify(item), 200)
@@ -0,0 +1,76 @@
+from quart import Blueprint, Response, jsonify, make_response, request, session
+from api.aio.services import user_service
+from api.aio.routes.conditional import not_modified
+from api.routes.conditional import with_validators
+
+bp = Blueprint('user', __name__, url_prefix='/user')
+
+@bp.route('/session/', methods=['GET'])
+async def session_user() -> Response:
+    """
+    Response to a GET request to /user/session. Checks if a user is logged in.
+
+    :return: Response with HTTP status of UNAUTHORIZED if the user is not logged in or no longer exists.
+    Response with HTTP status of OK and the user.
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return await make_response(jsonify({"error": "User not logged in"}), 401)
+
+    user, stored = await user_service.get_session_user(user_id, session.get('user'))
+    if not user:
+        session.clear()
+        return await make_response(jsonify({"error": "User not logged in"}), 401)
+
+    # only write the session back to Redis when the stored copy changed
+    if stored != session.get('user'):
+        session['user'] = stored
+    return await make_response(jsonify(user), 200)
+
+@bp.route('/', methods=['GET'])
+async def get_users() -> Response:
+    """
+    Response to a GET request to /user. Gets a page of users from the database.
+
+    :param limit: The maximum number of users to return.
+    :param cursor: The cursor of the page to get, from the next field of the previous page.
+    :param sort: The column to order the users by, id or updated_at.
+
+    :return: Response with HTTP status of BAD_REQUEST if the cursor or sort is invalid.
+    Response with HTTP status of NOT_MODIFIED if the client's copy of the page is current.
+    Response with HTTP status of OK, a list of users and the cursor of the next page.
+    """
+    limit, cursor, sort = request.args.get('limit', type=int), request.args.get('cursor'), request.args.get('sort', 'id')
+    try:
+        # deletions do not move the latest update time, so pages are only validated by ETag
+        _, etag = await user_service.get_users_version(limit, cursor, sort)
+        response = not_modified(None, etag)
+        if response:
+            return response
+        users, next_cursor = await user_service.get_users_serialized(limit, cursor, sort)
+    except ValueError as e:
+        return await make_response(jsonify({"error": str(e)}), 400)
+    return with_validators(await make_response(jsonify({"data": users, "next": next_cursor}), 200), None, etag)
+
+@bp.route('/<int:id>/', methods=['GET'])
+async def get_user(id: int) -> Response:
+    """
+    Response to a GET request to /user/<id>. Gets a user from the database.
+
+    :param id: The id of the user to get.
+
+    :return: Response with HTTP status of NOT_FOUND if the user does not exist.
+    Response with HTTP status of NOT_MODIFIED if the client's copy of the user is current.
+    Response with HTTP status of OK and the user.
+    """
+    version = await user_service.get_user_version(id)
+    if not version:
+        return await make_response(jsonify({"error": "User not found"}), 404)
+    response = not_modified(*version)
+    if response:
+        return response
+
+    user = await user_service.get_user_serialized(id)
+    if not user:
+        return await make_response(jsonify({"error": "User not found"}), 404)
+    return with_validators(await make_response(jsonify(user), 200), *version)
@@ -0,0 +1,60 @@
+from typing import Awaitable, Callable
+from flask import current_app
+from redis import RedisError
+from api.aio.database import get_redis
+# the keys and encoding of the sync cache, so both read and invalidate the same values
+from api.services.cache import encode, entry_keys, generation_keys, overflow, parse_generation, queue_store, storable
+
+async def generation(namespace: str) -> int:
+    """
+    Gets the current generation of a namespace, which changes every time it is invalidated.
+
+    :param namespace: The namespace.
+
+    :return: The generation, None if Redis is unavailable.
+    """
+    try:
+        return parse_generation(await get_redis().get(generation_keys(namespace)[0]))
+    except RedisError:
+        return None
+
+async def cached(namespace: str | tuple[str, ...], key: str, loader: Callable[[], Awaitable], ttl: int):
+    """
+    Reads a JSON serializable value through the Redis cache, like cache.cached of the sync services.
+    If Redis is unavailable the loader is awaited directly.
+
+    :param namespace: The namespace of the value, shared by everything a write invalidates, or a tuple of namespaces.
+    :param key: The key of the value within the namespace.
+    :param loader: Awaited to load the value on a cache miss.
+    :param ttl: The number of seconds to keep the value for.
+
+    :return: The cached or loaded value, as it would be decoded from JSON.
+    """
+    client = get_redis()
+    try:
+        cache_key, index_key = entry_keys(namespace, await client.mget(generation_keys(namespace)), key)
+        cached_value = await client.get(cache_key)
+        if cached_value is not None:
+            return current_app.json.loads(cached_value)
+    except RedisError:
+        return await loader()
+
+    encoded = encode(await loader())
+    if storable(encoded):
+        await _store(client, cache_key, index_key, encoded, ttl)
+    return current_app.json.loads(encoded)
+
+async def _store(client, cache_key: str, index_key: str, encoded: str, ttl: int):
+    """
+    Stores a value and evicts the oldest keys of its generation beyond CACHE_MAX_ENTRIES.
+    """
+    try:
+        pipe = client.pipeline()
+        queue_store(pipe, cache_key, index_key, encoded, ttl)
+        evict = overflow((await pipe.execute())[-1])
+        if evict > 0:
+            evicted = [key for key, _ in await client.zpopmin(index_key, evict)]
+            if evicted:
+                await client.delete(*evicted)
+    except RedisError:
+        pass
@@ -0,0 +1,180 @@
+import asyncio
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError
+from api.models.cart import Cart
+from api.models.cart_item import CartItem
+from api.models.item import Item
+from api.models.user import User
+from api.aio.database import get_session
+from api.aio.services.pagination import first, paginate
+from api.services.cart_service import cart_version_columns, lines_statement, serialize_carts
+from api.services.id_allocator import reserve_ids
+from api.services.upsert import insert
+from api.services.versions import version_of
+
+async def _serialize_carts(carts: list) -> list[dict]:
+    """
+    Serializes carts the same way as Cart.serialize, reading the lines of every cart with one query of columns.
+
+    :param carts: Rows with the id and subtotal of the carts.
+
+    :return: List of serialized carts.
+    """
+    rows = await get_session().execute(lines_statement([cart.id for cart in carts])) if carts else []
+    return serialize_carts(carts, rows)
+
+async def get_carts_serialized(limit: int = None, cursor: str = None, sort: str = 'id') -> tuple[list[dict], str]:
+    """
+    Gets a page of serialized carts.
+
+    :param limit: Maximum number of carts to return.
+    :param cursor: Cursor of the page to get. None for the first page.
+    :param sort: Column to order the carts by, id or updated_at.
+
+    :return: Tuple of the list of serialized carts and the cursor of the next page. None if there are no more carts.
+    """
+    carts, next_cursor = await paginate(select(Cart.id, Cart.updated_at, Cart.subtotal), Cart, limit, cursor, sort)
+    return await _serialize_carts(carts), next_cursor
+
+async def get_cart_serialized(id: int) -> dict:
+    """
+    Gets a serialized cart from the database by its ID.
+
+    :param id: ID of the cart to get.
+
+    :return: Serialized cart with the given ID. None if no cart exists with the given ID.
+    """
+    cart = await first(select(Cart.id, Cart.subtotal).where(Cart.id == id))
+    if cart is None:
+        return None
+    return (await _serialize_carts([cart]))[0]
+
+async def get_carts_version(limit: int = None, cursor: str = None, sort: str = 'id') -> tuple[datetime, str]:
+    """
+    Gets the validators of a page of carts without loading their lines.
+
+    :param limit: Maximum number of carts in the page.
+    :param cursor: Cursor of the page. None for the first page.
+    :param sort: Column the carts are ordered by, id or updated_at.
+
+    :return: Tuple of when the page was last modified and a fingerprint of the page.
+    """
+    rows, next_cursor = await paginate(select(*cart_version_columns()), Cart, limit, cursor, sort)
+    return version_of(rows, next_cursor)
+
+async def get_cart_version(id: int) -> tuple[datetime, str]:
+    """
+    Gets the validators of a cart without loading its lines.
+
+    :param id: ID of the cart.
+
+    :return: Tuple of when the cart was last modified and a fingerprint of the cart. None if no cart exists with the given ID.
+    """
+    row = await first(select(*cart_version_columns()).where(Cart.id == id))
+    return version_of([row]) if row else None
+
+async def create_cart(user_id: int) -> dict:
+    """
+    Creates a cart in the database.
+
+    :param user_id: ID of the user to create a cart for.
+
+    :return: Serialized cart that was created. None if no user exists with the given ID.
+    """
+    if not await first(select(User.id).where(User.id == user_id)):
+        return None
+
+    session = get_session()
+    session.add(Cart(user_id))
+    await session.commit()
+
+    return await get_cart_serialized(user_id)
+
+async def delete_cart(id: int) -> bool:
+    """
+    Deletes a cart and its lines from the database by its ID.
+
+    :param id: ID of the cart to delete.
+
+    :return: True if the cart was deleted. False if no cart exists with the given ID.
+    """
+    session = get_session()
+    await session.execute(delete(CartItem).where(CartItem.cart_id == id))
+    result = await session.execute(delete(Cart).where(Cart.id == id))
+    await session.commit()
+    return result.rowcount > 0
+
+async def _missing_error(cart_id: int, item_id: int) -> str:
+    """
+    Finds out which side of a cart line does not exist. Only used on the failure path.
+
+    :param cart_id: ID of the cart of the line.
+    :param item_id: ID of the item of the line.
+
+    :return: Error message for the missing item or cart. None if both exist.
+    """
+    if not await first(select(Item.id).where(Item.id == item_id)):
+        return f'Item with id {item_id} not found'
+    if not await first(select(Cart.id).where(Cart.id == cart_id)):
+        return f'Cart with id {cart_id} not found'
+    return None
+
+async def add_to_cart(cart_id: int, item_id: int, quantity: int) -> tuple[dict, str]:
+    """
+    Adds an item to a cart in the database with a single INSERT ... ON CONFLICT statement,
+    incrementing the quantity if the item is already in the cart.
+
+    :param cart_id: ID of the cart to add the item to.
+    :param item_id: ID of the item to add to the cart.
+    :param quantity: Quantity of the item to add to the cart.
+
+    :return: Tuple of the serialized cart that was updated and an error message if the cart or item does not exist.
+    """
+    session = get_session()
+    row = {'cart_id': cart_id, 'item_id': item_id, 'quantity': quantity}
+    if current_app.config['ID_ALLOCATOR'] != 'identity':
+        # hi-lo blocks are reserved with the sync engine, most ids come from memory
+        row['id'], = await asyncio.to_thread(reserve_ids, CartItem, 1)
+
+    stmt = insert(CartItem, session.bind.dialect.name).values(row)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CartItem.cart_id, CartItem.item_id],
+        set_={'quantity': CartItem.quantity + stmt.excluded.quantity, 'updated_at': func.current_timestamp()}
+    )
+    try:
+        await session.execute(stmt)
+        await session.commit()
+    except IntegrityError:
+        # foreign key violation, the cart or the item does not exist
+        await session.rollback()
+        error = await _missing_error(cart_id, item_id)
+        if error is None:
+            raise
+        return None, error
+
+    return await get_cart_serialized(cart_id), None
+
+async def remove_from_cart(cart_id: int, item_id: int) -> tuple[dict, str]:
+    """
+    Removes an item from a cart in the database with a single DELETE statement.
+
+    :param cart_id: ID of the cart to remove the item from.
+    :param item_id: ID of the item to remove from the cart.
+
+    :return: Tuple of the serialized cart that was updated and an error message if the cart or item does not exist.
+    """
+    session = get_session()
+    result = await session.execute(
+        delete(CartItem).where(CartItem.cart_id == cart_id, CartItem.item_id == item_id)
+    )
+    await session.commit()
+
+    if result.rowcount == 0:
+        # nothing was removed, check why only now
+        error = await _missing_error(cart_id, item_id)
+        if error:
+            return None, error
+
+    return await get_cart_serialized(cart_id), None
@@ -0,0 +1,154 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import func, select, update
+from werkzeug.datastructures import FileStorage
+from api.models.item import Item
+from api.aio.database import get_session
+from api.aio.services import cache
+from api.aio.services.pagination import first, paginate
+from api.services import image_service, item_service
+from api.services.pagination import clamp_limit
+from api.services.versions import dump_version, load_version, version_of
+
+@asynccontextmanager
+async def _image_lock(image_url: str):
+    """
+    Holds the lock of a stored image for the async with block and commits the session at its end, like item_service._image_lock.
+
+    :param image_url: The image URL to lock.
+    """
+    session = get_session()
+    locked = session.bind.dialect.name == 'postgresql'
+    if locked:
+        await session.execute(image_service.lock_statement(image_url))
+    else:
+        # the process lock is shared with the sync routes, polled so a waiting request keeps no thread
+        while not image_service.store_lock.acquire(blocking=False):
+            await asyncio.sleep(0.01)
+    try:
+        yield
+        await session.commit()
+    except BaseException:
+        await session.rollback()
+        raise
+    finally:
+        if not locked:
+            image_service.store_lock.release()
+
+async def _release_image(image_url: str) -> bool:
+    """
+    Deletes an image from the server once no item references it anymore.
+    Call it after the change that dropped the reference has been committed.
+
+    :param image_url: The image URL to release.
+
+    :return: True if the image was deleted, false if it is still in use or does not exist.
+    """
+    if not image_url:
+        return False
+    async with _image_lock(image_url):
+        if await first(item_service.image_user_statement(image_url)):
+            return False
+        return await asyncio.to_thread(image_service.delete_image, image_url)
+
+async def get_items_serialized(limit: int = None, cursor: str = None, sort: str = 'id') -> tuple[list[dict], str]:
+    """
+    Gets a page of serialized items, read through the cache shared with the sync services.
+
+    :param limit: The maximum number of items to return.
+    :param cursor: The cursor of the page to get, none for the first page.
+    :param sort: The column to order the items by, id or updated_at.
+
+    :return: A tuple containing a list of serialized items and the cursor of the next page, none if there are no more items.
+    """
+    limit = clamp_limit(limit)
+
+    async def load():
+        rows, next_cursor = await paginate(select(*Item.serialized_columns()), Item, limit, cursor, sort)
+        return {'data': [Item.serialize_row(row) for row in rows], 'next': next_cursor}
+
+    page = await cache.cached(item_service.PAGE_SCOPE, item_service.page_key(sort, limit, cursor), load, current_app.config['ITEM_CACHE_TTL'])
+    return page['data'], page['next']
+
+async def get_item_serialized(id: int) -> dict:
+    """
+    Gets a serialized item, read through the cache shared with the sync services.
+
+    :param id: The ID of the item to get.
+
+    :return: The serialized item, none if the item does not exist.
+    """
+    async def load():
+        row = await first(item_service.row_statement(id))
+        return Item.serialize_row(row) if row else None
+
+    return await cache.cached(item_service.item_scope(id), 'item', load, current_app.config['ITEM_CACHE_TTL'])
+
+async def get_items_version(limit: int = None, cursor: str = None, sort: str = 'id') -> tuple[datetime, str]:
+    """
+    Gets the validators of a page of items from the ids and update times of its rows, read through the cache.
+
+    :param limit: The maximum number of items in the page.
+    :param cursor: The cursor of the page, none for the first page.
+    :param sort: The column the items are ordered by, id or updated_at.
+
+    :return: A tuple containing when the page was last modified and a fingerprint of the page.
+    """
+    limit = clamp_limit(limit)
+
+    async def load():
+        rows, next_cursor = await paginate(select(Item.id, Item.updated_at), Item, limit, cursor, sort)
+        return dump_version(version_of(rows, next_cursor))
+
+    return load_version(await cache.cached(item_service.PAGE_SCOPE, f'version:{item_service.page_key(sort, limit, cursor)}', load, current_app.config['ITEM_CACHE_TTL']))
+
+async def get_item_version(id: int) -> tuple[datetime, str]:
+    """
+    Gets the validators of an item without loading it, read through the cache.
+
+    :param id: The ID of the item.
+
+    :return: A tuple containing when the item was last modified and a fingerprint of the item, none if the item does not exist.
+    """
+    async def load():
+        row = await first(item_service.version_statement(id))
+        return dump_version(version_of([row])) if row else None
+
+    return load_version(await cache.cached(item_service.item_scope(id), 'version', load, current_app.config['ITEM_CACHE_TTL']))
+
+async def update_item_image(id: int, image: FileStorage) -> dict:
+    """
+    Updates an item's image in the database.
+    The upload is hashed and written to disk by a worker thread, so the event loop keeps serving other requests.
+
+    :param id: The ID of the item to update.
+    :param image: An image file to upload.
+
+    :return: The updated item, serialized, none if the item does not exist.
+    :raises ImageTooLarge: If the image is larger than IMAGE_MAX_BYTES.
+    :raises InvalidImage: If the image is not a JPEG, PNG, GIF or WebP file.
+    """
+    row = await first(select(Item.image_url).where(Item.id == id))
+    if not row:
+        return None
+
+    old_image_url = row.image_url
+    temp_path, image_url = await asyncio.to_thread(image_service.receive_image, image)
+    try:
+        async with _image_lock(image_url):
+            await asyncio.to_thread(image_service.place_image, temp_path, image_url)
+            if image_url != old_image_url:
+                await get_session().execute(
+                    update(Item).where(Item.id == id).values(image_url=image_url, updated_at=func.current_timestamp())
+                )
+    finally:
+        await asyncio.to_thread(image_service.discard_upload, temp_path)
+    # the invalidations use the sync engine and Redis client, the thread runs in this request's Flask context
+    await asyncio.to_thread(item_service.items_changed, [id])
+    if old_image_url != image_url:
+        await _release_image(old_image_url)
+
+    row = await first(item_service.row_statement(id))
+    return Item.serialize_row(row) if row else None
@@ -0,0 +1,26 @@
+import asyncio
+from redis import RedisError
+from api.aio.database import get_redis
+from api.services import listing_snapshot
+from api.services.listing_snapshot import CURRENT_KEY, Listing, snapshot_key
+
+async def get_listing() -> Listing:
+    """
+    Gets the current listing, like listing_snapshot.get_listing of the sync services,
+    which builds it in a worker thread if Redis has none.
+
+    :return: The listing, None if listings are disabled or Redis is unavailable.
+    """
+    if not listing_snapshot.enabled():
+        return None
+
+    client = get_redis()
+    try:
+        version = await client.get(CURRENT_KEY)
+        listing = listing_snapshot.kept(version)
+        if listing is not None:
+            return listing
+        listing = listing_snapshot.load(int(version), await client.hgetall(snapshot_key(int(version)))) if version is not None else None
+    except RedisError:
+        return None
+    return listing_snapshot.keep(listing) if listing else await asyncio.to_thread(listing_snapshot.build_missing)
@@ -0,0 +1,30 @@
+from api import db
+from api.aio.database import get_session
+from api.services.pagination import keyset, keyset_page
+
+async def paginate(statement, model: db.Model, limit: int = None, cursor: str = None, sort: str = 'id') -> tuple[list, str]:
+    """
+    Fetches one page of a select statement using keyset pagination, like pagination.paginate.
+
+    :param statement: The select statement to paginate.
+    :param model: The model the statement selects, must have id and updated_at columns.
+    :param limit: The page size, clamped to PAGE_SIZE_MAX.
+    :param cursor: The cursor returned with the previous page, None for the first page.
+    :param sort: The column to sort by, either id or updated_at.
+
+    :return: A tuple containing the rows of the page and the cursor of the next page, None if this is the last page.
+    :raises ValueError: If the sort key or cursor is invalid.
+    """
+    statement, limit = keyset(statement, model, limit, cursor, sort)
+    rows = (await get_session().execute(statement)).all()
+    return keyset_page(rows, limit, sort)
+
+async def first(statement):
+    """
+    Runs a select statement and gets its first row.
+
+    :param statement: The statement.
+
+    :return: The first row, None if there are no rows.
+    """
+    return (await get_session().execute(statement)).first()
@@ -0,0 +1,82 @@
+from datetime import datetime
+from sqlalchemy import select
+from api.models.user import User
+from api.aio.services import cache
+from api.aio.services.pagination import first, paginate
+from api.services.user_service import session_user_cache, stored_session_user
+from api.services.versions import version_of
+
+async def get_users_serialized(limit: int = None, cursor: str = None, sort: str = 'id') -> tuple[list[dict], str]:
+    """
+    Gets a page of serialized users.
+
+    :param limit: The maximum number of users to return.
+    :param cursor: The cursor of the page to get, None for the first page.
+    :param sort: The column to order the users by, id or updated_at.
+
+    :return: A tuple containing a list of serialized users and the cursor of the next page, None if there are no more users.
+    """
+    rows, next_cursor = await paginate(select(*User.serialized_columns()), User, limit, cursor, sort)
+    return [User.serialize_row(row) for row in rows], next_cursor
+
+async def get_users_version(limit: int = None, cursor: str = None, sort: str = 'id') -> tuple[datetime, str]:
+    """
+    Gets the validators of a page of users from the ids and update times of its rows.
+
+    :param limit: The maximum number of users in the page.
+    :param cursor: The cursor of the page, None for the first page.
+    :param sort: The column the users are ordered by, id or updated_at.
+
+    :return: A tuple containing when the page was last modified and a fingerprint of the page.
+    """
+    rows, next_cursor = await paginate(select(User.id, User.updated_at), User, limit, cursor, sort)
+    return version_of(rows, next_cursor)
+
+async def get_user_version(id: int) -> tuple[datetime, str]:
+    """
+    Gets the validators of a user without loading it.
+
+    :param id: The id of the user.
+
+    :return: A tuple containing when the user was last modified and a fingerprint of the user, None if the user does not exist.
+    """
+    row = await first(select(User.id, User.updated_at).where(User.id == id))
+    return version_of([row]) if row else None
+
+async def get_user_serialized(id: int) -> dict:
+    """
+    Gets a serialized user from the database.
+
+    :param id: The id of the user to get.
+
+    :return: The serialized user, None if the user does not exist.
+    """
+    row = await first(select(*User.serialized_columns()).where(User.id == id))
+    return User.serialize_row(row) if row else None
+
+async def get_session_user(id: int, stored: dict = None) -> tuple[dict, dict]:
+    """
+    Gets the serialized user of a session without a database round trip when possible,
+    from the in-process cache of the sync services first, then from the copy stored with the session.
+
+    :param id: The id of the logged in user.
+    :param stored: The copy of the user stored with the session, None if there is none yet.
+
+    :return: A tuple containing the serialized user and the copy to store with the session.
+    The user is None if it no longer exists.
+    """
+    user = session_user_cache().get(id)
+    if user is not None:
+        return user, stored
+
+    # read the generation before the user, so a concurrent update always leaves the copy stale
+    generation = await cache.generation(f'user:{id}')
+    user = stored_session_user(id, stored, generation)
+    if user is None:
+        user = await get_user_serialized(id)
+        if not user:
+            return None, None
+        stored = {'generation': generation, 'user': user}
+
+    session_user_cache().set(id, user)
+    return user, stored
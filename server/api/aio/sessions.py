@@ -0,0 +1,23 @@
+import asyncio
+from flask import Flask
+from quart import Quart, Request, Response
+from quart.sessions import SessionInterface
+
+class SharedSessionInterface(SessionInterface):
+    """
+    Opens and saves the sessions of the async routes with the session interface of the Flask app, Flask-Session's,
+    through its public open_session and save_session. Session ids, cookies and the stored data are the same,
+    so a user logged in on either app is logged in on both. Its storage calls block, they run on a worker thread.
+    """
+
+    def __init__(self, app: Flask):
+        """
+        :param app: The Flask app, whose session interface and cookie settings are used.
+        """
+        self.app = app
+
+    async def open_session(self, app: Quart, request: Request):
+        return await asyncio.to_thread(self.app.session_interface.open_session, self.app, request)
+
+    async def save_session(self, app: Quart, session, response: Response):
+        await asyncio.to_thread(self.app.session_interface.save_session, self.app, session, response)
@@ -0,0 +1,63 @@
+import click
+from flask import Flask
+from flask.cli import with_appcontext
+from api import db
+from api.services import cart_store, import_service
+from api.services.id_allocator import resync_sequences
+
+@click.command('import-items')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'format', type=click.Choice(import_service.FORMATS), help='Guessed from the file extension if not given.')
+@click.option('--mode', type=click.Choice(import_service.MODES), default='upsert', show_default=True)
+@click.option('--batch-size', type=int, help='Rows per batch, defaults to IMPORT_BATCH_SIZE.')
+@with_appcontext
+def import_items_command(path: str, format: str, mode: str, batch_size: int):
+    """
+    Imports a CSV or NDJSON catalog file into the items table.
+    """
+    format = format or import_service.detect_format(path)
+    if not format:
+        raise click.UsageError('Cannot guess the format from the file extension, pass --format')
+
+    with open(path, 'rb') as file:
+        for event in import_service.import_items(file, format, mode, batch_size):
+            if event['type'] == 'error':
+                click.echo(f"line {event['line']}: {event['error']}", err=True)
+            else:
+                click.echo(f"{event['type']}: {event['rows']} rows read, {event['written']} written, {event['skipped']} skipped, {event['errors']} errors")
+
+@click.command('flush-carts')
+@click.option('--recover', is_flag=True, help='Write every cart in Redis, not only the ones marked dirty, after the dirty set was lost.')
+@with_appcontext
+def flush_carts_command(recover: bool):
+    """
+    Writes carts kept in Redis to the database.
+    """
+    if not cart_store.enabled():
+        raise click.UsageError('CART_STORE is not redis, carts are already in the database')
+    if recover:
+        click.echo(f'{cart_store.recover()} carts marked dirty')
+    click.echo(f'{cart_store.flush_all()} carts written')
+
+@click.command('resync-ids')
+@with_appcontext
+def resync_ids_command():
+    """
+    Moves the identity sequences past the largest existing keys, run it after rows were inserted with explicit keys.
+    """
+    with db.engine.begin() as connection:
+        synced = resync_sequences(connection)
+    if not synced:
+        click.echo('No sequences to resync, the database continues from the largest key on its own')
+    for table, next_value in synced.items():
+        click.echo(f'{table}: next id {next_value}')
+
+def register_commands(app: Flask):
+    """
+    Registers the command line commands of the API on the app.
+
+    :param app: The app to register the commands on.
+    """
+    app.cli.add_command(import_items_command)
+    app.cli.add_command(flush_carts_command)
+    app.cli.add_command(resync_ids_command)
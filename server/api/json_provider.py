@@ -0,0 +1,81 @@
+import re
+from flask import Flask, Response
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# json writes exponents as 1e+16 and 1e-07 where orjson writes 1e16 and 1e-7, may also match inside strings
+_EXPONENT = re.compile(rb'\de[-\d]')
+_COMPACT = {'indent': None, 'separators': (',', ':')}
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Encodes and decodes JSON with orjson, written in Rust, giving the same bytes as Flask's provider.
+    orjson only writes compact JSON, so responses and dumps called with compact separators use it,
+    everything else and output orjson would write differently, like text that json escapes to ASCII
+    or floats in exponent notation, goes through json. NaN and infinite floats are written as null.
+    """
+
+    def _encode(self, obj) -> bytes:
+        """
+        Encodes a value as compact JSON with orjson.
+
+        :param obj: The value.
+
+        :return: The JSON, none if orjson cannot encode the value the same way as json.
+        """
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            # datetimes and dataclasses are passed to default, which formats them like json does
+            encoded = orjson.dumps(obj, default=self.default, option=option)
+        except orjson.JSONEncodeError:
+            return None
+        if self.ensure_ascii and (not encoded.isascii() or b'\x7f' in encoded):
+            return None
+        if _EXPONENT.search(encoded):
+            return None
+        return encoded
+
+    def dumps(self, obj, **kwargs) -> str:
+        if kwargs == _COMPACT or kwargs == {'separators': (',', ':')}:
+            encoded = self._encode(obj)
+            if encoded is not None:
+                return encoded.decode()
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s: str | bytes, **kwargs):
+        if not kwargs:
+            try:
+                return orjson.loads(s)
+            except orjson.JSONDecodeError:
+                # json also reads NaN, big integers and UTF-16, or raises its own error
+                pass
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs) -> Response:
+        obj = self._prepare_response_obj(args, kwargs)
+        if self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(obj)
+
+        encoded = self._encode(obj)
+        if encoded is None:
+            return super().response(obj)
+        return self._app.response_class(encoded + b'\n', mimetype=self.mimetype)
+
+def init_json(app: Flask):
+    """
+    Makes the app encode JSON with orjson if JSON_ENCODER is orjson and orjson is installed.
+
+    :param app: The app to configure.
+    """
+    if app.config['JSON_ENCODER'] != 'orjson':
+        return
+    if orjson is None:
+        app.logger.warning('orjson is not installed, encoding JSON with json')
+        return
+    app.json = OrjsonProvider(app)
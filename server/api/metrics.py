@@ -0,0 +1,161 @@
+import os
+import time
+from contextlib import contextmanager
+from flask import Flask, Response, g, request
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+from api import db
+
+try:
+    import prometheus_client
+    from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, multiprocess
+except ImportError:
+    prometheus_client = None
+
+# metrics are module level so every app in the process shares them, like prometheus_client's default registry
+if prometheus_client is not None:
+    REQUEST_LATENCY = Histogram(
+        'http_request_duration_seconds', 'Time spent handling a request, until the response is returned',
+        ['blueprint', 'endpoint', 'method']
+    )
+    REQUESTS = Counter('http_requests_total', 'Requests handled', ['blueprint', 'endpoint', 'method', 'status'])
+    SESSION_LATENCY = Histogram(
+        'session_store_duration_seconds', 'Time spent loading and saving sessions in Redis', ['operation'],
+        buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1)
+    )
+    PASSWORD_HASH_LATENCY = Histogram(
+        'password_hash_duration_seconds', 'Time spent in scrypt, excluding the wait for a hashing worker', ['operation'],
+        buckets=(.01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+    )
+    POOL_WAIT = Histogram(
+        'db_pool_checkout_wait_seconds', 'Time spent waiting for a database connection from the pool',
+        buckets=(.0001, .0005, .001, .005, .01, .05, .1, .5, 1, 5, 30)
+    )
+    POOL_IN_USE = Gauge('db_pool_connections_in_use', 'Database connections checked out of the pool', multiprocess_mode='livesum')
+    POOL_OVERFLOW = Gauge('db_pool_overflow', 'Database connections open beyond the pool size', multiprocess_mode='livesum')
+    POOL_SIZE = Gauge('db_pool_size', 'Configured size of the database connection pool', multiprocess_mode='livesum')
+else:
+    REQUEST_LATENCY = REQUESTS = SESSION_LATENCY = PASSWORD_HASH_LATENCY = POOL_WAIT = None
+    POOL_IN_USE = POOL_OVERFLOW = POOL_SIZE = None
+
+def observe(histogram, seconds: float, **labels):
+    """
+    Records a duration, does nothing if prometheus_client is not installed.
+
+    :param histogram: One of the histograms of this module.
+    :param seconds: The duration.
+    :param labels: The label values of the observation.
+    """
+    if histogram is None:
+        return
+    (histogram.labels(**labels) if labels else histogram).observe(seconds)
+
+@contextmanager
+def timed(histogram, **labels):
+    """
+    Records how long the body of a with statement takes, does nothing if prometheus_client is not installed.
+
+    :param histogram: One of the histograms of this module.
+    :param labels: The label values of the observation.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(histogram, time.perf_counter() - start, **labels)
+
+class TimedQueuePool(QueuePool):
+    """
+    A QueuePool that records how long each checkout waits for a connection.
+    """
+
+    def _do_get(self):
+        with timed(POOL_WAIT):
+            return super()._do_get()
+
+class TimedSessionInterface:
+    """
+    Wraps the app's session interface to record the Redis round trips of loading and saving sessions.
+    Everything else is passed through to the wrapped interface.
+    """
+
+    def __init__(self, interface):
+        self.interface = interface
+
+    def __getattr__(self, name):
+        return getattr(self.interface, name)
+
+    def open_session(self, app, request):
+        with timed(SESSION_LATENCY, operation='open'):
+            return self.interface.open_session(app, request)
+
+    def save_session(self, app, session, response):
+        with timed(SESSION_LATENCY, operation='save'):
+            return self.interface.save_session(app, session, response)
+
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+def _record_request(response: Response) -> Response:
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    # the endpoint name keeps one series per route, unmatched URLs share one
+    endpoint = request.endpoint or 'unmatched'
+    blueprint = request.blueprint or ''
+    REQUEST_LATENCY.labels(blueprint, endpoint, request.method).observe(time.perf_counter() - started)
+    REQUESTS.labels(blueprint, endpoint, request.method, response.status_code).inc()
+    return response
+
+def _update_pool_gauges():
+    pool = db.engine.pool
+    if isinstance(pool, QueuePool):
+        POOL_IN_USE.set(pool.checkedout())
+        POOL_OVERFLOW.set(max(pool.overflow(), 0))
+        POOL_SIZE.set(pool.size())
+
+def configure_engine(app: Flask):
+    """
+    Makes the database engine record connection pool waits. Has to run before db.init_app creates the engine.
+    SQLite keeps its default pool.
+
+    :param app: The app to configure.
+    """
+    if prometheus_client is None or not app.config['METRICS_ENABLED']:
+        return
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI')
+    if uri and make_url(uri).get_backend_name() != 'sqlite':
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'poolclass': TimedQueuePool, **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
+
+def init_metrics(app: Flask):
+    """
+    Instruments the app and exposes the metrics on /metrics in the Prometheus text format.
+    Set PROMETHEUS_MULTIPROC_DIR when running several worker processes so every worker is counted.
+
+    :param app: The app to instrument.
+    """
+    if not app.config['METRICS_ENABLED']:
+        return
+    if prometheus_client is None:
+        app.logger.warning('prometheus_client is not installed, metrics are disabled')
+        return
+
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    app.session_interface = TimedSessionInterface(app.session_interface)
+
+    def metrics() -> Response:
+        """
+        Response to a GET request to /metrics. Gets the metrics of the process, or of every worker in multiprocess mode.
+
+        :return: Response with HTTP status of OK and the metrics in the Prometheus text format.
+        """
+        _update_pool_gauges()
+        if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = prometheus_client.REGISTRY
+        return Response(prometheus_client.generate_latest(registry), content_type=prometheus_client.CONTENT_TYPE_LATEST)
+
+    app.add_url_rule('/metrics', 'metrics', metrics, methods=['GET'])
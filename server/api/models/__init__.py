@@ -2,9 +2,32 @@ from .user import User
 from .item import Item
 from .cart import Cart
 from .cart_item import CartItem
+from .id_block import IdBlock
+from .order import Order
+from .order_item import OrderItem
+import sqlite3
 from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import current_timestamp
 
 event.listen(User, 'before_update', User.update_timestamp)
 event.listen(Item, 'before_update', Item.update_timestamp)
 event.listen(Cart, 'before_update', Cart.update_timestamp)
 event.listen(CartItem, 'before_update', CartItem.update_timestamp)
+event.listen(Order, 'before_update', Order.update_timestamp)
+
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # sqlite ignores foreign keys unless asked, cart upserts rely on them to reject unknown ids
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+event.listen(Engine, 'connect', enable_sqlite_foreign_keys)
+
+@compiles(current_timestamp, 'sqlite')
+def sqlite_current_timestamp(element, compiler, **kw):
+    # sqlite's CURRENT_TIMESTAMP only has seconds, two writes in one second would share a version and an ETag.
+    # Microseconds in the format a bound datetime is stored in, so timestamps compare as text with either
+    return "STRFTIME('%Y-%m-%d %H:%M:%f000', 'now')"
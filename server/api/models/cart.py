@@ -1,10 +1,12 @@
-from sqlalchemy import func
+from sqlalchemy import cast, func, select
 from api import db
 from api.models.user import User
+from api.models.item import Item
 from api.models.cart_item import CartItem
 
 class Cart(db.Model):
     __tablename__ = 'carts'
+    __table_args__ = (db.Index('ix_carts_updated_at_id', 'updated_at', 'id'),)
 
     id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
     created_at = db.Column(db.TIMESTAMP, nullable=False, default=db.func.current_timestamp())
@@ -13,6 +15,16 @@ class Cart(db.Model):
     user = db.relationship('User', backref=db.backref('cart', uselist=False))
     items = db.relationship('CartItem', backref='cart', lazy=True)
 
+    # sum of the line subtotals computed by the database, undefer it when loading carts to serialize.
+    # Cast so an empty cart is 0.00 like the lines, PostgreSQL gives the plain 0 of coalesce otherwise
+    subtotal = db.column_property(
+        select(cast(func.coalesce(func.sum(Item.price * CartItem.quantity), 0), db.Numeric(12, 2)))
+        .where(CartItem.cart_id == id, Item.id == CartItem.item_id)
+        .correlate_except(CartItem, Item)
+        .scalar_subquery(),
+        deferred=True
+    )
+
     def __init__(self, id: int):
         self.id = id
 
@@ -24,8 +36,9 @@ class Cart(db.Model):
         target.updated_at = func.current_timestamp()
     
     def serialize(self):
-        # return serialized cart with id and items
+        # return serialized cart with id, items and subtotal
         return {
             'id': self.id,
-            'items': [item.serialize() for item in self.items]
+            'items': [item.serialize() for item in self.items],
+            'subtotal': self.subtotal
         }
\ No newline at end of file
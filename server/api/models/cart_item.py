@@ -1,8 +1,10 @@
-from sqlalchemy import func
+from sqlalchemy import func, select
 from api import db
+from api.models.item import Item
 
 class CartItem(db.Model):
     __tablename__ = 'cart_items'
+    __table_args__ = (db.UniqueConstraint('cart_id', 'item_id', name='uq_cart_items_cart_id_item_id'),)
 
     id = db.Column(db.Integer, primary_key=True)
     item_id = db.Column(db.Integer, db.ForeignKey('items.id'), nullable=False)
@@ -13,6 +15,12 @@ class CartItem(db.Model):
 
     item = db.relationship('Item', backref='cart_items', lazy=True)
 
+    # price * quantity computed by the database, undefer it when loading lines to serialize
+    subtotal = db.column_property(
+        select(Item.price * quantity).where(Item.id == item_id).correlate_except(Item).scalar_subquery(),
+        deferred=True
+    )
+
     def __init__(self, cart_id: int, item_id: int, quantity: int):
         self.cart_id = cart_id
         self.item_id = item_id
@@ -25,10 +33,35 @@ class CartItem(db.Model):
     def update_timestamp(mapper, connection, target):
         target.updated_at = func.current_timestamp()
 
-    def serialize(self):
+    @classmethod
+    def serialized_columns(cls) -> list:
+        """
+        The columns serialize_row needs, to select lines as rows without loading CartItem and Item objects.
+        The query has to join items.
+        """
+        return [cls.id, cls.item_id, cls.cart_id, cls.quantity, cls.subtotal, Item.name, Item.price, Item.image_url, Item.stock]
+
+    @staticmethod
+    def serialize_row(row, item) -> dict:
+        """
+        Serializes a line.
+
+        :param row: A cart item, or a row of serialized_columns.
+        :param item: The item of the line, or the same row.
+        """
         return {
-            'id': self.id,
-            'item_id': self.item_id,
-            'cart_id': self.cart_id,
-            'quantity': self.quantity
+            'id': row.id,
+            'item_id': row.item_id,
+            'cart_id': row.cart_id,
+            'quantity': row.quantity,
+            'item': {
+                'name': item.name,
+                'price': item.price,
+                'image_url': item.image_url,
+                'stock': item.stock
+            },
+            'subtotal': row.subtotal
         }
+
+    def serialize(self):
+        return CartItem.serialize_row(self, self.item)
@@ -0,0 +1,14 @@
+from api import db
+
+class IdBlock(db.Model):
+    __tablename__ = 'id_blocks'
+
+    name = db.Column(db.String(255), primary_key=True)
+    next_hi = db.Column(db.BigInteger, nullable=False)
+
+    def __init__(self, name: str, next_hi: int):
+        self.name = name
+        self.next_hi = next_hi
+
+    def __repr__(self):
+        return f"IdBlock(name={self.name}, next_hi={self.next_hi})"
@@ -1,11 +1,19 @@
-from sqlalchemy import func
+from sqlalchemy import func, literal
+# registers the typed full text search functions used by search_document
+import sqlalchemy.dialects.postgresql
 from api import db
+from api.services.image_service import variant_urls
 
 class Item(db.Model):
     __tablename__ = 'items'
+    __table_args__ = (
+        db.Index('ix_items_updated_at_id', 'updated_at', 'id'),
+        # images are shared by items with the same picture, an image is deleted once this finds no item using it
+        db.Index('ix_items_image_url', 'image_url')
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(255), nullable=False)
+    name = db.Column(db.String(255), unique=True, nullable=False)
     description = db.Column(db.Text)
     price = db.Column(db.Numeric(10, 2), nullable=False)
     image_url = db.Column(db.String(1024))
@@ -30,16 +38,55 @@ class Item(db.Model):
     def update_timestamp(mapper, connection, target):
         target.updated_at = func.current_timestamp()
 
-    def serialize(self):
+    @classmethod
+    def serialized_columns(cls) -> list:
+        """
+        The columns serialize_row needs, to select items as rows without loading Item objects.
+        Includes updated_at so the rows can be paginated.
+        """
+        return [cls.id, cls.name, cls.description, cls.price, cls.image_url, cls.category, cls.size, cls.color, cls.stock, cls.updated_at]
+
+    @staticmethod
+    def serialize_row(row) -> dict:
+        """
+        Serializes an item or a row of serialized_columns.
+        """
         return {
-            'id': self.id, 
-            'name': self.name,
-            'description': self.description,
-            'price': self.price,
-            'image_url': self.image_url,
-            'category': self.category,
-            'size': self.size,
-            'color': self.color,
-            'stock': self.stock
+            'id': row.id, 
+            'name': row.name,
+            'description': row.description,
+            'price': row.price,
+            'image_url': row.image_url,
+            'category': row.category,
+            'size': row.size,
+            'color': row.color,
+            'stock': row.stock,
+            'images': variant_urls(row.id, row.image_url)
         }
-    
\ No newline at end of file
+
+    def serialize(self):
+        return Item.serialize_row(self)
+
+
+# column -> tsvector weight of the columns searched by /item/search, A ranks highest
+SEARCH_WEIGHTS = {'name': 'A', 'category': 'B', 'color': 'B', 'description': 'C'}
+
+def search_document():
+    """
+    Builds the weighted tsvector of an item that the search index is built on.
+    Queries have to use this exact expression for Postgres to use the index.
+
+    :return: A SQL expression of the item's tsvector.
+    """
+    document = None
+    for column, weight in SEARCH_WEIGHTS.items():
+        # literals are rendered inline so the expression compiles to the same SQL as the index
+        vector = func.setweight(
+            func.to_tsvector(literal('simple', literal_execute=True), func.coalesce(getattr(Item, column), literal('', literal_execute=True))),
+            literal(weight, literal_execute=True)
+        )
+        document = vector if document is None else document.op('||')(vector)
+    return document
+
+# an expression index is kept current by Postgres on every write, other databases use search_service's in-process index
+db.Index('ix_items_search', search_document(), postgresql_using='gin').ddl_if(dialect='postgresql')
@@ -0,0 +1,34 @@
+from sqlalchemy import func
+from api import db
+
+class Order(db.Model):
+    __tablename__ = 'orders'
+    __table_args__ = (db.Index('ix_orders_updated_at_id', 'updated_at', 'id'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    total = db.Column(db.Numeric(12, 2), nullable=False)
+    created_at = db.Column(db.TIMESTAMP, nullable=False, default=db.func.current_timestamp())
+    updated_at = db.Column(db.TIMESTAMP, nullable=False, default=db.func.current_timestamp())
+
+    user = db.relationship('User', backref=db.backref('orders', lazy=True))
+    items = db.relationship('OrderItem', backref='order', lazy=True)
+
+    def __init__(self, user_id: int, total):
+        self.user_id = user_id
+        self.total = total
+
+    def __repr__(self):
+        return f"Order(id={self.id}, user_id={self.user_id}, total={self.total})"
+
+    @staticmethod
+    def update_timestamp(mapper, connection, target):
+        target.updated_at = func.current_timestamp()
+
+    def serialize(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'items': [item.serialize() for item in self.items],
+            'total': self.total
+        }
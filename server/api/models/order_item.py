@@ -0,0 +1,29 @@
+from api import db
+
+class OrderItem(db.Model):
+    __tablename__ = 'order_items'
+
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False, index=True)
+    item_id = db.Column(db.Integer, db.ForeignKey('items.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    # price of one item when the order was placed, later price changes do not touch orders
+    price = db.Column(db.Numeric(10, 2), nullable=False)
+
+    def __init__(self, order_id: int, item_id: int, quantity: int, price):
+        self.order_id = order_id
+        self.item_id = item_id
+        self.quantity = quantity
+        self.price = price
+
+    def __repr__(self):
+        return f"OrderItem(id={self.id}, order_id={self.order_id}, item_id={self.item_id}, quantity={self.quantity})"
+
+    def serialize(self):
+        return {
+            'id': self.id,
+            'item_id': self.item_id,
+            'quantity': self.quantity,
+            'price': self.price,
+            'subtotal': self.price * self.quantity
+        }
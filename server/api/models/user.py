@@ -1,8 +1,9 @@
-from werkzeug.security import generate_password_hash, check_password_hash
 from api import db
+from api.services import password_service
 
 class User(db.Model):
     __tablename__ = 'users'
+    __table_args__ = (db.Index('ix_users_updated_at_id', 'updated_at', 'id'),)
 
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(20), unique=True, nullable=False)
@@ -28,7 +29,7 @@ class User(db.Model):
 
         :param password: The password to set.
         """
-        self.password = generate_password_hash(password, method='scrypt', salt_length=16)
+        self.password = password_service.hash_password(password)
 
     def check_password(self, password: str) -> bool:
         """
@@ -38,10 +39,25 @@ class User(db.Model):
 
         :return: True if the password is correct, False otherwise.
         """
-        return check_password_hash(self.password, password)
+        return password_service.verify_password(self.password, password)
     
-    def serialize(self) -> dict:
+    @classmethod
+    def serialized_columns(cls) -> list:
+        """
+        The columns serialize_row needs, to select users as rows without loading User objects.
+        Includes updated_at so the rows can be paginated.
+        """
+        return [cls.id, cls.username, cls.updated_at]
+
+    @staticmethod
+    def serialize_row(row) -> dict:
+        """
+        Serializes a user or a row of serialized_columns.
+        """
         return {
-            'id': self.id,
-            'username': self.username
+            'id': row.id,
+            'username': row.username
         }
+
+    def serialize(self) -> dict:
+        return User.serialize_row(self)
@@ -0,0 +1,197 @@
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import Flask, Response, g, has_request_context, request
+from sqlalchemy import event
+from api import db
+
+slow_query_logger = logging.getLogger('api.sql.slow')
+
+# profiles recording in this context, a request's and any query budgets around it. Every thread and asyncio task
+# runs in its own context, so requests awaiting the database on one event loop never count each other's statements.
+# Holds a tuple that is replaced, never changed, a task starts with its parent's profiles without sharing later ones
+_profiles = ContextVar('sql_profiles', default=())
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Raised when a block runs more statements than its query budget allows.
+    """
+
+class QueryProfile:
+    """
+    The statements run while the profile was active, with how long each took.
+    Statements are compared by their SQL text, which has placeholders for parameters,
+    so the same query run for different rows counts as a repeat.
+    """
+
+    def __init__(self):
+        # (statement, seconds)
+        self.statements = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    @property
+    def seconds(self) -> float:
+        return sum(seconds for _, seconds in self.statements)
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        """
+        Finds statements run at least threshold times, the usual sign of lazy loading in a loop.
+
+        :param threshold: The number of runs that counts as N+1.
+
+        :return: List of (statement, runs), most runs first.
+        """
+        counts = Counter(statement for statement, _ in self.statements)
+        return [(statement, runs) for statement, runs in counts.most_common() if runs >= threshold]
+
+def _add(profile: QueryProfile):
+    _profiles.set(_profiles.get() + (profile,))
+
+def _remove(profile: QueryProfile):
+    _profiles.set(tuple(active for active in _profiles.get() if active is not profile))
+
+@contextmanager
+def profile_queries():
+    """
+    Records every statement run in this context inside a with statement, including the statements
+    of requests and tasks it starts.
+
+    :return: The profile, filled in as statements run.
+    """
+    profile = QueryProfile()
+    _add(profile)
+    try:
+        yield profile
+    finally:
+        _remove(profile)
+
+@contextmanager
+def query_budget(max_queries: int):
+    """
+    Fails if the body of a with statement runs more than max_queries statements, for tests to pin down the queries of a route.
+
+        with query_budget(2):
+            client.get('/api/cart/1/')
+
+    :param max_queries: The number of statements allowed.
+
+    :return: The profile of the block.
+    :raises QueryBudgetExceeded: If more statements ran.
+    """
+    with profile_queries() as profile:
+        yield profile
+    if profile.count > max_queries:
+        statements = '\n'.join(f'{runs}x {statement}' for statement, runs in Counter(s for s, _ in profile.statements).most_common())
+        raise QueryBudgetExceeded(f'{profile.count} queries ran, the budget is {max_queries}:\n{statements}')
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+def _after_cursor_execute(app: Flask, conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info['query_started'].pop()
+    for profile in _profiles.get():
+        profile.statements.append((statement, seconds))
+
+    threshold = app.config['SLOW_QUERY_MS']
+    if threshold and seconds * 1000 >= threshold:
+        record = {'duration_ms': round(seconds * 1000, 3), 'statement': statement, 'executemany': executemany}
+        if has_request_context():
+            record.update(method=request.method, path=request.path, endpoint=request.endpoint)
+        # parameters are left out, they can hold password hashes and other user data
+        slow_query_logger.warning(json.dumps(record))
+
+def start_profile(g, request):
+    """
+    Starts the profile of a request if SQL_PROFILING asks for it.
+
+    :param g: The g of the request, of Flask or Quart.
+    :param request: The request.
+    """
+    mode = g.get('sql_profiling_mode')
+    if mode == 'always' or (mode == 'header' and request.headers.get('X-Profile-SQL')):
+        g.sql_profile = QueryProfile()
+        _add(g.sql_profile)
+
+def stop_profile(g) -> QueryProfile:
+    """
+    Stops the profile of a request.
+
+    :param g: The g of the request, of Flask or Quart.
+
+    :return: The profile, None if the request is not profiled or its profile was already stopped.
+    """
+    profile = g.pop('sql_profile', None)
+    if profile is not None:
+        _remove(profile)
+    return profile
+
+def add_profile_headers(app: Flask, response, profile: QueryProfile, method: str, path: str):
+    """
+    Adds the query count and database time of a profile to the response of its request and logs its repeated statements.
+
+    :param app: The app whose settings apply.
+    :param response: The response, of Flask or Quart.
+    :param profile: The profile of the request.
+    :param method: The method of the request.
+    :param path: The path of the request.
+    """
+    db_ms = profile.seconds * 1000
+    response.headers['X-Query-Count'] = str(profile.count)
+    response.headers['X-DB-Time'] = f'{db_ms:.3f}'
+    response.headers.add('Server-Timing', f'db;dur={db_ms:.3f}')
+
+    repeated = profile.repeated(app.config['N_PLUS_ONE_THRESHOLD'])
+    if repeated:
+        response.headers['X-Query-Repeated'] = str(sum(runs for _, runs in repeated))
+        for statement, runs in repeated:
+            app.logger.warning('Possible N+1 on %s %s: %d runs of %s', method, path, runs, statement)
+
+def watch_engine(app: Flask, engine):
+    """
+    Times every statement of an engine for the slow query log and the profiles of requests.
+
+    :param app: The app whose settings apply.
+    :param engine: The engine, the sync_engine of an async one.
+    """
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', lambda *args: _after_cursor_execute(app, *args))
+
+def init_profiler(app: Flask):
+    """
+    Times every statement of the app's engine for the slow query log and, if SQL_PROFILING is on,
+    adds the query count and database time of each request to its response.
+
+    SQL_PROFILING is off, header to profile requests sent with an X-Profile-SQL header, or always.
+    Keep it off in production, the header would let anyone turn it on.
+
+    :param app: The app to profile.
+    """
+    with app.app_context():
+        watch_engine(app, db.engine)
+
+    mode = app.config['SQL_PROFILING']
+    if mode == 'off':
+        return
+
+    @app.before_request
+    def start_request_profile():
+        g.sql_profiling_mode = mode
+        start_profile(g, request)
+
+    @app.after_request
+    def add_request_profile(response: Response) -> Response:
+        profile = stop_profile(g)
+        if profile is not None:
+            add_profile_headers(app, response, profile, request.method, request.path)
+        return response
+
+    @app.teardown_request
+    def discard_profile(exception):
+        # after_request does not run when a request fails before a response is made
+        stop_profile(g)
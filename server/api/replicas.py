@@ -0,0 +1,195 @@
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from flask import Flask, Response, current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+
+# the bind keys of the replicas are this followed by their position in SQLALCHEMY_REPLICA_URIS
+BIND_PREFIX = 'replica'
+# set after a write and expires after REPLICA_PIN_SECONDS, the client's reads go to the primary while it sends it
+PIN_COOKIE = 'primary_pin'
+
+_checker_lock = threading.Lock()
+
+class Replica:
+    """
+    A read replica of the database and whether it is used. It is skipped from the first failed
+    health check or statement until it passes a health check again.
+    """
+
+    def __init__(self, name: str, engine):
+        self.name = name
+        self.engine = engine
+        self.healthy = True
+
+    def check(self) -> bool:
+        """
+        Checks that the replica answers a query.
+
+        :return: True if it does.
+        """
+        try:
+            with self.engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+        except SQLAlchemyError:
+            return False
+        return True
+
+class RoutingSession(Session):
+    """
+    The session of db. Statements run inside replica() go to one of the healthy replicas, chosen once per session
+    so every read of a request sees the same replica. Everything else goes to the primary, and so does every read
+    inside primary(), after the session wrote, or while the client sends the pin cookie of a recent write.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._reads_replica(clause):
+            if 'replica' not in self.info:
+                self.info['replica'] = _pick()
+            replica = self.info['replica']
+            if replica is not None and replica.healthy:
+                return replica.engine
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+    def _reads_replica(self, clause) -> bool:
+        if self._flushing or (clause is not None and clause.is_dml):
+            self.info['wrote'] = True
+            if has_request_context():
+                g.pin_primary = True
+            return False
+        if self.info.get('wrote') or not g.get('replica_reads') or g.get('primary_reads'):
+            return False
+        return not (has_request_context() and PIN_COOKIE in request.cookies)
+
+@contextmanager
+def replica():
+    """
+    Lets a replica answer the statements of the with block, or of the decorated function.
+    Only wrap reads whose results are sent as they are, not reads that are cached or written back.
+    """
+    previous = g.get('replica_reads', False)
+    g.replica_reads = True
+    try:
+        yield
+    finally:
+        g.replica_reads = previous
+
+@contextmanager
+def primary():
+    """
+    Sends the statements of the with block, or of the decorated function, to the primary even inside replica().
+    For reads that fill a cache, which would keep serving what a lagging replica returned.
+    """
+    previous = g.get('primary_reads', False)
+    g.primary_reads = True
+    try:
+        yield
+    finally:
+        g.primary_reads = previous
+
+def _state() -> dict:
+    return current_app.extensions.get('replicas')
+
+def _pick() -> Replica:
+    """
+    Picks the next healthy replica in turn.
+
+    :return: The replica, None if there are no replicas or none of them is healthy.
+    """
+    state = _state()
+    if state is None:
+        return None
+    _start_checker(state)
+    healthy = [replica for replica in state['replicas'] if replica.healthy]
+    if not healthy:
+        return None
+    return healthy[next(state['turn']) % len(healthy)]
+
+def _set_health(app: Flask, replica: Replica, healthy: bool):
+    if healthy == replica.healthy:
+        return
+    replica.healthy = healthy
+    if healthy:
+        app.logger.info('Replica %s passed its health check, reading from it again', replica.name)
+    else:
+        app.logger.warning('Replica %s is unavailable, reading from the primary until it passes a health check', replica.name)
+
+def _run_checker(app: Flask, replicas: list[Replica]):
+    interval = app.config['REPLICA_CHECK_INTERVAL']
+    while True:
+        time.sleep(interval)
+        for replica in replicas:
+            _set_health(app, replica, replica.check())
+
+def _start_checker(state: dict):
+    """
+    Checks the replicas and starts the health checks of this process on the first replica read,
+    so a replica that is down at startup never fails a request. Forked workers start their own.
+    """
+    if state['checker'] == os.getpid():
+        return
+
+    with _checker_lock:
+        if state['checker'] == os.getpid():
+            return
+        app = current_app._get_current_object()
+        for replica in state['replicas']:
+            _set_health(app, replica, replica.check())
+        threading.Thread(target=_run_checker, args=(app, state['replicas']), name='replica-checker', daemon=True).start()
+        state['checker'] = os.getpid()
+
+def _pin_primary(response: Response) -> Response:
+    if g.get('pin_primary'):
+        response.set_cookie(
+            PIN_COOKIE,
+            '1',
+            max_age=current_app.config['REPLICA_PIN_SECONDS'],
+            httponly=True,
+            secure=current_app.config['SESSION_COOKIE_SECURE'],
+            samesite='Lax'
+        )
+    return response
+
+def configure_replicas(app: Flask):
+    """
+    Adds a bind for every URL of SQLALCHEMY_REPLICA_URIS. Has to run before db.init_app creates the engines.
+
+    :param app: The app to configure.
+    """
+    uris = app.config['SQLALCHEMY_REPLICA_URIS']
+    if uris:
+        binds = {f'{BIND_PREFIX}{i}': uri for i, uri in enumerate(uris)}
+        app.config['SQLALCHEMY_BINDS'] = {**(app.config.get('SQLALCHEMY_BINDS') or {}), **binds}
+
+def init_replicas(app: Flask):
+    """
+    Routes the reads of the services to the replicas and pins clients that wrote to the primary.
+    A replica is taken out of use when one of its statements fails with an OperationalError,
+    like a lost connection, and health checked every REPLICA_CHECK_INTERVAL seconds.
+
+    :param app: The app, after db.init_app.
+    """
+    uris = app.config['SQLALCHEMY_REPLICA_URIS']
+    if not uris:
+        return
+
+    from api.profiler import watch_engine
+    with app.app_context():
+        engines = app.extensions['sqlalchemy'].engines
+        replicas = [Replica(f'{BIND_PREFIX}{i}', engines[f'{BIND_PREFIX}{i}']) for i in range(len(uris))]
+
+    for replica in replicas:
+        watch_engine(app, replica.engine)
+
+        def failed(context, replica=replica):
+            if context.is_disconnect or isinstance(context.sqlalchemy_exception, OperationalError):
+                _set_health(app, replica, False)
+
+        event.listen(replica.engine, 'handle_error', failed)
+
+    app.extensions['replicas'] = {'replicas': replicas, 'turn': itertools.count(), 'checker': None}
+    app.after_request(_pin_primary)
@@ -1,17 +1,43 @@
 from flask import Blueprint, Response, jsonify, make_response, request 
-from api.services import cart_service, item_service
+from api.services import cart_service, checkout_service
+from api.routes.conditional import not_modified, with_validators
+from api.routes.ndjson import ndjson_response
 
 bp = Blueprint('cart', __name__, url_prefix='/cart')
 
 @bp.route('/', methods=['GET'])
 def get_carts() -> Response:
     """
-    Response to a GET request to /cart. Gets all carts from the database.
+    Response to a GET request to /cart. Gets a page of carts from the database.
 
-    :return: Response with HTTP status of OK and a list of carts.
+    :param limit: Maximum number of carts to return.
+    :param cursor: Cursor of the page to get, from the next field of the previous page.
+    :param sort: Column to order the carts by, id or updated_at.
+
+    :return: Response with HTTP status of OK, a list of carts and the cursor of the next page.
+    Response with HTTP status of NOT MODIFIED if the client's copy of the page is current.
+    Response with HTTP status of BAD REQUEST if the cursor or sort is invalid.
+    """
+    limit, cursor, sort = request.args.get('limit', type=int), request.args.get('cursor'), request.args.get('sort', 'id')
+    try:
+        # removed lines do not move the latest update time, so carts are only validated by ETag
+        _, etag = cart_service.get_carts_version(limit, cursor, sort)
+        response = not_modified(None, etag)
+        if response:
+            return response
+        carts, next_cursor = cart_service.get_carts_serialized(limit, cursor, sort)
+    except ValueError as e:
+        return make_response(jsonify({'error': str(e)}), 400)
+    return with_validators(make_response(jsonify({'data': carts, 'next': next_cursor}), 200), None, etag)
+
+@bp.route('/export/', methods=['GET'])
+def export_carts() -> Response:
     """
-    carts = cart_service.get_carts()
-    return make_response(jsonify([cart.serialize() for cart in carts]), 200)
+    Response to a GET request to /cart/export. Streams every cart as newline delimited JSON.
+
+    :return: Streaming response with HTTP status of OK and one cart with its items per line.
+    """
+    return ndjson_response(cart_service.export_carts())
 
 @bp.route('/<int:id>/', methods=['GET'])
 def get_cart(id: int) -> Response:
@@ -21,14 +47,24 @@ def get_cart(id: int) -> Response:
     :param id: ID of the cart to get.
 
     :return: Response with HTTP status of OK and the cart with the given ID.
+    Response with HTTP status of NOT MODIFIED if the client's copy of the cart is current.
     Response with HTTP status of NOT FOUND if no cart exists with the given ID.
     """
+    version = cart_service.get_cart_version(id)
+    if version is None:
+        return make_response(jsonify({'error': f'Cart with id {id} not found'}), 404)
+
+    _, etag = version
+    response = not_modified(None, etag)
+    if response:
+        return response
+
     cart = cart_service.get_cart(id)
 
     if cart is None:
         return make_response(jsonify({'error': f'Cart with id {id} not found'}), 404)
 
-    return make_response(jsonify(cart.serialize()), 200)
+    return with_validators(make_response(jsonify(cart.serialize()), 200), None, etag)
 
 @bp.route('/<int:id>/', methods=['POST'])
 def create_cart(id: int) -> Response:
@@ -79,25 +115,19 @@ def add_to_cart(id: int) -> Response:
     :return: Response with HTTP status of OK and the updated cart.
     Response with HTTP status of NOT FOUND if no cart exists with the given ID.
     Response with HTTP status of BAD REQUEST if the quantity is less than 1.
-    Response with HTTP status of BAD REQUEST if the item does not exist.
+    Response with HTTP status of NOT FOUND if the item does not exist.
     """
     data = request.get_json()
     item_id = data.get('item_id')
     quantity = data.get('quantity')
     if quantity < 1:
         return make_response(jsonify({'error': 'Quantity must be greater than 0'}), 400)
-    
-    # check if item exists
-    item = item_service.get_item(item_id)
-    if item is None:
-        return make_response(jsonify({'error': f'Item with id {item_id} not found'}), 404)
-    
-    cart = cart_service.get_cart(id)
-    if cart is None:
-        return make_response(jsonify({'error': f'Cart with id {id} not found'}), 404)
 
-    cart_item = cart_service.add_to_cart(id, item_id, quantity)
-    return make_response(jsonify(cart_item.serialize()), 200)
+    cart, error = cart_service.add_to_cart(id, item_id, quantity)
+    if error:
+        return make_response(jsonify({'error': error}), 404)
+
+    return make_response(jsonify(cart.serialize()), 200)
 
 @bp.route('/item/<int:id>/', methods=['DELETE'])
 def remove_from_cart(id: int) -> Response:
@@ -109,19 +139,56 @@ def remove_from_cart(id: int) -> Response:
 
     :return: Response with HTTP status of OK and the updated cart.
     Response with HTTP status of NOT FOUND if no cart exists with the given ID.
-    Response with HTTP status of BAD REQUEST if the item does not exist.
+    Response with HTTP status of NOT FOUND if the item does not exist.
     """
     data = request.get_json()
     item_id = data.get('item_id')
 
-    # check if item exists
-    item = item_service.get_item(item_id)
-    if item is None:
-        return make_response(jsonify({'error': f'Item with id {item_id} not found'}), 404)
-    
-    cart = cart_service.get_cart(id)
-    if cart is None:
-        return make_response(jsonify({'error': f'Cart with id {id} not found'}), 404)
+    cart, error = cart_service.remove_from_cart(id, item_id)
+    if error:
+        return make_response(jsonify({'error': error}), 404)
 
-    cart = cart_service.remove_from_cart(id, item_id)
     return make_response(jsonify(cart.serialize()), 200)
+
+@bp.route('/<int:id>/items/', methods=['POST'])
+def update_cart_items(id: int) -> Response:
+    """
+    Response to a POST request to /cart/<id>/items. Applies a batch of line changes to a cart in one transaction.
+
+    :param id: ID of the cart to change.
+    :param add: List of {item_id, quantity} to add to the cart.
+    :param set: List of {item_id, quantity} to set the quantity of. A quantity of 0 removes the line.
+    :param remove: List of {item_id} to remove from the cart.
+
+    :return: Response with HTTP status of OK, the updated cart and a list of the lines that could not be applied.
+    Response with HTTP status of NOT FOUND if no cart exists with the given ID.
+    """
+    data = request.get_json()
+
+    cart, errors, error = cart_service.update_cart_items(id, data.get('add'), data.get('set'), data.get('remove'))
+    if error:
+        return make_response(jsonify({'error': error}), 404)
+
+    return make_response(jsonify({'cart': cart.serialize(), 'errors': errors}), 200)
+
+@bp.route('/<int:id>/checkout/', methods=['POST'])
+def checkout(id: int) -> Response:
+    """
+    Response to a POST request to /cart/<id>/checkout. Turns a cart into an order, taking the stock of every line.
+
+    :param id: ID of the cart to check out.
+
+    :return: Response with HTTP status of CREATED and the order. The cart is emptied.
+    Response with HTTP status of BAD REQUEST if the cart is empty.
+    Response with HTTP status of NOT FOUND if no cart exists with the given ID.
+    Response with HTTP status of CONFLICT and the lines without enough stock if any line cannot be filled. Nothing is reserved.
+    """
+    order, error, shortages = checkout_service.checkout(id)
+    if error == checkout_service.OUT_OF_STOCK:
+        return make_response(jsonify({'error': error, 'items': shortages}), 409)
+    if error == checkout_service.EMPTY_CART:
+        return make_response(jsonify({'error': error}), 400)
+    if error:
+        return make_response(jsonify({'error': error}), 404)
+
+    return make_response(jsonify(order.serialize()), 201)
@@ -0,0 +1,66 @@
+from datetime import datetime, timezone
+from flask import Response, request
+
+def _http_time(timestamp: datetime) -> datetime:
+    # timestamps are stored without a timezone in UTC, HTTP dates have second precision
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.replace(microsecond=0)
+
+def with_validators(response: Response, last_modified: datetime, etag: str) -> Response:
+    """
+    Adds an ETag and a Last-Modified header to a response.
+
+    :param response: The response to add the headers to.
+    :param last_modified: When the resource was last modified, None to leave the header out.
+    :param etag: The strong entity tag of the resource.
+
+    :return: The response.
+    """
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = _http_time(last_modified)
+    return response
+
+def is_current(request, last_modified: datetime, etag: str) -> bool:
+    """
+    Checks the conditional headers of a request against the validators of a resource.
+    If-None-Match takes precedence over If-Modified-Since.
+
+    :param request: The request, of Flask or Quart.
+    :param last_modified: When the resource was last modified, None if it cannot be compared by date.
+    :param etag: The strong entity tag of the resource.
+
+    :return: True if the client's copy is current.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return _http_time(last_modified) <= request.if_modified_since
+    return False
+
+def not_modified_response(request, response_class: type, last_modified: datetime, etag: str) -> Response:
+    """
+    Checks the conditional headers of a request against the validators of a resource.
+
+    :param request: The request, of Flask or Quart.
+    :param response_class: The response class of the request's framework.
+    :param last_modified: When the resource was last modified, None if it cannot be compared by date.
+    :param etag: The strong entity tag of the resource.
+
+    :return: Response with HTTP status of NOT MODIFIED if the client's copy is current, None otherwise.
+    """
+    if not is_current(request, last_modified, etag):
+        return None
+    return with_validators(response_class(status=304), last_modified, etag)
+
+def not_modified(last_modified: datetime, etag: str) -> Response:
+    """
+    Checks the conditional headers of the request against the validators of a resource.
+
+    :param last_modified: When the resource was last modified, None if it cannot be compared by date.
+    :param etag: The strong entity tag of the resource.
+
+    :return: Response with HTTP status of NOT MODIFIED if the client's copy is current, None otherwise.
+    """
+    return not_modified_response(request, Response, last_modified, etag)
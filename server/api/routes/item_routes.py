@@ -1,19 +1,166 @@
 import json
-from flask import Blueprint, Response, jsonify, make_response, request 
-from api.services import item_service
+import os
+import tempfile
+from decimal import Decimal, InvalidOperation
+from flask import Blueprint, Response, current_app, jsonify, make_response, request, send_file
+from api.services import catalog_service, image_service, import_service, item_service, listing_snapshot
+from api.services.catalog_service import CatalogUnavailable
+from api.services.image_service import ImageTooLarge, InvalidImage
+from api.services.item_service import ItemNameTaken
+from api.services.listing_snapshot import Listing
+from api.routes.conditional import not_modified, with_validators
+from api.routes.ndjson import ndjson_response
 from api.models.item import Item
 
 bp = Blueprint('item', __name__, url_prefix='/item')
 
+def _listing_response(listing: Listing) -> Response:
+    """
+    Sends the listing in the best content coding the client accepts.
+
+    :param listing: The listing.
+
+    :return: Response with HTTP status of OK and the listing.
+    Response with HTTP status of NOT MODIFIED if the client's copy of the listing is current.
+    """
+    encoding = listing.negotiate(request.accept_encodings)
+    etag = listing.etag(encoding)
+    response = not_modified(None, etag)
+    if not response:
+        response = make_response(listing.bodies[encoding], 200)
+        response.mimetype = current_app.json.mimetype
+        if encoding != 'identity':
+            response.content_encoding = encoding
+    response.vary.add('Accept-Encoding')
+    return with_validators(response, None, etag)
+
 @bp.route('/', methods=['GET'])
 def get_items() -> Response:
     """
-    Response to a GET request to /item. Gets all items from the database.
+    Response to a GET request to /item. Gets a page of items from the database.
+    Without arguments the precompressed listing is sent, with an ETag of its version.
+
+    :param limit: The maximum number of items to return.
+    :param cursor: The cursor of the page to get, from the next field of the previous page.
+    :param sort: The column to order the items by, id or updated_at.
+
+    :return: Response with HTTP status of OK, a list of items and the cursor of the next page.
+    Response with HTTP status of NOT_MODIFIED if the client's copy of the page is current.
+    Response with HTTP status of BAD_REQUEST if the cursor or sort is invalid.
+    """
+    limit, cursor, sort = request.args.get('limit', type=int), request.args.get('cursor'), request.args.get('sort', 'id')
+    if limit is None and cursor is None and sort == 'id':
+        listing = listing_snapshot.get_listing()
+        if listing:
+            return _listing_response(listing)
+    try:
+        # deletions do not move the latest update time, so pages are only validated by ETag
+        _, etag = item_service.get_items_version(limit, cursor, sort)
+        response = not_modified(None, etag)
+        if response:
+            return response
+        items, next_cursor = item_service.get_items_serialized(limit, cursor, sort)
+    except ValueError as e:
+        return make_response(jsonify({'error': str(e)}), 400)
+    return with_validators(make_response(jsonify({'data': items, 'next': next_cursor}), 200), None, etag)
+
+@bp.route('/search/', methods=['GET'])
+def search_items() -> Response:
+    """
+    Response to a GET request to /item/search. Searches the name, description, category and color of items.
+
+    :param q: The search query, every word has to match the start of a word in the item.
+    :param limit: The maximum number of items to return.
+    :param cursor: The cursor of the page to get, from the next field of the previous page.
+
+    :return: Response with HTTP status of OK, a list of items, most relevant first, and the cursor of the next page.
+    Response with HTTP status of BAD_REQUEST if the cursor is invalid.
+    """
+    q, limit, cursor = request.args.get('q', ''), request.args.get('limit', type=int), request.args.get('cursor')
+    try:
+        items, next_cursor = item_service.search_items_serialized(q, limit, cursor)
+    except ValueError as e:
+        return make_response(jsonify({'error': str(e)}), 400)
+    return make_response(jsonify({'data': items, 'next': next_cursor}), 200)
+
+@bp.route('/browse/', methods=['GET'])
+def browse_items() -> Response:
+    """
+    Response to a GET request to /item/browse. Filters and sorts the catalog and counts the items per facet value.
+
+    :param category: A category to keep, may be repeated to keep any of several.
+    :param size: A size to keep, may be repeated.
+    :param color: A color to keep, may be repeated.
+    :param min_price: The lowest price to keep.
+    :param max_price: The highest price to keep.
+    :param in_stock: true to only keep items with stock left.
+    :param sort: id, price, or -price for the most expensive first.
+    :param limit: The maximum number of items to return.
+    :param cursor: The cursor of the page to get, from the next field of the previous page.
+
+    :return: Response with HTTP status of OK, a list of items, the cursor of the next page, the number of matching items
+    and the item counts per category, size, color, in stock and the price range.
+    Response with HTTP status of BAD_REQUEST if a price, the sort or the cursor is invalid.
+    Response with HTTP status of SERVICE_UNAVAILABLE if the server cannot build the catalog.
+    """
+    filters = {facet: request.args.getlist(facet) for facet in catalog_service.FACETS}
+    in_stock = request.args.get('in_stock', 'false').lower() == 'true'
+    sort, limit, cursor = request.args.get('sort', 'id'), request.args.get('limit', type=int), request.args.get('cursor')
+    try:
+        min_price, max_price = (Decimal(request.args[key]) if request.args.get(key) else None for key in ('min_price', 'max_price'))
+    except InvalidOperation:
+        return make_response(jsonify({'error': 'Invalid price'}), 400)
+
+    try:
+        items, next_cursor, total, facets = catalog_service.browse_items(filters, min_price, max_price, in_stock, sort, limit, cursor)
+    except ValueError as e:
+        return make_response(jsonify({'error': str(e)}), 400)
+    except CatalogUnavailable as e:
+        return make_response(jsonify({'error': str(e)}), 503)
+    return make_response(jsonify({'data': [item.serialize() for item in items], 'next': next_cursor, 'total': total, 'facets': facets}), 200)
+
+@bp.route('/export/', methods=['GET'])
+def export_items() -> Response:
+    """
+    Response to a GET request to /item/export. Streams every item as newline delimited JSON.
 
-    :return: Response with HTTP status of OK and a list of items.
+    :return: Streaming response with HTTP status of OK and one item per line.
     """
-    items = item_service.get_items()
-    return make_response(jsonify([item.serialize() for item in items]), 200)
+    return ndjson_response(item_service.export_items())
+
+@bp.route('/import/', methods=['POST'])
+def import_items() -> Response:
+    """
+    Response to a POST request to /item/import. Imports a catalog file, streaming progress as newline delimited JSON.
+
+    :param file: A CSV or NDJSON file of items with the name, description, price, category, size, color, and stock columns.
+    Images are not imported, an image_url column is ignored and existing items keep their image.
+    :param format: csv or ndjson, guessed from the file extension if not given.
+    :param mode: upsert to update items with the same name, insert to skip them. Defaults to upsert.
+
+    :return: Streaming response with HTTP status of OK and an error event for every invalid row,
+    a progress event after every batch and a done event at the end.
+    Response with HTTP status of BAD_REQUEST if the file is missing or the format or mode is not supported.
+    """
+    file = request.files.get('file')
+    if not file:
+        return make_response(jsonify({'error': 'File missing'}), 400)
+
+    format = request.args.get('format') or import_service.detect_format(file.filename)
+    mode = request.args.get('mode', 'upsert')
+    if format not in import_service.FORMATS or mode not in import_service.MODES:
+        return make_response(jsonify({'error': 'Unsupported format or mode'}), 400)
+
+    # The upload is closed once the request ends, before the response has streamed, spill it to a file we own
+    spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    file.save(spooled)
+    spooled.seek(0)
+
+    def events():
+        with spooled:
+            yield from import_service.import_items(spooled, format, mode)
+
+    return ndjson_response(events(), chunk_bytes=0)
 
 @bp.route('/', methods=['POST'])
 def create_item() -> Response:
@@ -24,13 +171,20 @@ def create_item() -> Response:
     :param image: An image file to upload.
 
     :return: Response with HTTP status of CREATED and the created item.
+    Response with HTTP status of BAD_REQUEST if the image is not a JPEG, PNG, GIF or WebP file.
     Response with HTTP status of CONFLICT if the item name already exists.
+    Response with HTTP status of REQUEST_ENTITY_TOO_LARGE if the image is larger than IMAGE_MAX_BYTES.
     """
     data = json.loads(json.loads(request.form.get('data')))
     image = request.files.get('image')
     
     item = Item(**data)
-    item = item_service.create_item(item, image)
+    try:
+        item = item_service.create_item(item, image)
+    except InvalidImage as e:
+        return make_response(jsonify({'error': str(e)}), 400)
+    except ImageTooLarge as e:
+        return make_response(jsonify({'error': str(e)}), 413)
     if not item:
         return make_response(jsonify({'error': 'Item already exists'}), 409)
     return make_response(jsonify(item.serialize()), 201)
@@ -43,12 +197,20 @@ def get_item(id: int) -> Response:
     :param id: The ID of the item to get.
 
     :return: Response with HTTP status of OK and the item.
+    Response with HTTP status of NOT_MODIFIED if the client's copy of the item is current.
     Response with HTTP status of NOT_FOUND if the item does not exist.
     """
-    item = item_service.get_item(id)
+    version = item_service.get_item_version(id)
+    if not version:
+        return make_response(jsonify({'error': 'Item not found'}), 404)
+    response = not_modified(*version)
+    if response:
+        return response
+
+    item = item_service.get_item_serialized(id)
     if not item:
         return make_response(jsonify({'error': 'Item not found'}), 404)
-    return make_response(jsonify(item.serialize()), 200)
+    return with_validators(make_response(jsonify(item), 200), *version)
 
 @bp.route('/<int:id>/', methods=['PUT'])
 def update_item(id: int) -> Response:
@@ -60,11 +222,15 @@ def update_item(id: int) -> Response:
 
     :return: Response with HTTP status of OK and the updated item.
     Response with HTTP status of NOT_FOUND if the item does not exist.
+    Response with HTTP status of CONFLICT if another item has the new name.
     """
     data = json.loads(json.loads(request.form.get('data')))
     
     item = Item(**data)
-    item = item_service.update_item(id, item)
+    try:
+        item = item_service.update_item(id, item)
+    except ItemNameTaken as e:
+        return make_response(jsonify({'error': str(e)}), 409)
     if not item:
         return make_response(jsonify({'error': 'Item not found'}), 404)
     return make_response(jsonify(item.serialize()), 200)
@@ -93,10 +259,62 @@ def update_item_image(id: int) -> Response:
     :param image: An image file to upload.
 
     :return: Response with HTTP status of OK and the updated item.
+    Response with HTTP status of BAD_REQUEST if the image is not a JPEG, PNG, GIF or WebP file.
     Response with HTTP status of NOT_FOUND if the item does not exist.
+    Response with HTTP status of REQUEST_ENTITY_TOO_LARGE if the image is larger than IMAGE_MAX_BYTES.
     """
     image = request.files.get('image')
-    item = item_service.update_item_image(id, image)
+    try:
+        item = item_service.update_item_image(id, image)
+    except InvalidImage as e:
+        return make_response(jsonify({'error': str(e)}), 400)
+    except ImageTooLarge as e:
+        return make_response(jsonify({'error': str(e)}), 413)
     if not item:
         return make_response(jsonify({'error': 'Item not found'}), 404)
     return make_response(jsonify(item.serialize()), 200)
+
+@bp.route('/image/<int:id>/', methods=['GET'])
+def get_item_image(id: int) -> Response:
+    """
+    Response to a GET request to /item/image/<item_id>. Sends an item's image file.
+    Files are sent with sendfile where the server supports it and honor Range and conditional requests.
+
+    :param id: The ID of the item.
+    :param variant: The derivative to send, thumbnail, grid or detail, the original if not given.
+    :param format: webp for the WebP version of the derivative.
+    :param v: The content hash from the image URL, versioned URLs are cached forever.
+
+    :return: Response with HTTP status of OK or PARTIAL_CONTENT and the image.
+    Response with HTTP status of NOT_MODIFIED if the client's copy of the image is current.
+    Response with HTTP status of BAD_REQUEST if the variant does not exist.
+    Response with HTTP status of NOT_FOUND if the item or its image does not exist.
+    """
+    item = item_service.get_item_serialized(id)
+    # only files inside IMAGE_STORE_DIR are sent, whatever path the row holds
+    image_path = image_service.stored_path(item['image_url']) if item else None
+    if not image_path or not os.path.exists(image_path):
+        return make_response(jsonify({'error': 'Image not found'}), 404)
+
+    try:
+        path, exact = image_service.resolve_image(
+            image_path, request.args.get('variant'), request.args.get('format') == 'webp')
+    except ValueError as e:
+        return make_response(jsonify({'error': str(e)}), 400)
+
+    # unversioned URLs and derivatives that are still rendering are revalidated on every use
+    version = image_service.content_hash(image_path)
+    immutable = exact and version is not None and request.args.get('v') == version
+
+    response = send_file(
+        path,
+        mimetype=image_service.mimetype(path),
+        conditional=True,
+        etag=f'{version}-{os.path.basename(path)}',
+        max_age=current_app.config['IMAGE_MAX_AGE'] if immutable else None
+    )
+    if immutable:
+        response.cache_control.immutable = True
+    # browsers must not guess a type that runs scripts from the bytes of a stored file
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
@@ -0,0 +1,37 @@
+from typing import Iterable
+from flask import Response, current_app, stream_with_context
+
+def ndjson_response(rows: Iterable[dict], chunk_bytes: int = None) -> Response:
+    """
+    Streams rows to the client as newline delimited JSON.
+    The first row is sent on its own as soon as it is encoded, later rows are sent in writes of about chunk_bytes.
+
+    :param rows: An iterable of serialized rows.
+    :param chunk_bytes: The size writes are collected up to, defaults to EXPORT_CHUNK_BYTES. 0 sends every row on its own.
+
+    :return: A streaming response with a mimetype of application/x-ndjson.
+    """
+    if chunk_bytes is None:
+        chunk_bytes = current_app.config['EXPORT_CHUNK_BYTES']
+
+    def generate():
+        rows_iter = iter(rows)
+        # the first row goes out alone so the client is not kept waiting for a full chunk
+        for row in rows_iter:
+            yield current_app.json.dumps(row) + '\n'
+            break
+
+        lines = []
+        size = 0
+        for row in rows_iter:
+            line = current_app.json.dumps(row) + '\n'
+            lines.append(line)
+            size += len(line)
+            if size >= chunk_bytes:
+                yield ''.join(lines)
+                lines = []
+                size = 0
+        if lines:
+            yield ''.join(lines)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
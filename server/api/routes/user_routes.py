@@ -1,5 +1,7 @@
 from flask import Blueprint, Response, jsonify, make_response, request, session
 from api.services import user_service
+from api.routes.conditional import not_modified, with_validators
+from api.routes.ndjson import ndjson_response
 from api.models.user import User
 
 bp = Blueprint('user', __name__, url_prefix='/user')
@@ -27,6 +29,7 @@ def login() -> Response:
         return make_response(jsonify({"error": "Username or Password incorrect"}), 401)
     
     session['user_id'] = user.id
+    session.pop('user', None)
     return make_response(jsonify(user.serialize()), 200)
 
 @bp.route('/session/', methods=['GET'])
@@ -34,25 +37,56 @@ def session_user() -> Response:
     """
     Response to a GET request to /user/session. Checks if a user is logged in.
 
-    :return: Response with HTTP status of UNAUTHORIZED if the user is not logged in.
+    :return: Response with HTTP status of UNAUTHORIZED if the user is not logged in or no longer exists.
     Response with HTTP status of OK and the user.
     """
     user_id = session.get('user_id')
     if not user_id:
         return make_response(jsonify({"error": "User not logged in"}), 401)
     
-    user = user_service.get_user(user_id)
-    return make_response(jsonify(user.serialize()), 200)
+    user, stored = user_service.get_session_user(user_id, session.get('user'))
+    if not user:
+        session.clear()
+        return make_response(jsonify({"error": "User not logged in"}), 401)
+
+    # only write the session back to Redis when the stored copy changed
+    if stored != session.get('user'):
+        session['user'] = stored
+    return make_response(jsonify(user), 200)
 
 @bp.route('/', methods=['GET'])
 def get_users() -> Response:
     """
-    Response to a GET request to /user. Gets all users from the database.
+    Response to a GET request to /user. Gets a page of users from the database.
+
+    :param limit: The maximum number of users to return.
+    :param cursor: The cursor of the page to get, from the next field of the previous page.
+    :param sort: The column to order the users by, id or updated_at.
+
+    :return: Response with HTTP status of BAD_REQUEST if the cursor or sort is invalid.
+    Response with HTTP status of NOT_MODIFIED if the client's copy of the page is current.
+    Response with HTTP status of OK, a list of users and the cursor of the next page.
+    """
+    limit, cursor, sort = request.args.get('limit', type=int), request.args.get('cursor'), request.args.get('sort', 'id')
+    try:
+        # deletions do not move the latest update time, so pages are only validated by ETag
+        _, etag = user_service.get_users_version(limit, cursor, sort)
+        response = not_modified(None, etag)
+        if response:
+            return response
+        users, next_cursor = user_service.get_users_serialized(limit, cursor, sort)
+    except ValueError as e:
+        return make_response(jsonify({"error": str(e)}), 400)
+    return with_validators(make_response(jsonify({"data": users, "next": next_cursor}), 200), None, etag)
+
+@bp.route('/export/', methods=['GET'])
+def export_users() -> Response:
+    """
+    Response to a GET request to /user/export. Streams every user as newline delimited JSON.
 
-    :return: Response with HTTP status of OK and a list of users.
+    :return: Streaming response with HTTP status of OK and one user per line.
     """
-    users = user_service.get_users()
-    return make_response(jsonify([user.serialize() for user in users]), 200)
+    return ndjson_response(user_service.export_users())
 
 @bp.route('/', methods=['POST'])
 def create_user() -> Response:
@@ -84,12 +118,20 @@ def get_user(id: int) -> Response:
     :param id: The id of the user to get.
 
     :return: Response with HTTP status of NOT_FOUND if the user does not exist.
+    Response with HTTP status of NOT_MODIFIED if the client's copy of the user is current.
     Response with HTTP status of OK and the user.
     """
+    version = user_service.get_user_version(id)
+    if not version:
+        return make_response(jsonify({"error": "User not found"}), 404)
+    response = not_modified(*version)
+    if response:
+        return response
+
     user = user_service.get_user(id)
     if not user:
         return make_response(jsonify({"error": "User not found"}), 404)
-    return make_response(jsonify(user.serialize()), 200)
+    return with_validators(make_response(jsonify(user.serialize()), 200), *version)
 
 @bp.route('/<int:id>/', methods=['PUT'])
 def update_user(id: int) -> Response:
@@ -0,0 +1,195 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+from flask import current_app
+from redis import RedisError
+from api.replicas import primary
+
+def _key(namespace: str, *parts) -> str:
+    return ':'.join(['cache', namespace] + [str(part) for part in parts])
+
+def _names(namespace) -> list[str]:
+    return [namespace] if isinstance(namespace, str) else list(namespace)
+
+# the helpers below have no I/O, they are shared with the cache of the async routes
+
+def generation_keys(namespace: str | tuple[str, ...]) -> list[str]:
+    """
+    Gets the keys of the generations of a namespace or a tuple of namespaces, to read with one MGET.
+
+    :param namespace: The namespace or tuple of namespaces.
+
+    :return: The keys, one per namespace.
+    """
+    return [_key(name, 'gen') for name in _names(namespace)]
+
+def parse_generation(value) -> int:
+    return int(value or 0)
+
+def entry_keys(namespace: str | tuple[str, ...], generations: list, key: str) -> tuple[str, str]:
+    """
+    Gets the key a value is cached under, scoped to the generations of its namespaces, and the key of the index
+    of the values of those generations. A value in a single namespace keeps the key it would have on its own.
+
+    :param namespace: The namespace or tuple of namespaces of the value.
+    :param generations: The generations of the namespaces, as read from generation_keys.
+    :param key: The key of the value within the namespace.
+
+    :return: A tuple containing the key of the value and the key of the index.
+    """
+    name = '+'.join(_names(namespace))
+    generation = '.'.join(str(parse_generation(value)) for value in generations)
+    return _key(name, generation, key), _key(name, generation, 'index')
+
+def encode(value) -> str:
+    return current_app.json.dumps(value, separators=(',', ':'))
+
+def storable(encoded: str) -> bool:
+    # larger values are returned without being stored
+    return len(encoded) <= current_app.config['CACHE_MAX_ENTRY_BYTES']
+
+def queue_store(pipe, cache_key: str, index_key: str, encoded: str, ttl: int):
+    """
+    Queues the commands that store a value and add it to the index of its generation on a pipeline.
+    The result of the last command is the number of values in the index, pass it to overflow.
+    """
+    pipe.set(cache_key, encoded, ex=ttl)
+    pipe.zadd(index_key, {cache_key: time.time()})
+    pipe.expire(index_key, ttl)
+    pipe.zcard(index_key)
+
+def overflow(size: int) -> int:
+    """
+    Gets how many of the oldest values of an index to evict, to keep CACHE_MAX_ENTRIES.
+    """
+    return size - current_app.config['CACHE_MAX_ENTRIES']
+
+class LocalCache:
+    """
+    A thread safe in-process LRU cache whose entries expire after a fixed number of seconds.
+    Entries are not shared between processes, keep the TTL short.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Gets a value that has not expired yet.
+
+        :param key: The key of the value.
+
+        :return: The value, None if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """
+        Stores a value, evicting the least recently used one if the cache is full.
+
+        :param key: The key of the value.
+        :param value: The value.
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        """
+        Removes a value.
+
+        :param key: The key of the value.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+def generation(namespace: str) -> int:
+    """
+    Gets the current generation of a namespace, which changes every time it is invalidated.
+
+    :param namespace: The namespace.
+
+    :return: The generation, None if Redis is unavailable.
+    """
+    try:
+        return parse_generation(current_app.config['CACHE_REDIS'].get(_key(namespace, 'gen')))
+    except RedisError:
+        return None
+
+def cached(namespace: str | tuple[str, ...], key: str, loader: Callable[[], object], ttl: int):
+    """
+    Reads a JSON serializable value through the Redis cache.
+    Keys are scoped to the namespace's generation, so invalidate() makes every value
+    cached before it unreachable, including values loaded by requests still in flight.
+    A value in a tuple of namespaces is scoped to all of their generations and invalidated by any of them.
+    Each generation keeps at most CACHE_MAX_ENTRIES keys, evicting the oldest first.
+    If Redis is unavailable the loader is called directly.
+
+    :param namespace: The namespace of the value, shared by everything a write invalidates, or a tuple of namespaces.
+    :param key: The key of the value within the namespace.
+    :param loader: Called to load the value on a cache miss.
+    :param ttl: The number of seconds to keep the value for.
+
+    :return: The cached or loaded value, as it would be decoded from JSON.
+    """
+    client = current_app.config['CACHE_REDIS']
+    try:
+        cache_key, index_key = entry_keys(namespace, client.mget(generation_keys(namespace)), key)
+        cached_value = client.get(cache_key)
+        if cached_value is not None:
+            return current_app.json.loads(cached_value)
+    except RedisError:
+        return loader()
+
+    # a replica may lag behind the write that invalidated the namespace, values are loaded from the primary
+    with primary():
+        encoded = encode(loader())
+    if storable(encoded):
+        _store(client, cache_key, index_key, encoded, ttl)
+    return current_app.json.loads(encoded)
+
+def _store(client, cache_key: str, index_key: str, encoded: str, ttl: int):
+    """
+    Stores a value and evicts the oldest keys of its generation beyond CACHE_MAX_ENTRIES.
+    """
+    try:
+        pipe = client.pipeline()
+        queue_store(pipe, cache_key, index_key, encoded, ttl)
+        evict = overflow(pipe.execute()[-1])
+        if evict > 0:
+            evicted = [key for key, _ in client.zpopmin(index_key, evict)]
+            if evicted:
+                client.delete(*evicted)
+    except RedisError:
+        pass
+
+def invalidate(*namespaces: str):
+    """
+    Invalidates every value cached in the namespaces. Call it after the write has been committed.
+
+    :param namespaces: The namespaces to invalidate.
+    """
+    if not namespaces:
+        return
+    try:
+        pipe = current_app.config['CACHE_REDIS'].pipeline(transaction=False)
+        for namespace in namespaces:
+            pipe.incr(_key(namespace, 'gen'))
+        pipe.execute()
+    except RedisError:
+        current_app.logger.exception('Failed to invalidate cache namespaces %s', ', '.join(namespaces))
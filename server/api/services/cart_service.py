@@ -1,17 +1,180 @@
-from sqlalchemy import func
+from datetime import datetime
+from typing import Iterator
+from flask import current_app
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload, undefer
 from api.models.cart import Cart
 from api.models.cart_item import CartItem
+from api.models.item import Item
 from api.models.user import User
+from api.replicas import replica
 from api import db
+from api.services import cart_store
+from api.services.pagination import paginate
+from api.services.id_allocator import reserve_ids
+from api.services.upsert import insert
+from api.services.versions import version_of
 
-def get_carts() -> list[Cart]:
+def _cart_query():
     """
-    Gets all carts from the database.
+    Builds a cart query that loads everything Cart.serialize needs up front.
+    Carts and their subtotals are read with one query, then the lines of every cart
+    with their item details and line subtotals are read with a second one.
 
-    :return: List of carts.
+    :return: Query for carts with their items eagerly loaded.
     """
-    return Cart.query.all()
+    return Cart.query.options(
+        undefer(Cart.subtotal),
+        selectinload(Cart.items).options(joinedload(CartItem.item), undefer(CartItem.subtotal))
+    )
 
+@replica()
+def get_carts(limit: int = None, cursor: str = None, sort: str = 'id') -> tuple[list[Cart], str]:
+    """
+    Gets a page of carts from the database.
+
+    :param limit: Maximum number of carts to return.
+    :param cursor: Cursor of the page to get. None for the first page.
+    :param sort: Column to order the carts by, id or updated_at.
+
+    :return: Tuple of the list of carts and the cursor of the next page. None if there are no more carts.
+    """
+    return paginate(_cart_query(), Cart, limit, cursor, sort)
+
+def lines_statement(cart_ids: list[int]):
+    """
+    Builds the select of the serialized columns of the lines of carts, for serialize_carts.
+    It has the same join and filter as the selectinload of _cart_query, so lines come back in the same order.
+
+    :param cart_ids: IDs of the carts.
+
+    :return: The select statement.
+    """
+    return select(*CartItem.serialized_columns()) \
+        .outerjoin(Item, Item.id == CartItem.item_id) \
+        .where(CartItem.cart_id.in_(cart_ids))
+
+def serialize_carts(carts: list, rows) -> list[dict]:
+    """
+    Serializes carts the same way as Cart.serialize from the rows of lines_statement.
+
+    :param carts: Rows with the id and subtotal of the carts.
+    :param rows: The rows of lines_statement for the carts.
+
+    :return: List of serialized carts.
+    """
+    lines = {cart.id: [] for cart in carts}
+    for row in rows:
+        lines[row.cart_id].append(CartItem.serialize_row(row, row))
+    return [{'id': cart.id, 'items': lines[cart.id], 'subtotal': cart.subtotal} for cart in carts]
+
+def _serialize_carts(carts: list) -> list[dict]:
+    """
+    Serializes carts the same way as Cart.serialize, reading the lines of every cart with one query of columns.
+
+    :param carts: Rows with the id and subtotal of the carts.
+
+    :return: List of serialized carts.
+    """
+    rows = db.session.execute(lines_statement([cart.id for cart in carts])) if carts else []
+    return serialize_carts(carts, rows)
+
+@replica()
+def get_carts_serialized(limit: int = None, cursor: str = None, sort: str = 'id') -> tuple[list[dict], str]:
+    """
+    Gets a page of serialized carts, reading only the serialized columns instead of loading Cart, CartItem and Item objects.
+
+    :param limit: Maximum number of carts to return.
+    :param cursor: Cursor of the page to get. None for the first page.
+    :param sort: Column to order the carts by, id or updated_at.
+
+    :return: Tuple of the list of serialized carts and the cursor of the next page. None if there are no more carts.
+    """
+    carts, next_cursor = paginate(db.session.query(Cart.id, Cart.updated_at, Cart.subtotal), Cart, limit, cursor, sort)
+    return _serialize_carts(carts), next_cursor
+
+def export_carts() -> Iterator[dict]:
+    """
+    Streams every cart with its items from the database in batches of EXPORT_BATCH_SIZE.
+    Carts and cart items are read with a single outer join ordered by cart, so each cart
+    is complete once the next one starts.
+
+    :return: Iterator of serialized carts ordered by ID.
+    """
+    batch_size = current_app.config['EXPORT_BATCH_SIZE']
+    rows = db.session.query(Cart.id.label('cart'), Cart.subtotal.label('cart_subtotal'), *CartItem.serialized_columns()) \
+        .outerjoin(CartItem, CartItem.cart_id == Cart.id) \
+        .outerjoin(Item, Item.id == CartItem.item_id) \
+        .order_by(Cart.id, CartItem.id) \
+        .yield_per(batch_size)
+
+    cart = None
+    for row in rows:
+        if cart is None or cart['id'] != row.cart:
+            if cart is not None:
+                yield cart
+            cart = {'id': row.cart, 'items': [], 'subtotal': row.cart_subtotal}
+        if row.id is not None:
+            cart['items'].append(CartItem.serialize_row(row, row))
+
+    if cart is not None:
+        yield cart
+
+def cart_version_columns() -> list:
+    """
+    The columns a serialized cart depends on, without loading any lines.
+    Line changes do not touch the cart row, so the latest line and item update times
+    and the number of lines are read with correlated subqueries.
+
+    :return: List of the id, update time, latest line and item update times and line count of a cart.
+    """
+    return [
+        Cart.id,
+        Cart.updated_at,
+        select(func.max(CartItem.updated_at)).where(CartItem.cart_id == Cart.id).scalar_subquery(),
+        select(func.max(Item.updated_at)).join(CartItem, CartItem.item_id == Item.id)
+            .where(CartItem.cart_id == Cart.id).scalar_subquery(),
+        select(func.count(CartItem.id)).where(CartItem.cart_id == Cart.id).scalar_subquery()
+    ]
+
+def _cart_version_query():
+    """
+    Builds a query for the columns a serialized cart depends on.
+
+    :return: Query for the columns of cart_version_columns.
+    """
+    return db.session.query(*cart_version_columns())
+
+@replica()
+def get_carts_version(limit: int = None, cursor: str = None, sort: str = 'id') -> tuple[datetime, str]:
+    """
+    Gets the validators of a page of carts without loading their lines.
+
+    :param limit: Maximum number of carts in the page.
+    :param cursor: Cursor of the page. None for the first page.
+    :param sort: Column the carts are ordered by, id or updated_at.
+
+    :return: Tuple of when the page was last modified and a fingerprint of the page.
+    """
+    rows, next_cursor = paginate(_cart_version_query(), Cart, limit, cursor, sort)
+    return version_of(rows, next_cursor)
+
+@replica()
+def get_cart_version(id: int) -> tuple[datetime, str]:
+    """
+    Gets the validators of a cart without loading its lines.
+
+    :param id: ID of the cart.
+
+    :return: Tuple of when the cart was last modified and a fingerprint of the cart. None if no cart exists with the given ID.
+    """
+    if cart_store.enabled():
+        return cart_store.get_cart_version(id)
+    row = _cart_version_query().filter(Cart.id == id).first()
+    return version_of([row]) if row else None
+
+@replica()
 def get_cart(id: int) -> Cart:
     """
     Gets a cart from the database by its ID.
@@ -20,7 +183,9 @@ def get_cart(id: int) -> Cart:
 
     :return: Cart with the given ID. None if no cart exists with the given ID.
     """
-    return Cart.query.get(id)
+    if cart_store.enabled():
+        return cart_store.get_cart(id)
+    return _cart_query().filter(Cart.id == id).first()
 
 def create_cart(user_id: int) -> Cart:
     """
@@ -57,44 +222,195 @@ def delete_cart(id: int) -> bool:
 
     db.session.delete(cart)
     db.session.commit()
-    return 
+    if cart_store.enabled():
+        cart_store.forget(id)
+    return True
+
+def _missing_error(cart_id: int, item_id: int) -> str:
+    """
+    Finds out which side of a cart line does not exist. Only used on the failure path.
+
+    :param cart_id: ID of the cart of the line.
+    :param item_id: ID of the item of the line.
+
+    :return: Error message for the missing item or cart. None if both exist.
+    """
+    if not db.session.query(Item.id).filter_by(id=item_id).first():
+        return f'Item with id {item_id} not found'
+    if not db.session.query(Cart.id).filter_by(id=cart_id).first():
+        return f'Cart with id {cart_id} not found'
+    return None
+
+def _upsert_lines(cart_id: int, quantities: dict[int, int], increment: bool, new_ids: list[int]):
+    """
+    Inserts or updates lines of a cart with a single INSERT ... ON CONFLICT statement.
+    Does not commit.
+
+    :param cart_id: ID of the cart.
+    :param quantities: Dict of item ID to quantity.
+    :param increment: True to add the quantities to existing lines, False to replace them.
+    :param new_ids: IDs reserved for the lines, None to let the database assign them. Reserve them before the first
+    statement of the transaction, the hi-lo allocator writes on its own connection and would wait for this one.
+    """
+    if not quantities:
+        return
 
-def add_to_cart(cart_id: int, item_id: int, quantity: int) -> Cart:
+    rows = [{'cart_id': cart_id, 'item_id': item_id, 'quantity': quantity} for item_id, quantity in quantities.items()]
+    if new_ids is not None:
+        for row, new_id in zip(rows, new_ids):
+            row['id'] = new_id
+
+    stmt = insert(CartItem).values(rows)
+    quantity = CartItem.quantity + stmt.excluded.quantity if increment else stmt.excluded.quantity
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CartItem.cart_id, CartItem.item_id],
+        set_={'quantity': quantity, 'updated_at': func.current_timestamp()}
+    )
+    db.session.execute(stmt)
+
+def add_to_cart(cart_id: int, item_id: int, quantity: int) -> tuple[Cart, str]:
     """
     Adds an item to a cart in the database.
+    The line is inserted, or its quantity incremented if the item is already in the cart,
+    with a single INSERT ... ON CONFLICT statement.
 
     :param cart_id: ID of the cart to add the item to.
     :param item_id: ID of the item to add to the cart.
     :param quantity: Quantity of the item to add to the cart.
 
-    :return: Cart that was updated.
+    :return: Tuple of the cart that was updated and an error message if the cart or item does not exist.
     """
-    # see if item is already in cart, if it is, update quantity
-    cart_item = CartItem.query.filter_by(cart_id=cart_id, item_id=item_id).first()
-    if cart_item:
-        cart_item.quantity += quantity
-    else:
-        cart_item = CartItem(cart_id, item_id, quantity)
-        max_id = db.session.query(func.max(CartItem.id)).scalar()
-        new_id = int(max_id) + 1 if max_id else 1
-        cart_item.id = new_id
-
-        db.session.add(cart_item)
+    if cart_store.enabled():
+        return cart_store.add_to_cart(cart_id, item_id, quantity)
+    try:
+        _upsert_lines(cart_id, {item_id: quantity}, increment=True, new_ids=reserve_ids(CartItem, 1))
+        db.session.commit()
+    except IntegrityError:
+        # foreign key violation, the cart or the item does not exist
+        db.session.rollback()
+        error = _missing_error(cart_id, item_id)
+        if error is None:
+            raise
+        return None, error
 
-    db.session.commit()
-    return Cart.query.get(cart_id)
+    return _cart_query().populate_existing().filter(Cart.id == cart_id).first(), None
 
-def remove_from_cart(cart_id: int, item_id: int) -> Cart:
+def remove_from_cart(cart_id: int, item_id: int) -> tuple[Cart, str]:
     """
-    Removes an item from a cart in the database.
+    Removes an item from a cart in the database with a single DELETE statement.
 
     :param cart_id: ID of the cart to remove the item from.
     :param item_id: ID of the item to remove from the cart.
 
-    :return: Cart that was updated.
+    :return: Tuple of the cart that was updated and an error message if the cart or item does not exist.
     """
-    cart_item = CartItem.query.filter_by(cart_id=cart_id, item_id=item_id).first()
-    if cart_item:
-        db.session.delete(cart_item)
-        db.session.commit()
-    return Cart.query.get(cart_id)
+    if cart_store.enabled():
+        return cart_store.remove_from_cart(cart_id, item_id)
+    result = db.session.execute(
+        delete(CartItem).where(CartItem.cart_id == cart_id, CartItem.item_id == item_id)
+    )
+    db.session.commit()
+
+    if result.rowcount == 0:
+        # nothing was removed, check why only now
+        error = _missing_error(cart_id, item_id)
+        if error:
+            return None, error
+
+    return _cart_query().populate_existing().filter(Cart.id == cart_id).first(), None
+
+# largest value of the Integer columns item IDs and quantities are bound to
+MAX_INTEGER = 2 ** 31 - 1
+
+def _is_integer(value) -> bool:
+    # JSON true and false decode to bools, which are ints to isinstance
+    return isinstance(value, int) and not isinstance(value, bool) and value <= MAX_INTEGER
+
+def _parse_lines(op: str, lines: list, min_quantity: int, errors: list) -> list[tuple[int, int, int]]:
+    """
+    Validates the lines of one operation of a batch, collecting errors instead of stopping at the first one.
+
+    :param op: Name of the operation, add, set or remove.
+    :param lines: List of {item_id, quantity} objects from the request.
+    :param min_quantity: Smallest quantity allowed. None if lines have no quantity.
+    :param errors: List the errors are appended to.
+
+    :return: List of (index of the line in the request, item ID, quantity) tuples of the valid lines. The quantity is None if lines have no quantity.
+    """
+    parsed = []
+    for index, line in enumerate(lines or []):
+        item_id = line.get('item_id') if isinstance(line, dict) else None
+        quantity = line.get('quantity') if isinstance(line, dict) else None
+        if not _is_integer(item_id):
+            errors.append({'op': op, 'index': index, 'item_id': item_id, 'error': 'item_id must be an integer'})
+        elif min_quantity is not None and (not _is_integer(quantity) or quantity < min_quantity):
+            errors.append({'op': op, 'index': index, 'item_id': item_id, 'error': f'Quantity must be an integer from {min_quantity} to {MAX_INTEGER}'})
+        else:
+            parsed.append((index, item_id, quantity))
+    return parsed
+
+def update_cart_items(cart_id: int, adds: list, sets: list, removes: list) -> tuple[Cart, list[dict], str]:
+    """
+    Applies a batch of line changes to a cart in a single transaction.
+    Every item ID is validated with one query and invalid lines are reported instead of aborting the batch.
+    Removes are applied first, then sets, then adds, with one statement each.
+
+    :param cart_id: ID of the cart to change.
+    :param adds: List of {item_id, quantity} to add to the existing quantities.
+    :param sets: List of {item_id, quantity} to replace the existing quantities with. A quantity of 0 removes the line.
+    :param removes: List of {item_id} to remove.
+
+    :return: Tuple of the updated cart, the list of per line errors and an error message if the cart does not exist.
+    """
+    # the Redis store finds out itself, without a database read
+    if not cart_store.enabled() and not db.session.query(Cart.id).filter_by(id=cart_id).first():
+        return None, [], f'Cart with id {cart_id} not found'
+
+    errors = []
+    lines = {
+        'remove': _parse_lines('remove', removes, None, errors),
+        'set': _parse_lines('set', sets, 0, errors),
+        'add': _parse_lines('add', adds, 1, errors)
+    }
+
+    item_ids = {item_id for parsed in lines.values() for _, item_id, _ in parsed}
+    existing = {item_id for item_id, in db.session.query(Item.id).filter(Item.id.in_(item_ids))} if item_ids else set()
+
+    remove_ids, set_quantities, add_quantities = set(), {}, {}
+    for op, parsed in lines.items():
+        for index, item_id, quantity in parsed:
+            if item_id not in existing:
+                errors.append({'op': op, 'index': index, 'item_id': item_id, 'error': f'Item with id {item_id} not found'})
+            elif op == 'remove' or (op == 'set' and quantity == 0):
+                remove_ids.add(item_id)
+            elif op == 'set':
+                set_quantities[item_id] = quantity
+            else:
+                add_quantities[item_id] = add_quantities.get(item_id, 0) + quantity
+
+    # a set followed by an add in the same batch becomes a single set
+    for item_id in set_quantities.keys() & add_quantities.keys():
+        set_quantities[item_id] += add_quantities.pop(item_id)
+    for item_id in remove_ids & add_quantities.keys():
+        set_quantities[item_id] = add_quantities.pop(item_id)
+    remove_ids -= set_quantities.keys()
+
+    if cart_store.enabled():
+        cart = cart_store.update_cart_items(cart_id, remove_ids, set_quantities, add_quantities)
+        if cart is None:
+            return None, [], f'Cart with id {cart_id} not found'
+        return cart, errors, None
+
+    # reserved before the first statement, the allocator writes on its own connection
+    set_ids = add_ids = None
+    if set_quantities or add_quantities:
+        new_ids = reserve_ids(CartItem, len(set_quantities) + len(add_quantities))
+        if new_ids is not None:
+            set_ids, add_ids = new_ids[:len(set_quantities)], new_ids[len(set_quantities):]
+    if remove_ids:
+        db.session.execute(delete(CartItem).where(CartItem.cart_id == cart_id, CartItem.item_id.in_(remove_ids)))
+    _upsert_lines(cart_id, set_quantities, increment=False, new_ids=set_ids)
+    _upsert_lines(cart_id, add_quantities, increment=True, new_ids=add_ids)
+    db.session.commit()
+
+    return _cart_query().populate_existing().filter(Cart.id == cart_id).first(), errors, None
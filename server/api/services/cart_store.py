@@ -0,0 +1,463 @@
+import atexit
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from decimal import Decimal
+from flask import Flask, current_app
+from sqlalchemy import delete, func, select
+from api import db
+from api.models.cart import Cart
+from api.models.cart_item import CartItem
+from api.models.item import Item
+from api.replicas import primary
+from api.services.id_allocator import reserve_ids
+from api.services.upsert import insert
+from api.services.versions import version_of
+
+# ids of carts written in Redis that are not in the database yet
+DIRTY_KEY = 'cart:dirty'
+
+_writer_lock = threading.Lock()
+
+# held while a cart moves between Redis and the database on databases without row locks
+cart_lock = threading.RLock()
+
+# replaces a cart's hash with the lines read from the database, unless another request loaded it first
+LOAD_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], 'loaded') == 1 then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+# applies (op, item ID, value) triples to a loaded cart and marks it dirty, 0 if the cart is not loaded
+WRITE_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], 'loaded') == 0 then
+    return 0
+end
+for i = 3, #ARGV, 3 do
+    local op, item, value = ARGV[i], ARGV[i + 1], ARGV[i + 2]
+    if op == 'add' then
+        redis.call('HINCRBY', KEYS[1], 'q:' .. item, value)
+    elseif op == 'set' then
+        redis.call('HSET', KEYS[1], 'q:' .. item, value)
+    elseif op == 'id' then
+        redis.call('HSETNX', KEYS[1], 'i:' .. item, value)
+    else
+        redis.call('HDEL', KEYS[1], 'q:' .. item, 'i:' .. item)
+    end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('SADD', KEYS[2], ARGV[1])
+return 1
+"""
+
+# records the line IDs the database assigned, for lines that are still in the cart
+IDS_SCRIPT = """
+for i = 1, #ARGV, 2 do
+    if redis.call('HEXISTS', KEYS[1], 'q:' .. ARGV[i]) == 1 then
+        redis.call('HSETNX', KEYS[1], 'i:' .. ARGV[i], ARGV[i + 1])
+    end
+end
+return 1
+"""
+
+class CartView:
+    """
+    A cart read from Redis, serialized exactly like Cart.
+    Lines get their IDs from the allocator when they are added, so lines that were not written to the database yet have them too.
+    """
+
+    def __init__(self, id: int, lines: dict, items: dict):
+        self.id = id
+        # item ID -> (quantity, line ID)
+        self.lines = lines
+        # item ID -> Item
+        self.items = items
+
+    def serialize(self):
+        lines = []
+        for item_id, (quantity, line_id) in sorted(self.lines.items(), key=lambda line: line[1][1]):
+            item = self.items[item_id]
+            lines.append({
+                'id': line_id,
+                'item_id': item_id,
+                'cart_id': self.id,
+                'quantity': quantity,
+                'item': {
+                    'name': item.name,
+                    'price': item.price,
+                    'image_url': item.image_url,
+                    'stock': item.stock
+                },
+                'subtotal': item.price * quantity
+            })
+        return {
+            'id': self.id,
+            'items': lines,
+            'subtotal': sum((line['subtotal'] for line in lines), Decimal('0.00'))
+        }
+
+def enabled() -> bool:
+    return current_app.config['CART_STORE'] == 'redis'
+
+def check_config(app: Flask):
+    """
+    Refuses to start with CART_STORE redis and the identity allocator, which cannot give lines their IDs before they are written.
+
+    :param app: The app.
+    """
+    if app.config['CART_STORE'] == 'redis' and app.config['ID_ALLOCATOR'] == 'identity':
+        raise ValueError('CART_STORE redis needs an ID_ALLOCATOR that reserves IDs up front, like hilo')
+
+@contextmanager
+def locked(cart_ids: list[int], read: bool = False):
+    """
+    Locks carts for the with block, so flushes, loads and checkouts of a cart run one at a time and a flush
+    never writes back lines a checkout took. On PostgreSQL the cart rows are locked until the end of the
+    transaction, commit or roll back inside the block. Other databases use cart_lock, which only covers one process.
+
+    :param cart_ids: IDs of the carts.
+    :param read: Only keep the carts from being flushed or checked out, for a load.
+
+    :return: The IDs of the carts that exist.
+    """
+    stmt = select(Cart.id).where(Cart.id.in_(cart_ids)).order_by(Cart.id)
+    if db.engine.dialect.name == 'postgresql':
+        yield set(db.session.scalars(stmt.with_for_update(read=read)))
+    else:
+        with cart_lock:
+            yield set(db.session.scalars(stmt))
+
+def _client():
+    return current_app.config['CART_REDIS']
+
+def _key(cart_id: int) -> str:
+    return f'cart:{cart_id}'
+
+def _parse(fields: dict) -> dict:
+    """
+    Reads the lines of a cart hash.
+
+    :param fields: The fields of the hash as returned by HGETALL.
+
+    :return: Item ID -> (quantity, line ID), None if the cart is not loaded.
+    """
+    if b'loaded' not in fields:
+        return None
+    lines = {}
+    for field, value in fields.items():
+        if field.startswith(b'q:'):
+            item_id = int(field[2:])
+            line_id = fields.get(b'i:' + field[2:])
+            lines[item_id] = (int(value), int(line_id) if line_id is not None else None)
+    return lines
+
+@primary()
+def _load(cart_id: int) -> bool:
+    """
+    Copies a cart and its lines from the database into Redis.
+
+    :param cart_id: ID of the cart.
+
+    :return: True if the cart exists.
+    """
+    # a checkout that is taking the lines commits before they are read
+    with locked([cart_id], read=True) as existing:
+        if not existing:
+            return False
+        rows = db.session.execute(select(CartItem.item_id, CartItem.quantity, CartItem.id).where(CartItem.cart_id == cart_id)).all()
+        fields = ['loaded', 1]
+        for item_id, quantity, line_id in rows:
+            fields += [f'q:{item_id}', quantity, f'i:{item_id}', line_id]
+        _client().register_script(LOAD_SCRIPT)(keys=[_key(cart_id)], args=[current_app.config['CART_REDIS_TTL']] + fields)
+        # ends the transaction that holds the lock
+        db.session.rollback()
+    return True
+
+def _lines(cart_id: int) -> dict:
+    """
+    Gets the lines of a cart from Redis, loading the cart from the database if Redis does not have it.
+
+    :param cart_id: ID of the cart.
+
+    :return: Item ID -> (quantity, line ID), None if the cart does not exist.
+    """
+    lines = _parse(_client().hgetall(_key(cart_id)))
+    if lines is None:
+        if not _load(cart_id):
+            return None
+        lines = _parse(_client().hgetall(_key(cart_id)))
+    return lines
+
+def _write(cart_id: int, ops: list[tuple]) -> bool:
+    """
+    Applies line changes to a cart in Redis in one atomic step and queues the cart for the writer.
+
+    :param cart_id: ID of the cart.
+    :param ops: List of (op, item ID, value) with op add, set, or remove.
+
+    :return: True if the cart exists.
+    """
+    lines = _lines(cart_id)
+    if lines is None:
+        return False
+
+    # lines new to the cart get their IDs now, carts read from Redis are serialized with them
+    new_items = sorted({item_id for op, item_id, _ in ops if op != 'remove' and item_id not in lines})
+    if new_items:
+        new_ids = reserve_ids(CartItem, len(new_items))
+        if new_ids is None:
+            raise RuntimeError('CART_STORE redis needs an ID_ALLOCATOR that reserves IDs up front, like hilo')
+        ops = ops + [('id', item_id, new_id) for item_id, new_id in zip(new_items, new_ids)]
+
+    args = [cart_id, current_app.config['CART_REDIS_TTL']] + [value for op in ops for value in op]
+    write = _client().register_script(WRITE_SCRIPT)
+    # the hash expired between reading and writing, load it again once
+    if not write(keys=[_key(cart_id), DIRTY_KEY], args=args):
+        if not _load(cart_id) or not write(keys=[_key(cart_id), DIRTY_KEY], args=args):
+            return False
+    _start_writer()
+    return True
+
+def _view(cart_id: int, lines: dict) -> CartView:
+    items = {item.id: item for item in Item.query.filter(Item.id.in_(lines))} if lines else {}
+    # lines of items deleted since they were added are dropped by the next flush
+    return CartView(cart_id, {item_id: line for item_id, line in lines.items() if item_id in items}, items)
+
+def get_cart(cart_id: int) -> CartView:
+    """
+    Gets a cart from Redis, loading it from the database if Redis does not have it.
+
+    :param cart_id: ID of the cart.
+
+    :return: The cart, None if the cart does not exist.
+    """
+    lines = _lines(cart_id)
+    return _view(cart_id, lines) if lines is not None else None
+
+def get_cart_version(cart_id: int) -> tuple[datetime, str]:
+    """
+    Gets the validators of a cart from its lines in Redis and the update times of its items.
+
+    :param cart_id: ID of the cart.
+
+    :return: Tuple of when the cart's items were last modified and a fingerprint of the cart. None if the cart does not exist.
+    """
+    lines = _lines(cart_id)
+    if lines is None:
+        return None
+    items = db.session.execute(select(Item.id, Item.updated_at).where(Item.id.in_(lines)).order_by(Item.id)).all() if lines else []
+    return version_of(items, cart_id, sorted(lines.items()))
+
+def add_to_cart(cart_id: int, item_id: int, quantity: int) -> tuple[CartView, str]:
+    """
+    Adds an item to a cart in Redis with a single HINCRBY.
+
+    :param cart_id: ID of the cart to add the item to.
+    :param item_id: ID of the item to add to the cart.
+    :param quantity: Quantity of the item to add to the cart.
+
+    :return: Tuple of the cart that was updated and an error message if the cart or item does not exist.
+    """
+    if not db.session.query(Item.id).filter_by(id=item_id).first():
+        return None, f'Item with id {item_id} not found'
+    if not _write(cart_id, [('add', item_id, quantity)]):
+        return None, f'Cart with id {cart_id} not found'
+    return get_cart(cart_id), None
+
+def remove_from_cart(cart_id: int, item_id: int) -> tuple[CartView, str]:
+    """
+    Removes an item from a cart in Redis with a single HDEL.
+
+    :param cart_id: ID of the cart to remove the item from.
+    :param item_id: ID of the item to remove from the cart.
+
+    :return: Tuple of the cart that was updated and an error message if the cart or item does not exist.
+    """
+    if not _write(cart_id, [('remove', item_id, 0)]):
+        return None, f'Cart with id {cart_id} not found'
+    cart = get_cart(cart_id)
+    if item_id not in cart.lines and not db.session.query(Item.id).filter_by(id=item_id).first():
+        return None, f'Item with id {item_id} not found'
+    return cart, None
+
+def update_cart_items(cart_id: int, remove_ids: set[int], set_quantities: dict[int, int], add_quantities: dict[int, int]) -> CartView:
+    """
+    Applies a validated batch of line changes to a cart in Redis in one atomic step.
+
+    :param cart_id: ID of the cart to change.
+    :param remove_ids: IDs of the items to remove.
+    :param set_quantities: Item ID -> quantity to replace the existing quantity with.
+    :param add_quantities: Item ID -> quantity to add to the existing quantity.
+
+    :return: The updated cart, None if the cart does not exist.
+    """
+    ops = [('remove', item_id, 0) for item_id in sorted(remove_ids)]
+    ops += [('set', item_id, quantity) for item_id, quantity in sorted(set_quantities.items())]
+    ops += [('add', item_id, quantity) for item_id, quantity in sorted(add_quantities.items())]
+    if not _write(cart_id, ops):
+        return None
+    return get_cart(cart_id)
+
+def forget(cart_id: int):
+    """
+    Drops a cart from Redis when it is changed in the database, it is loaded again on the next read.
+    Call it under locked before the change commits, a flush waiting for the cart then finds nothing to write back.
+
+    :param cart_id: ID of the cart.
+    """
+    pipe = _client().pipeline(transaction=True)
+    pipe.delete(_key(cart_id))
+    pipe.srem(DIRTY_KEY, cart_id)
+    pipe.execute()
+
+def write_back(cart_ids: list[int], existing: set[int]) -> list[tuple]:
+    """
+    Writes the lines Redis has for carts to the database. Does not commit, call it under locked.
+    Lines are upserted with one statement and lines removed in Redis are deleted, so the database ends up
+    with exactly the lines Redis has. Carts that are not loaded in Redis are left alone.
+
+    :param cart_ids: IDs of the carts to write.
+    :param existing: IDs of the carts that exist in the database, as returned by locked.
+
+    :return: List of (cart ID, item ID, line ID) of the lines that had no ID.
+    """
+    pipe = _client().pipeline(transaction=False)
+    for cart_id in cart_ids:
+        pipe.hgetall(_key(cart_id))
+    carts = {cart_id: _parse(fields) for cart_id, fields in zip(cart_ids, pipe.execute())}
+    carts = {cart_id: lines for cart_id, lines in carts.items() if lines is not None and cart_id in existing}
+    items = set(db.session.scalars(select(Item.id).where(Item.id.in_({item_id for lines in carts.values() for item_id in lines}))))
+
+    with_ids, without_ids = [], []
+    for cart_id, lines in carts.items():
+        db.session.execute(delete(CartItem).where(CartItem.cart_id == cart_id, CartItem.item_id.not_in(lines.keys() & items)))
+        for item_id, (quantity, line_id) in lines.items():
+            if item_id not in items:
+                continue
+            row = {'cart_id': cart_id, 'item_id': item_id, 'quantity': quantity}
+            if line_id is not None:
+                with_ids.append({'id': line_id, **row})
+            else:
+                without_ids.append(row)
+
+    assigned = []
+    for rows in (with_ids, without_ids):
+        if not rows:
+            continue
+        stmt = insert(CartItem).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CartItem.cart_id, CartItem.item_id],
+            set_={'quantity': stmt.excluded.quantity, 'updated_at': func.current_timestamp()},
+            # unchanged lines keep their update time, so cart ETags stay valid
+            where=CartItem.quantity != stmt.excluded.quantity
+        )
+        if rows is without_ids:
+            assigned = db.session.execute(stmt.returning(CartItem.cart_id, CartItem.item_id, CartItem.id)).all()
+        else:
+            db.session.execute(stmt)
+    return assigned
+
+def flush(cart_ids: list[int] = None) -> int:
+    """
+    Writes carts from Redis to the database in one transaction.
+    The carts are read from Redis under their locks, so a checkout that took the lines in the meantime has
+    dropped them from Redis and they are not written back. Carts written again in the meantime stay dirty.
+
+    :param cart_ids: IDs of the carts to write, none for a batch of CART_FLUSH_BATCH dirty carts.
+
+    :return: The number of carts written.
+    """
+    client = _client()
+    if cart_ids is None:
+        cart_ids = [int(cart_id) for cart_id in client.spop(DIRTY_KEY, current_app.config['CART_FLUSH_BATCH']) or []]
+    elif cart_ids:
+        client.srem(DIRTY_KEY, *cart_ids)
+    if not cart_ids:
+        return 0
+
+    try:
+        with locked(cart_ids) as existing:
+            assigned = write_back(cart_ids, existing)
+            db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        client.sadd(DIRTY_KEY, *cart_ids)
+        raise
+
+    ids_script = client.register_script(IDS_SCRIPT)
+    for cart_id in {cart_id for cart_id, _, _ in assigned}:
+        ids_script(keys=[_key(cart_id)], args=[value for row in assigned if row[0] == cart_id for value in row[1:]])
+    return len(existing)
+
+def flush_all() -> int:
+    """
+    Writes every dirty cart to the database, in batches of CART_FLUSH_BATCH.
+
+    :return: The number of carts written.
+    """
+    total = 0
+    while True:
+        written = flush()
+        if not written and not _client().scard(DIRTY_KEY):
+            return total
+        total += written
+
+def recover() -> int:
+    """
+    Marks every cart loaded in Redis as dirty, so carts whose dirty mark was lost are written again.
+    Carts that Redis lost are loaded from the database on their next read, losing at most the writes of one flush interval.
+
+    :return: The number of carts marked.
+    """
+    client = _client()
+    marked = 0
+    for key in client.scan_iter(match='cart:*', count=1000):
+        cart_id = key.split(b':', 1)[1]
+        if cart_id.isdigit():
+            client.sadd(DIRTY_KEY, cart_id)
+            marked += 1
+    return marked
+
+def _run_writer(app: Flask):
+    interval = app.config['CART_FLUSH_INTERVAL']
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            try:
+                flush_all()
+            except Exception:
+                app.logger.exception('Failed to flush carts')
+            finally:
+                db.session.remove()
+
+def _flush_on_exit(app: Flask):
+    with app.app_context():
+        try:
+            flush_all()
+        except Exception:
+            app.logger.exception('Failed to flush carts on exit')
+
+def _start_writer():
+    """
+    Starts the background writer of this process on the first cart write. Forked workers start their own.
+    """
+    state = current_app.extensions.get('cart_writer')
+    if state is not None and state['pid'] == os.getpid():
+        return
+
+    with _writer_lock:
+        state = current_app.extensions.get('cart_writer')
+        if state is not None and state['pid'] == os.getpid():
+            return
+        app = current_app._get_current_object()
+        thread = threading.Thread(target=_run_writer, args=(app,), name='cart-writer', daemon=True)
+        thread.start()
+        atexit.register(_flush_on_exit, app)
+        current_app.extensions['cart_writer'] = {'pid': os.getpid(), 'thread': thread}
@@ -0,0 +1,317 @@
+import threading
+import time
+from datetime import timedelta
+from decimal import ROUND_CEILING, ROUND_DOWN, ROUND_FLOOR, Decimal
+from flask import current_app
+from sqlalchemy import func, select
+from api import db
+from api.models.item import Item
+from api.services.pagination import paginate_offset
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+FACETS = ('category', 'size', 'color')
+SORTS = ('id', 'price', '-price')
+COLUMNS = (Item.id, Item.price, Item.stock, Item.category, Item.size, Item.color, Item.updated_at)
+REFRESH_OVERLAP = timedelta(seconds=1)
+
+class CatalogUnavailable(Exception):
+    """
+    Raised when the catalog snapshot cannot be built because NumPy is not installed.
+    """
+
+class Snapshot:
+    """
+    An immutable columnar copy of the items table, one array per column and one row per item.
+    Prices are stored in cents, category, size and color are dictionary encoded with -1 for no value.
+    Refreshing builds a new snapshot, so readers never see a partial update.
+    """
+
+    def __init__(self, ids, price, stock, codes: dict, values: dict, live, watermark):
+        self.ids = ids
+        self.price = price
+        self.stock = stock
+        # facet -> array of value codes, facet -> list of values by code
+        self.codes = codes
+        self.values = values
+        # false for rows of deleted items, they are dropped on the next full build
+        self.live = live
+        self.watermark = watermark
+        self.count = int(live.sum())
+        self.positions = {id: i for i, id in enumerate(ids.tolist())}
+
+    @classmethod
+    def build(cls, rows: list) -> 'Snapshot':
+        """
+        Builds a snapshot from rows of the items table.
+
+        :param rows: Rows with the id, price, stock, category, size, color and updated_at columns.
+
+        :return: The snapshot.
+        """
+        values = {facet: [] for facet in FACETS}
+        lookup = {facet: {} for facet in FACETS}
+        codes = {facet: np.array([_encode(lookup[facet], values[facet], getattr(row, facet)) for row in rows], dtype=np.int32) for facet in FACETS}
+        return cls(
+            np.array([row.id for row in rows], dtype=np.int64),
+            np.array([_cents(row.price) for row in rows], dtype=np.int64),
+            np.array([row.stock for row in rows], dtype=np.int64),
+            codes,
+            values,
+            np.ones(len(rows), dtype=bool),
+            max((row.updated_at for row in rows), default=None)
+        )
+
+    def contains(self, row) -> bool:
+        """
+        Checks if the snapshot already has a row as it is now.
+
+        :param row: A row of the items table.
+
+        :return: True if the item is in the snapshot with the same price, stock and facet values.
+        """
+        i = self.positions.get(row.id)
+        if i is None or not self.live[i] or self.price[i] != _cents(row.price) or self.stock[i] != row.stock:
+            return False
+        for facet in FACETS:
+            code = self.codes[facet][i]
+            if (self.values[facet][code] if code >= 0 else None) != getattr(row, facet):
+                return False
+        return True
+
+    def apply(self, rows: list, ids=None) -> 'Snapshot':
+        """
+        Makes a new snapshot with changed rows written over this one.
+
+        :param rows: The rows that were created or updated since the watermark.
+        :param ids: Every item ID in the table, to find deleted items. None if nothing was deleted.
+
+        :return: The new snapshot.
+        """
+        values = {facet: list(self.values[facet]) for facet in FACETS}
+        lookup = {facet: {value: code for code, value in enumerate(values[facet])} for facet in FACETS}
+        new_rows = [row for row in rows if row.id not in self.positions]
+        size = len(self.ids) + len(new_rows)
+
+        def grow(array, fill):
+            return np.concatenate([array, np.full(size - len(array), fill, dtype=array.dtype)])
+
+        item_ids = grow(self.ids, 0)
+        price, stock, live = grow(self.price, 0), grow(self.stock, 0), grow(self.live, True)
+        codes = {facet: grow(self.codes[facet], -1) for facet in FACETS}
+
+        positions = dict(self.positions)
+        for row in rows:
+            i = positions.get(row.id)
+            if i is None:
+                i = positions[row.id] = len(positions)
+            item_ids[i], price[i], stock[i], live[i] = row.id, _cents(row.price), row.stock, True
+            for facet in FACETS:
+                codes[facet][i] = _encode(lookup[facet], values[facet], getattr(row, facet))
+
+        if ids is not None:
+            live &= np.isin(item_ids, np.fromiter(ids, dtype=np.int64))
+
+        watermark = max([row.updated_at for row in rows] + ([self.watermark] if self.watermark else []), default=None)
+        return Snapshot(item_ids, price, stock, codes, values, live, watermark)
+
+    def query(self, filters: dict, min_price: int = None, max_price: int = None, in_stock: bool = False, sort: str = 'id'):
+        """
+        Filters and sorts the catalog and counts the items per facet value.
+        Facet counts of a facet apply every filter except the facet's own, so they show how many items
+        the page would have if that value was selected too.
+
+        :param filters: facet -> values to keep, an item matches if it has any of them.
+        :param min_price: The lowest price to keep in cents.
+        :param max_price: The highest price to keep in cents.
+        :param in_stock: Only keep items with stock left.
+        :param sort: id, price, or -price for the most expensive first.
+
+        :return: A tuple of the matching item IDs in order, their number and the facet counts.
+        """
+        base = self.live.copy()
+        if min_price is not None:
+            base &= self.price >= min_price
+        if max_price is not None:
+            base &= self.price <= max_price
+        available = self.stock > 0
+
+        masks = {}
+        for facet, selected in filters.items():
+            lookup = {value: code for code, value in enumerate(self.values[facet])}
+            masks[facet] = np.isin(self.codes[facet], [lookup[value] for value in selected if value in lookup])
+
+        mask = base.copy()
+        for facet_mask in masks.values():
+            mask &= facet_mask
+        facets = {'in_stock': int((mask & available).sum())}
+        if in_stock:
+            base &= available
+            mask &= available
+
+        for facet in FACETS:
+            facet_base = base.copy()
+            for other, facet_mask in masks.items():
+                if other != facet:
+                    facet_base &= facet_mask
+            # shifted by one so items without a value land in bucket 0
+            counts = np.bincount(self.codes[facet][facet_base] + 1, minlength=len(self.values[facet]) + 1)
+            facets[facet] = {value: int(counts[code + 1]) for code, value in enumerate(self.values[facet]) if counts[code + 1]}
+
+        matched = np.flatnonzero(mask)
+        prices = self.price[matched]
+        facets['price'] = {
+            'min': _price(prices.min()) if len(matched) else None,
+            'max': _price(prices.max()) if len(matched) else None
+        }
+
+        if sort == 'price':
+            matched = matched[np.lexsort((self.ids[matched], prices))]
+        elif sort == '-price':
+            matched = matched[np.lexsort((self.ids[matched], -prices))]
+        else:
+            matched = matched[np.argsort(self.ids[matched], kind='stable')]
+        return self.ids[matched], len(matched), facets
+
+def _encode(lookup: dict, values: list, value: str) -> int:
+    if value is None:
+        return -1
+    code = lookup.get(value)
+    if code is None:
+        code = lookup[value] = len(values)
+        values.append(value)
+    return code
+
+def _cents(price, rounding: str = ROUND_DOWN) -> int:
+    return int((Decimal(price) * 100).to_integral_value(rounding))
+
+def _price(cents) -> Decimal:
+    return Decimal(int(cents)).scaleb(-2)
+
+def _state() -> dict:
+    state = current_app.extensions.get('catalog')
+    if state is None:
+        state = current_app.extensions.setdefault('catalog', {
+            'snapshot': None,
+            'checked': 0.0,
+            'stale': False,
+            'lock': threading.Lock()
+        })
+    return state
+
+def _refresh(snapshot: Snapshot) -> Snapshot:
+    """
+    Brings a snapshot up to date with the items table, reading only the rows updated since it was taken.
+
+    :param snapshot: The snapshot to refresh, None to build one.
+
+    :return: The refreshed snapshot.
+    """
+    if snapshot is None:
+        return Snapshot.build(db.session.query(*COLUMNS).all())
+
+    count = db.session.query(func.count(Item.id)).scalar()
+    if snapshot.watermark is not None:
+        # timestamps are not unique and may only have whole seconds, rows written close to the watermark are read again
+        rows = db.session.query(*COLUMNS).filter(Item.updated_at >= snapshot.watermark - REFRESH_OVERLAP).all()
+    else:
+        rows = db.session.query(*COLUMNS).all()
+    rows = [row for row in rows if not snapshot.contains(row)]
+    new_ids = sum(1 for row in rows if row.id not in snapshot.positions)
+
+    # deletions do not move the watermark, only look for them if the count is off
+    ids = None
+    if count != snapshot.count + new_ids:
+        ids = db.session.scalars(select(Item.id)).all()
+    if not rows and ids is None:
+        return snapshot
+    snapshot = snapshot.apply(rows, ids)
+
+    # compact once a quarter of the rows belong to deleted items
+    if len(snapshot.ids) - snapshot.count > len(snapshot.ids) // 4:
+        return Snapshot.build(db.session.query(*COLUMNS).all())
+    return snapshot
+
+def get_snapshot() -> Snapshot:
+    """
+    Gets the catalog snapshot of this process, refreshing it from the database at most every CATALOG_REFRESH_INTERVAL seconds
+    or on the next call after an item was written through this process.
+    Only one request refreshes at a time, the others keep reading the current snapshot.
+
+    :return: The catalog snapshot.
+    :raises CatalogUnavailable: If NumPy is not installed.
+    """
+    if np is None:
+        raise CatalogUnavailable('NumPy is not installed')
+
+    state = _state()
+    now = time.monotonic()
+    due = state['stale'] or now - state['checked'] >= current_app.config['CATALOG_REFRESH_INTERVAL']
+    if state['snapshot'] is not None and not due:
+        return state['snapshot']
+
+    # the first build has to block, later refreshes are skipped while one is running
+    if state['lock'].acquire(blocking=state['snapshot'] is None):
+        try:
+            if state['snapshot'] is None or state['stale'] or now - state['checked'] >= current_app.config['CATALOG_REFRESH_INTERVAL']:
+                state['stale'] = False
+                state['snapshot'] = _refresh(state['snapshot'])
+                state['checked'] = time.monotonic()
+        finally:
+            state['lock'].release()
+    return state['snapshot']
+
+def catalog_changed():
+    """
+    Called after items were written through this process, the snapshot is refreshed on the next browse.
+    """
+    state = current_app.extensions.get('catalog')
+    if state is not None:
+        state['stale'] = True
+
+def browse_items(filters: dict = None, min_price: Decimal = None, max_price: Decimal = None, in_stock: bool = False,
+                 sort: str = 'id', limit: int = None, cursor: str = None) -> tuple[list[Item], str, int, dict]:
+    """
+    Filters, sorts and counts the catalog from the in-process snapshot.
+
+    :param filters: facet -> values to keep, for the category, size and color facets.
+    :param min_price: The lowest price to keep.
+    :param max_price: The highest price to keep.
+    :param in_stock: Only keep items with stock left.
+    :param sort: id, price, or -price for the most expensive first.
+    :param limit: The maximum number of items to return.
+    :param cursor: The cursor of the page to get, none for the first page.
+
+    :return: A tuple containing a list of items, the cursor of the next page, none if there are no more items,
+    the number of matching items and the facet counts.
+    :raises ValueError: If the sort, a facet, a price or the cursor is invalid.
+    :raises CatalogUnavailable: If NumPy is not installed.
+    """
+    if sort not in SORTS:
+        raise ValueError(f'Cannot sort by {sort}')
+    filters = {facet: selected for facet, selected in (filters or {}).items() if selected}
+    for facet in filters:
+        if facet not in FACETS:
+            raise ValueError(f'Cannot filter by {facet}')
+
+    for price in (min_price, max_price):
+        # Infinity and NaN parse as decimals but have no number of cents
+        if price is not None and not price.is_finite():
+            raise ValueError('Invalid price')
+
+    snapshot = get_snapshot()
+    # bounds between two cents are rounded inwards, 1.005 keeps 1.01 but not 1.00
+    ids, total, facets = snapshot.query(
+        filters,
+        _cents(min_price, ROUND_CEILING) if min_price is not None else None,
+        _cents(max_price, ROUND_FLOOR) if max_price is not None else None,
+        in_stock,
+        sort
+    )
+
+    page, next_cursor = paginate_offset(lambda offset, count: ids[offset:offset + count].tolist(), limit, cursor, f'browse:{sort}')
+    items = {item.id: item for item in Item.query.filter(Item.id.in_(page))} if page else {}
+    return [items[id] for id in page if id in items], next_cursor, total, facets
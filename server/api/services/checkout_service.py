@@ -0,0 +1,179 @@
+from contextlib import nullcontext
+from sqlalchemy import case, delete, func, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import selectinload
+from api import db
+from api.models.cart import Cart
+from api.models.cart_item import CartItem
+from api.models.item import Item
+from api.models.order import Order
+from api.models.order_item import OrderItem
+from api.services import cart_store, item_service, stock_admission
+from api.services.id_allocator import allocate_id, reserve_ids
+
+# a reservation that deadlocks with another checkout is rolled back by the database and tried again
+MAX_ATTEMPTS = 3
+EMPTY_CART = 'Cart is empty'
+OUT_OF_STOCK = 'Not enough stock'
+
+def _reserve(quantities: dict[int, int]) -> dict[int, object]:
+    """
+    Takes the stock of every line with a single conditional UPDATE ... RETURNING.
+    Each row is only updated if it has enough stock left, so concurrent checkouts never oversell
+    and only hold the row locks of their own lines until the transaction ends. Does not commit.
+
+    :param quantities: Item ID -> quantity to take.
+
+    :return: Item ID -> price of the items that had enough stock.
+    """
+    quantity = case(quantities, value=Item.id)
+    stmt = update(Item) \
+        .where(Item.id.in_(sorted(quantities)), Item.stock >= quantity) \
+        .values(stock=Item.stock - quantity, updated_at=func.current_timestamp()) \
+        .returning(Item.id, Item.price) \
+        .execution_options(synchronize_session=False)
+    return {item_id: price for item_id, price in db.session.execute(stmt)}
+
+def _shortages(quantities: dict[int, int]) -> list[dict]:
+    """
+    Finds the lines that cannot be filled. Only used on the failure path.
+
+    :param quantities: Item ID -> quantity requested.
+
+    :return: List of {item_id, requested, available} of the lines without enough stock.
+    """
+    stock = dict(db.session.execute(select(Item.id, Item.stock).where(Item.id.in_(quantities))).all())
+    return [
+        {'item_id': item_id, 'requested': quantity, 'available': stock.get(item_id, 0)}
+        for item_id, quantity in sorted(quantities.items())
+        if stock.get(item_id, 0) < quantity
+    ]
+
+def _take_lines(cart_id: int) -> dict[int, int]:
+    """
+    Empties a cart with a single DELETE ... RETURNING and gets the lines it had. Does not commit.
+    The deleted lines are the ones ordered, so a concurrent checkout of the same cart waits for this
+    transaction on the rows and then finds them gone, and a cart is never ordered twice.
+
+    :param cart_id: ID of the cart.
+
+    :return: Item ID -> quantity of the lines with a quantity.
+    """
+    stmt = delete(CartItem) \
+        .where(CartItem.cart_id == cart_id) \
+        .returning(CartItem.item_id, CartItem.quantity) \
+        .execution_options(synchronize_session=False)
+    return {item_id: quantity for item_id, quantity in db.session.execute(stmt) if quantity > 0}
+
+def _place_order(cart_id: int, quantities: dict[int, int], prices: dict[int, object], order_id: int, line_ids: list[int]) -> Order:
+    """
+    Writes the order and its lines. Does not commit.
+
+    :param cart_id: ID of the cart, which is also the ID of its user.
+    :param quantities: Item ID -> quantity ordered.
+    :param prices: Item ID -> price of one item.
+    :param order_id: ID reserved for the order, None to let the database assign it.
+    :param line_ids: IDs reserved for the lines, None to let the database assign them.
+
+    :return: The order.
+    """
+    order = Order(cart_id, sum(prices[item_id] * quantity for item_id, quantity in quantities.items()))
+    order.id = order_id
+    db.session.add(order)
+    db.session.flush()
+
+    rows = [
+        {'order_id': order.id, 'item_id': item_id, 'quantity': quantity, 'price': prices[item_id]}
+        for item_id, quantity in sorted(quantities.items())
+    ]
+    if line_ids is not None:
+        for row, line_id in zip(rows, line_ids):
+            row['id'] = line_id
+    db.session.execute(OrderItem.__table__.insert(), rows)
+    return order
+
+def checkout(cart_id: int) -> tuple[Order, str, list[dict]]:
+    """
+    Turns a cart into an order, taking the stock of every line in one transaction.
+    Either every line is reserved and the cart is emptied, or nothing changes.
+    The lines are taken from the cart with the statement that empties it, so concurrent checkouts of one cart place one order.
+    If STOCK_ADMISSION is on, buyers of sold out items are turned away by Redis before the items table is touched.
+    If CART_STORE is redis, the cart is written to the database first and dropped from Redis under its lock,
+    so a flush of the cart that runs concurrently cannot bring the ordered lines back.
+
+    :param cart_id: ID of the cart to check out.
+
+    :return: Tuple of the order, an error message and the list of lines without enough stock.
+    The order is None if the cart does not exist, is empty or a line is short.
+    """
+    if not db.session.query(Cart.id).filter_by(id=cart_id).first():
+        return None, f'Cart with id {cart_id} not found', []
+    store = cart_store.enabled()
+    if store:
+        # the lines are counted in the database, write the cart there first
+        cart_store.flush([cart_id])
+
+    admitted = None
+    try:
+        for attempt in range(MAX_ATTEMPTS):
+            # reserved before any row is locked, the allocator writes on its own connection
+            lines = db.session.scalar(
+                select(func.count()).select_from(CartItem).where(CartItem.cart_id == cart_id, CartItem.quantity > 0)
+            )
+            if not lines:
+                return None, EMPTY_CART, []
+            order_id, line_ids = allocate_id(Order), reserve_ids(OrderItem, lines)
+
+            try:
+                with cart_store.locked([cart_id]) if store else nullcontext() as existing:
+                    if store:
+                        # lines changed in Redis since the first write
+                        cart_store.write_back([cart_id], existing)
+                    quantities = _take_lines(cart_id)
+                    if not quantities:
+                        # another checkout of the cart committed first
+                        db.session.rollback()
+                        return None, EMPTY_CART, []
+                    if line_ids is not None and len(line_ids) < len(quantities):
+                        # lines were added since they were counted, count them again
+                        db.session.rollback()
+                        if store:
+                            cart_store.flush([cart_id])
+                        continue
+
+                    short_item = stock_admission.admit(quantities)
+                    if short_item is not None:
+                        db.session.rollback()
+                        return None, OUT_OF_STOCK, _shortages(quantities) or [{'item_id': short_item, 'requested': quantities[short_item], 'available': 0}]
+                    admitted = quantities
+
+                    prices = _reserve(quantities)
+                    if len(prices) < len(quantities):
+                        db.session.rollback()
+                        stock_admission.release(admitted)
+                        admitted = None
+                        return None, OUT_OF_STOCK, _shortages(quantities)
+
+                    order = _place_order(cart_id, quantities, prices, order_id, line_ids)
+                    if store:
+                        # before the commit, a flush waiting for the lock finds nothing to write back.
+                        # If the commit fails the cart is loaded from the database again
+                        cart_store.forget(cart_id)
+                    db.session.commit()
+                    break
+            except OperationalError:
+                # deadlock or lock timeout against another checkout
+                db.session.rollback()
+                stock_admission.release(admitted)
+                admitted = None
+                if attempt == MAX_ATTEMPTS - 1:
+                    raise
+        else:
+            raise RuntimeError(f'Lines of cart {cart_id} kept changing during checkout')
+    except BaseException:
+        db.session.rollback()
+        stock_admission.release(admitted)
+        raise
+
+    item_service.stock_reserved(list(quantities))
+    return Order.query.options(selectinload(Order.items)).populate_existing().filter(Order.id == order.id).first(), None, []
@@ -0,0 +1,210 @@
+import os
+import threading
+from flask import current_app
+from sqlalchemy import func, select, text, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import IntegrityError
+from api import db
+from api.models.id_block import IdBlock
+
+def resync_sequences(connection: Connection) -> dict[str, int]:
+    """
+    Moves the identity sequences of the tables past their largest key, never back.
+    Rows inserted with explicit keys, like the SELECT max(id)+1 keys this module replaced or keys of the hi-lo allocator,
+    leave a sequence behind and its next value would collide with them. Only PostgreSQL needs it, SQLite and MySQL
+    continue from the largest key on their own.
+
+    :param connection: A connection to the primary, in a transaction.
+
+    :return: Table name -> the next key its sequence hands out.
+    """
+    if connection.dialect.name != 'postgresql':
+        return {}
+
+    synced = {}
+    for table in db.metadata.sorted_tables:
+        column = table.autoincrement_column
+        if column is None:
+            continue
+        sequence = connection.execute(select(func.pg_get_serial_sequence(table.fullname, column.name))).scalar()
+        if sequence is None:
+            continue
+        # keys up to last_value may already be taken by transactions that have not committed yet
+        last_value, is_called = connection.execute(text(f'SELECT last_value, is_called FROM {sequence}')).one()
+        max_id = connection.execute(select(func.max(column))).scalar() or 0
+        next_value = max(max_id + 1, last_value + 1 if is_called else last_value)
+        connection.execute(select(func.setval(sequence, next_value, False)))
+        synced[table.name] = next_value
+    return synced
+
+class IdentityAllocator:
+    """
+    Leaves primary keys to the database's identity column or sequence.
+    Before a process inserts its first row the sequences are resynced with resync_sequences,
+    so a database written by an older version or by the hi-lo allocator needs no manual step.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # the process that resynced the sequences, forked workers resync again
+        self._synced = None
+
+    def _resync(self):
+        if self._synced == os.getpid():
+            return
+        with self._lock:
+            if self._synced == os.getpid():
+                return
+            with db.engine.begin() as connection:
+                resync_sequences(connection)
+            self._synced = os.getpid()
+
+    def allocate(self, model: db.Model) -> int:
+        """
+        Allocates a primary key for a new row.
+
+        :param model: The model of the row.
+
+        :return: None, the database assigns the key on insert.
+        """
+        self._resync()
+        return None
+
+    def reserve(self, model: db.Model, count: int) -> list[int]:
+        """
+        Reserves primary keys for a batch of new rows.
+
+        :param model: The model of the rows.
+        :param count: The number of keys to reserve.
+
+        :return: None, the database assigns the keys on insert.
+        """
+        self._resync()
+        return None
+
+class HiLoAllocator:
+    """
+    Hands out primary keys from blocks reserved in the id_blocks table.
+    A block is reserved with one atomic update, after which every key in it is handed out
+    from memory, so most inserts need no extra round trip. Keys are unique across processes,
+    but a table must not mix hi-lo keys with database assigned keys.
+    """
+
+    def __init__(self, block_size: int):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        # table name -> [next free key, end of the reserved range]
+        self._ranges = {}
+
+    def allocate(self, model: db.Model) -> int:
+        """
+        Allocates a primary key for a new row.
+
+        :param model: The model of the row.
+
+        :return: The primary key.
+        """
+        return self.reserve(model, 1)[0]
+
+    def reserve(self, model: db.Model, count: int) -> list[int]:
+        """
+        Reserves primary keys for a batch of new rows.
+        Blocks are reserved in a single round trip no matter how many keys are needed.
+
+        :param model: The model of the rows.
+        :param count: The number of keys to reserve.
+
+        :return: A list of count primary keys.
+        """
+        name = model.__tablename__
+        ids = []
+        with self._lock:
+            next_id, end = self._ranges.get(name, (0, 0))
+            taken = min(count, end - next_id)
+            ids.extend(range(next_id, next_id + taken))
+            next_id += taken
+
+            if len(ids) < count:
+                blocks = -(-(count - len(ids)) // self.block_size)
+                next_hi = self._reserve_blocks(model, blocks)
+                next_id = (next_hi - blocks) * self.block_size + 1
+                end = next_hi * self.block_size + 1
+                taken = count - len(ids)
+                ids.extend(range(next_id, next_id + taken))
+                next_id += taken
+
+            self._ranges[name] = (next_id, end)
+        return ids
+
+    def _reserve_blocks(self, model: db.Model, blocks: int) -> int:
+        """
+        Reserves blocks in the id_blocks table, outside of the caller's transaction.
+
+        :param model: The model to reserve blocks for.
+        :param blocks: The number of blocks to reserve.
+
+        :return: The next free hi value after the reserved blocks.
+        """
+        name = model.__tablename__
+        bump = update(IdBlock) \
+            .where(IdBlock.name == name) \
+            .values(next_hi=IdBlock.next_hi + blocks) \
+            .returning(IdBlock.next_hi)
+
+        while True:
+            with db.engine.begin() as connection:
+                next_hi = connection.execute(bump).scalar()
+                if next_hi is not None:
+                    return next_hi
+
+                # first block for this table, start past any keys that already exist
+                max_id = connection.execute(select(func.max(model.id))).scalar() or 0
+                first_hi = -(-max_id // self.block_size)
+                try:
+                    with connection.begin_nested():
+                        connection.execute(IdBlock.__table__.insert().values(name=name, next_hi=first_hi + blocks))
+                    return first_hi + blocks
+                except IntegrityError:
+                    # another process seeded the table first, retry the update
+                    pass
+
+ALLOCATORS = {
+    'identity': lambda config: IdentityAllocator(),
+    'hilo': lambda config: HiLoAllocator(config['ID_BLOCK_SIZE'])
+}
+
+def get_allocator():
+    """
+    Gets the id allocator configured by ID_ALLOCATOR for the current app.
+    ID_ALLOCATOR is either the name of a built in allocator or an object with allocate and reserve methods.
+
+    :return: The id allocator.
+    """
+    allocator = current_app.extensions.get('id_allocator')
+    if allocator is None:
+        allocator = current_app.config['ID_ALLOCATOR']
+        if isinstance(allocator, str):
+            allocator = ALLOCATORS[allocator](current_app.config)
+        current_app.extensions['id_allocator'] = allocator
+    return allocator
+
+def allocate_id(model: db.Model) -> int:
+    """
+    Allocates a primary key for a new row.
+
+    :param model: The model of the row.
+
+    :return: The primary key, None if the database assigns it on insert.
+    """
+    return get_allocator().allocate(model)
+
+def reserve_ids(model: db.Model, count: int) -> list[int]:
+    """
+    Reserves primary keys for a batch of new rows.
+
+    :param model: The model of the rows.
+    :param count: The number of keys to reserve.
+
+    :return: A list of count primary keys, None if the database assigns them on insert.
+    """
+    return get_allocator().reserve(model, count)
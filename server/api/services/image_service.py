@@ -0,0 +1,374 @@
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from flask import current_app, url_for
+from sqlalchemy import func, select
+from werkzeug.datastructures import FileStorage
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+class ImageTooLarge(Exception):
+    """
+    Raised when an uploaded image is larger than IMAGE_MAX_BYTES.
+    """
+
+class InvalidImage(Exception):
+    """
+    Raised when an upload is not a JPEG, PNG, GIF or WebP image.
+    """
+
+# name -> bounding box, every variant is written in the original format and as WebP
+VARIANTS = {
+    'thumbnail': (150, 150),
+    'grid': (400, 400),
+    'detail': (1200, 1200)
+}
+
+CHUNK_SIZE = 64 * 1024
+# stored images are named after the SHA-256 of their contents
+DIGEST_NAME = re.compile(r'^[0-9a-f]{64}$')
+# format -> the extension images of it are stored with. Only raster formats are accepted, a stored image is served
+# from this origin and a format like HTML or SVG would run scripts in it
+FORMATS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif', 'WEBP': '.webp'}
+# extension -> the content type images and derivatives are sent with
+MIMETYPES = {'.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png', '.gif': 'image/gif', '.webp': 'image/webp'}
+# leading bytes -> format, checks uploads when Pillow is not installed, WebP is RIFF....WEBP
+SIGNATURES = {b'\xff\xd8\xff': 'JPEG', b'\x89PNG\r\n\x1a\n': 'PNG', b'GIF87a': 'GIF', b'GIF89a': 'GIF'}
+
+# held while placing or releasing an image on databases without advisory locks
+store_lock = threading.Lock()
+
+_pool = None
+
+# (path, mtime, size) -> content hash, bounded to HASH_CACHE_SIZE entries
+HASH_CACHE_SIZE = 4096
+_hashes = OrderedDict()
+_hashes_lock = threading.Lock()
+
+def stored_path(path: str) -> str:
+    """
+    Resolves the path of a stored image, following symbolic links, and checks that it is inside IMAGE_STORE_DIR.
+    Paths come from the database, never open or delete one that was not checked.
+
+    :param path: The path of the image.
+
+    :return: The absolute path of the image, none if the path is empty or outside of IMAGE_STORE_DIR.
+    """
+    if not path:
+        return None
+    store_directory = os.path.realpath(current_app.config['IMAGE_STORE_DIR'])
+    resolved = os.path.realpath(path)
+    if resolved == store_directory or os.path.commonpath([store_directory, resolved]) != store_directory:
+        return None
+    return resolved
+
+def detect_format(path: str) -> str:
+    """
+    Finds the format of an uploaded file from its contents, never from its name.
+    With Pillow installed the file has to open and pass verify(), otherwise only its leading bytes are checked.
+
+    :param path: The path of the file.
+
+    :return: A key of FORMATS, None if the file is not an image in one of them.
+    """
+    if Image is not None:
+        try:
+            with Image.open(path, formats=list(FORMATS)) as image:
+                image_format = image.format
+                image.verify()
+        except Exception:
+            # Pillow raises many error types for files it cannot read, including decompression bombs
+            return None
+        return image_format if image_format in FORMATS else None
+
+    with open(path, 'rb') as file:
+        head = file.read(12)
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP'
+    for signature, image_format in SIGNATURES.items():
+        if head.startswith(signature):
+            return image_format
+    return None
+
+def mimetype(path: str) -> str:
+    """
+    Gets the content type to send a stored image or derivative with.
+
+    :param path: The path of the file.
+
+    :return: The image type of its extension, application/octet-stream for files stored before uploads were checked.
+    """
+    return MIMETYPES.get(os.path.splitext(path)[1].lower(), 'application/octet-stream')
+
+def variant_path(path: str, variant: str, webp: bool = False) -> str:
+    """
+    Gets the path of a derivative of an image.
+
+    :param path: The path of the original image.
+    :param variant: The name of the variant.
+    :param webp: True for the WebP version, false for the version in the original format.
+
+    :return: The path of the derivative.
+    """
+    stem, extension = os.path.splitext(path)
+    return f'{stem}_{variant}{".webp" if webp else extension}'
+
+def content_hash(path: str) -> str:
+    """
+    Gets a short hash of the contents of a file. Hashes are cached until the file changes.
+
+    :param path: The path of the file.
+
+    :return: The first 16 hex digits of the SHA-256 of the file, none if the file does not exist or is outside of IMAGE_STORE_DIR.
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    if DIGEST_NAME.match(name):
+        return name[:16]
+
+    path = stored_path(path)
+    if path is None:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _hashes_lock:
+        if key in _hashes:
+            _hashes.move_to_end(key)
+            return _hashes[key]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+
+    with _hashes_lock:
+        _hashes[key] = digest.hexdigest()[:16]
+        if len(_hashes) > HASH_CACHE_SIZE:
+            _hashes.popitem(last=False)
+        return _hashes[key]
+
+def variant_urls(id: int, path: str) -> dict:
+    """
+    Gets the URLs that serve an image and its derivatives.
+    URLs are versioned with the hash of the original, which every derivative is rendered from,
+    so they can be cached forever.
+
+    :param id: The ID of the item.
+    :param path: The path of the original image.
+
+    :return: A dict of variant name to the URLs of its original format and WebP versions, none if there is no image.
+    """
+    if not path:
+        return None
+
+    version = content_hash(path)
+    urls = {'original': {'src': url_for('api.item.get_item_image', id=id, v=version)}}
+    for variant in VARIANTS:
+        urls[variant] = {
+            'src': url_for('api.item.get_item_image', id=id, variant=variant, v=version),
+            'webp': url_for('api.item.get_item_image', id=id, variant=variant, format='webp', v=version)
+        }
+    return urls
+
+def resolve_image(path: str, variant: str = None, webp: bool = False) -> tuple[str, bool]:
+    """
+    Finds the file to serve for a variant of an image.
+    Falls back to the original while the derivative is still being rendered.
+
+    :param path: The path of the original image.
+    :param variant: The name of the variant, none for the original.
+    :param webp: True for the WebP version of the variant.
+
+    :return: A tuple containing the path of the file and true if it is the file that was asked for.
+    :raises ValueError: If the variant does not exist.
+    """
+    if variant is None:
+        return path, True
+    if variant not in VARIANTS:
+        raise ValueError(f'Unknown image variant {variant}')
+
+    derivative = variant_path(path, variant, webp)
+    if os.path.exists(derivative):
+        return derivative, True
+    return path, False
+
+def _save(image, path: str, **options):
+    # write next to the final path and swap it in, so readers never see a partial file
+    temp_path = path + '.tmp'
+    image.save(temp_path, **options)
+    os.replace(temp_path, path)
+
+def _render(path: str, variants: dict, quality: int) -> list[str]:
+    """
+    Renders the derivatives of an image. Runs in a worker process.
+
+    :param path: The path of the original image.
+    :param variants: A dict of variant name to bounding box.
+    :param quality: The JPEG and WebP quality.
+
+    :return: The paths of the rendered derivatives.
+    """
+    written = []
+    with Image.open(path) as original:
+        image_format = original.format
+        original = ImageOps.exif_transpose(original)
+        for variant, size in variants.items():
+            image = original.copy()
+            image.thumbnail(size, Image.LANCZOS)
+
+            if image_format == 'JPEG':
+                _save(image.convert('RGB'), variant_path(path, variant), format='JPEG', quality=quality, optimize=True, progressive=True)
+            else:
+                _save(image, variant_path(path, variant), format=image_format, optimize=True)
+            written.append(variant_path(path, variant))
+
+            _save(image, variant_path(path, variant, webp=True), format='WEBP', quality=quality, method=4)
+            written.append(variant_path(path, variant, webp=True))
+    return written
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=current_app.config['IMAGE_WORKERS'])
+    return _pool
+
+def _log_result(path: str, future: Future):
+    error = future.exception()
+    if error:
+        logger.error('Failed to render derivatives of %s', path, exc_info=error)
+
+def generate_derivatives(path: str) -> Future:
+    """
+    Renders the derivatives of an image in the background. Returns without waiting for them.
+
+    :param path: The path of the original image.
+
+    :return: A future of the paths of the rendered derivatives, none if there is no image or Pillow is not installed.
+    """
+    if not path:
+        return None
+    if Image is None:
+        logger.warning('Pillow is not installed, skipping derivatives of %s', path)
+        return None
+
+    future = _get_pool().submit(_render, path, VARIANTS, current_app.config['IMAGE_QUALITY'])
+    future.add_done_callback(lambda done: _log_result(path, done))
+    return future
+
+def _delete_derivatives(path: str):
+    for variant in VARIANTS:
+        for webp in (False, True):
+            if os.path.exists(variant_path(path, variant, webp)):
+                os.remove(variant_path(path, variant, webp))
+
+def receive_image(image: FileStorage) -> tuple[str, str]:
+    """
+    Streams an uploaded image to a temporary file in IMAGE_STORE_DIR while it is hashed, so it is never
+    held in memory, and checks that it is an image. Pass the result to place_image to store it.
+
+    :param image: The uploaded image.
+
+    :return: A tuple containing the path of the temporary file and the path the image is stored at, named after
+    the SHA-256 of its contents with the extension of its detected format.
+    :raises ImageTooLarge: If the image is larger than IMAGE_MAX_BYTES.
+    :raises InvalidImage: If the upload is not a JPEG, PNG, GIF or WebP image.
+    """
+    store_directory = current_app.config['IMAGE_STORE_DIR']
+    max_bytes = current_app.config['IMAGE_MAX_BYTES']
+    os.makedirs(store_directory, exist_ok=True)
+
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(dir=store_directory, suffix='.upload', delete=False) as temp_file:
+        try:
+            for chunk in iter(lambda: image.stream.read(CHUNK_SIZE), b''):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ImageTooLarge(f'Image is larger than {max_bytes} bytes')
+                digest.update(chunk)
+                temp_file.write(chunk)
+        except BaseException:
+            temp_file.close()
+            os.remove(temp_file.name)
+            raise
+
+    image_format = detect_format(temp_file.name)
+    if image_format is None:
+        os.remove(temp_file.name)
+        raise InvalidImage('Image must be a JPEG, PNG, GIF or WebP file')
+    hex_digest = digest.hexdigest()
+    return temp_file.name, os.path.join(store_directory, hex_digest[:2], hex_digest + FORMATS[image_format])
+
+def place_image(temp_path: str, path: str) -> str:
+    """
+    Moves an image received by receive_image to its path in the store. Identical images are stored once,
+    and derivatives are only rendered for images that were not stored yet.
+    Call it under the lock of the image, see lock_statement, a concurrent release may be deleting the stored copy.
+
+    :param temp_path: The temporary file of the image.
+    :param path: The path the image is stored at.
+
+    :return: The path of the stored image.
+    """
+    if os.path.exists(path):
+        os.remove(temp_path)
+        return path
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(temp_path, path)
+    generate_derivatives(path)
+    return path
+
+def discard_upload(temp_path: str):
+    """
+    Removes the temporary file of an image that was received but not placed.
+
+    :param temp_path: The temporary file of the image.
+    """
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+def lock_statement(path: str):
+    """
+    Builds the statement that takes the PostgreSQL lock of a stored image until the end of the transaction.
+    Placing an image and the check that deletes it once no item references it both run under it, so an image
+    is never deleted while a concurrent write starts using it. Other databases use store_lock, which only
+    covers one process.
+
+    :param path: The path of the image.
+
+    :return: The select statement.
+    """
+    key = int.from_bytes(hashlib.sha256(path.encode()).digest()[:8], 'big', signed=True)
+    return select(func.pg_advisory_xact_lock(key))
+
+def delete_image(path: str) -> bool:
+    """
+    Deletes an image and its derivatives from the server.
+    Images are shared by every item with the same picture, only call it under the lock of the image
+    once no item references it. Paths outside of IMAGE_STORE_DIR are never deleted.
+
+    :param path: The path of the image.
+
+    :return: True if the image was deleted, false if the image does not exist or is outside of IMAGE_STORE_DIR.
+    """
+    path = stored_path(path)
+    if not path or not os.path.exists(path):
+        return False
+
+    os.remove(path)
+    _delete_derivatives(path)
+    return True
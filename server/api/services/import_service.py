@@ -0,0 +1,194 @@
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+from typing import IO, Iterator
+from flask import current_app
+from sqlalchemy import func, select
+from api import db
+from api.models.item import Item
+from api.services import item_service
+from api.services.id_allocator import reserve_ids
+from api.services.upsert import insert
+
+FORMATS = ('csv', 'ndjson')
+MODES = ('upsert', 'insert')
+# largest stock the integer column holds, a larger one would fail the whole batch on PostgreSQL
+MAX_STOCK = 2 ** 31 - 1
+
+# column -> maximum length of the text columns that can be imported.
+# image_url is not one of them, it holds a path of the image store and is only set by uploading an image
+TEXT_FIELDS = {'description': None, 'category': 255, 'size': 50, 'color': 50}
+
+def detect_format(filename: str) -> str:
+    """
+    Guesses the format of an import file from its extension.
+
+    :param filename: The name of the file.
+
+    :return: csv or ndjson, None if the extension is not known.
+    """
+    filename = (filename or '').lower()
+    if filename.endswith('.csv'):
+        return 'csv'
+    if filename.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    return None
+
+def _read_rows(stream: IO[bytes], format: str) -> Iterator[tuple[int, object]]:
+    """
+    Reads the rows of an import file one at a time.
+
+    :param stream: A binary stream of the file.
+    :param format: csv or ndjson.
+
+    :return: An iterator of the line number and the decoded row, or a ValueError if the line is not valid JSON.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if format == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, ValueError(f'Invalid JSON: {e}')
+
+def _validate(row) -> dict:
+    """
+    Validates an imported row and converts it to the values of an item.
+
+    :param row: The decoded row.
+
+    :return: A dict of column to value.
+    :raises ValueError: If the row is not a valid item.
+    """
+    if isinstance(row, ValueError):
+        raise row
+    if not isinstance(row, dict):
+        raise ValueError('Row must be an object')
+
+    name = row.get('name')
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError('name is required')
+    if len(name) > 255:
+        raise ValueError('name is longer than 255 characters')
+
+    try:
+        price = Decimal(str(row.get('price'))).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError(f"Invalid price {row.get('price')!r}")
+    if not price.is_finite() or price < 0 or price >= Decimal('1e8'):
+        raise ValueError(f"Invalid price {row.get('price')!r}")
+
+    # read as a decimal, int() would truncate 3.7 to 3
+    try:
+        stock = Decimal(str(row.get('stock') or 0))
+    except InvalidOperation:
+        raise ValueError(f"Invalid stock {row.get('stock')!r}")
+    if not stock.is_finite() or stock != stock.to_integral_value():
+        raise ValueError(f"stock must be a whole number, got {row.get('stock')!r}")
+    if stock < 0:
+        raise ValueError('stock cannot be negative')
+    if stock > MAX_STOCK:
+        raise ValueError(f'stock cannot be larger than {MAX_STOCK}')
+    stock = int(stock)
+
+    values = {'name': name.strip(), 'price': price, 'stock': stock}
+    for field, max_length in TEXT_FIELDS.items():
+        value = row.get(field) or None
+        if value is not None and not isinstance(value, str):
+            value = str(value)
+        if value is not None and max_length and len(value) > max_length:
+            raise ValueError(f'{field} is longer than {max_length} characters')
+        values[field] = value
+    return values
+
+def _write_batch(rows: list[dict], mode: str) -> int:
+    """
+    Writes a batch of items with one executemany INSERT ... ON CONFLICT (name) and commits it.
+
+    :param rows: The validated rows, with unique names.
+    :param mode: upsert to update items that already exist, insert to leave them untouched.
+
+    :return: The number of rows written.
+    """
+    if mode == 'insert':
+        existing = set(db.session.scalars(select(Item.name).where(Item.name.in_([row['name'] for row in rows]))))
+        rows = [row for row in rows if row['name'] not in existing]
+        if not rows:
+            return 0
+
+    new_ids = reserve_ids(Item, len(rows))
+    if new_ids is not None:
+        for row, new_id in zip(rows, new_ids):
+            row['id'] = new_id
+
+    stmt = insert(Item)
+    if mode == 'upsert':
+        columns = ['price', 'stock'] + list(TEXT_FIELDS)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Item.name],
+            set_={**{column: stmt.excluded[column] for column in columns}, 'updated_at': func.current_timestamp()}
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=[Item.name])
+
+    db.session.execute(stmt, rows)
+    db.session.commit()
+    return len(rows)
+
+def import_items(stream: IO[bytes], format: str, mode: str = 'upsert', batch_size: int = None) -> Iterator[dict]:
+    """
+    Streams an item catalog from a CSV or NDJSON file into the database.
+    Rows are validated as they are read and written in batches, so memory use does not
+    depend on the size of the file. Invalid rows are reported and skipped.
+
+    :param stream: A binary stream of the file.
+    :param format: csv or ndjson.
+    :param mode: upsert to update items with the same name, insert to skip them.
+    :param batch_size: The number of rows per batch, defaults to IMPORT_BATCH_SIZE.
+
+    :return: An iterator of events, an error event for every invalid row,
+    a progress event after every batch and a done event at the end.
+    :raises ValueError: If the format or mode is not supported.
+    """
+    if format not in FORMATS:
+        raise ValueError(f'Unsupported format {format}, expected one of {", ".join(FORMATS)}')
+    if mode not in MODES:
+        raise ValueError(f'Unsupported mode {mode}, expected one of {", ".join(MODES)}')
+    batch_size = batch_size or current_app.config['IMPORT_BATCH_SIZE']
+
+    counts = {'rows': 0, 'written': 0, 'skipped': 0, 'errors': 0}
+    # name -> row, a name can only be written once per statement
+    batch = {}
+
+    def flush():
+        written = _write_batch(list(batch.values()), mode)
+        counts['written'] += written
+        counts['skipped'] += len(batch) - written
+        batch.clear()
+        item_service.items_changed()
+        return {'type': 'progress', **counts}
+
+    for line, row in _read_rows(stream, format):
+        counts['rows'] += 1
+        try:
+            values = _validate(row)
+        except ValueError as e:
+            counts['errors'] += 1
+            yield {'type': 'error', 'line': line, 'error': str(e)}
+            continue
+
+        batch[values['name']] = values
+        if len(batch) >= batch_size:
+            yield flush()
+
+    if batch:
+        yield flush()
+    yield {'type': 'done', **counts}
@@ -1,66 +1,273 @@
 import os
-from sqlalchemy import func
+import threading
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from typing import Iterator
+from flask import copy_current_request_context, current_app, has_request_context
 from api.models.item import Item
+from api.replicas import replica
 from api import db
+from api.services import cache, catalog_service, image_service, listing_snapshot, search_service, stock_admission
+from api.services.pagination import clamp_limit, paginate
+from api.services.versions import dump_version, load_version, version_of
+from api.services.id_allocator import allocate_id
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 from werkzeug.datastructures import FileStorage
 
-def _upload_image(image: FileStorage, name: str) -> str:
+# cache namespaces: everything derived from the catalog, the pages of items, which show the stock
+# of every item on them, and one item, as item: followed by its ID
+CATALOG_NAMESPACE = 'items'
+PAGES_NAMESPACE = 'items:pages'
+ITEM_NAMESPACE = 'item:'
+# the namespaces a page of items and the values of one item are cached in
+PAGE_SCOPE = (CATALOG_NAMESPACE, PAGES_NAMESPACE)
+
+_refresh_lock = threading.Lock()
+
+def item_scope(id: int) -> tuple[str, str]:
+    return (CATALOG_NAMESPACE, f'{ITEM_NAMESPACE}{id}')
+
+def page_key(sort: str, limit: int, cursor: str) -> str:
+    # the key of a page of items in PAGE_SCOPE, its validators are cached under version: followed by it
+    return f'list:{sort}:{limit}:{cursor or ""}'
+
+# the statements below are shared with the async services
+
+def row_statement(id: int):
+    return select(*Item.serialized_columns()).where(Item.id == id)
+
+def version_statement(id: int):
+    return select(Item.id, Item.updated_at).where(Item.id == id)
+
+def image_user_statement(image_url: str):
+    # finds an item that references an image
+    return select(Item.id).where(Item.image_url == image_url).limit(1)
+
+class ItemNameTaken(Exception):
+    """
+    Raised when an item is renamed to the name of another item.
     """
-    Uploads an image to the server.
 
-    :param image: An image file to upload.
+@contextmanager
+def _image_lock(image_url: str):
+    """
+    Holds the lock of a stored image for the with block and commits the session at its end.
+    Writes that start or stop referencing the image have to commit inside it.
 
-    :return: The image URL.
+    :param image_url: The image URL to lock.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(image_service.lock_statement(image_url))
+        lock = nullcontext()
+    else:
+        lock = image_service.store_lock
+    with lock:
+        try:
+            yield
+            db.session.commit()
+        except BaseException:
+            db.session.rollback()
+            raise
+
+def _name_taken(name: str, id: int = None) -> bool:
     """
-    image.filename = name + os.path.splitext(image.filename)[1]
-    save_directory = 'resources\\items'
-    if not os.path.exists(save_directory):
-        os.makedirs(save_directory)
+    Checks if an item other than the given one has a name, after a write failed on the unique name.
+    """
+    query = db.session.query(Item.id).filter(Item.name == name)
+    if id is not None:
+        query = query.filter(Item.id != id)
+    return query.first() is not None
 
-    file_path = os.path.join(save_directory, image.filename)
-    image.save(file_path)
+def _release_image(image_url: str) -> bool:
+    """
+    Deletes an image from the server once no item references it anymore.
+    Call it after the change that dropped the reference has been committed.
 
-    return file_path
+    :param image_url: The image URL to release.
 
-def _update_image_name(old_path: str, new_name: str) -> str:
+    :return: True if the image was deleted, false if it is still in use or does not exist.
     """
-    Updates an image name.
+    if not image_url:
+        return False
+    with _image_lock(image_url):
+        if db.session.execute(image_user_statement(image_url)).first():
+            return False
+        return image_service.delete_image(image_url)
 
-    :param old_path: The old image path.
-    :param new_name: The new image name.
+def items_changed(ids: list[int] = None):
+    """
+    Called after a write to the items table has been committed.
+    Invalidates everything derived from the catalog.
 
-    :return: The updated image name.
+    :param ids: The IDs of the items that were written, none if any item may have changed.
     """
-    if not old_path or not os.path.exists(old_path):
-        return None
-    
-    new_path = os.path.join(os.path.dirname(old_path), new_name + os.path.splitext(old_path)[1])
-    os.rename(old_path, new_path)
+    if ids is None:
+        cache.invalidate(CATALOG_NAMESPACE)
+    else:
+        cache.invalidate(PAGES_NAMESPACE, *[f'{ITEM_NAMESPACE}{id}' for id in ids])
+    search_service.refresh(ids)
+    catalog_service.catalog_changed()
+    stock_admission.reset(ids)
+    listing_snapshot.rebuild()
+
+def stock_reserved(ids: list[int]):
+    """
+    Called after a checkout took stock of items and was committed.
+    Only the stock changed and the admission counters already account for it, so they are kept.
+    The items and the pages of items are invalidated right away, the listing is rebuilt by _schedule_listing_rebuild.
 
-    return new_path
+    :param ids: The IDs of the items whose stock was taken.
+    """
+    cache.invalidate(PAGES_NAMESPACE, *[f'{ITEM_NAMESPACE}{id}' for id in ids])
+    catalog_service.catalog_changed()
+    _schedule_listing_rebuild()
+
+def _rebuild_listing(state: dict):
+    # checkouts committed from here on schedule the next rebuild, the ones before are read by this one
+    state['pid'] = None
+    try:
+        listing_snapshot.rebuild()
+    except Exception:
+        current_app.logger.exception('Failed to rebuild the item listing after a checkout')
+
+def _schedule_listing_rebuild():
+    """
+    Rebuilds the listing after a checkout, right away unless STOCK_REFRESH_DELAY is set.
+    With a delay it is rebuilt that many seconds later, once for every checkout of this process in the meantime,
+    so a flash sale does not rebuild it on every order.
+    The rebuild runs in a timer thread with a copy of the request context, which the listing needs to build image URLs.
+    Forked workers schedule their own.
+    """
+    state = current_app.extensions.setdefault('stock_refresh', {'pid': None})
+    if not current_app.config['STOCK_REFRESH_DELAY'] or not has_request_context():
+        _rebuild_listing(state)
+        return
+
+    with _refresh_lock:
+        if state['pid'] == os.getpid():
+            return
+        state['pid'] = os.getpid()
+    timer = threading.Timer(current_app.config['STOCK_REFRESH_DELAY'], copy_current_request_context(_rebuild_listing), args=(state,))
+    timer.daemon = True
+    timer.start()
+
+@replica()
+def get_items(limit: int = None, cursor: str = None, sort: str = 'id') -> tuple[list[Item], str]:
+    """
+    Gets a page of items from the database.
 
-def _delete_image(image_url: str) -> bool:
+    :param limit: The maximum number of items to return.
+    :param cursor: The cursor of the page to get, none for the first page.
+    :param sort: The column to order the items by, id or updated_at.
+
+    :return: A tuple containing a list of items and the cursor of the next page, none if there are no more items.
     """
-    Deletes an image from the server.
+    return paginate(Item.query, Item, limit, cursor, sort)
 
-    :param image_url: The image URL to delete.
-    
-    :return: True if the image was deleted, false if the image does not exist.
+def export_items() -> Iterator[dict]:
     """
-    if not image_url or not os.path.exists(image_url):
-        return False
-    
-    os.remove(image_url)
-    return True
+    Streams every item from the database in batches of EXPORT_BATCH_SIZE.
+
+    :return: An iterator of serialized items ordered by ID.
+    """
+    batch_size = current_app.config['EXPORT_BATCH_SIZE']
+    # rows of columns skip building an Item for every row
+    for row in db.session.query(*Item.serialized_columns()).order_by(Item.id).yield_per(batch_size):
+        yield Item.serialize_row(row)
+
+@replica()
+def get_items_serialized(limit: int = None, cursor: str = None, sort: str = 'id') -> tuple[list[dict], str]:
+    """
+    Gets a page of serialized items, read through the cache.
+
+    :param limit: The maximum number of items to return.
+    :param cursor: The cursor of the page to get, none for the first page.
+    :param sort: The column to order the items by, id or updated_at.
 
-def get_items() -> list[Item]:
+    :return: A tuple containing a list of serialized items and the cursor of the next page, none if there are no more items.
     """
-    Gets all items from the database.
+    limit = clamp_limit(limit)
+
+    def load():
+        rows, next_cursor = paginate(db.session.query(*Item.serialized_columns()), Item, limit, cursor, sort)
+        return {'data': [Item.serialize_row(row) for row in rows], 'next': next_cursor}
+
+    page = cache.cached(PAGE_SCOPE, page_key(sort, limit, cursor), load, current_app.config['ITEM_CACHE_TTL'])
+    return page['data'], page['next']
 
-    :return: A list of items.
+@replica()
+def search_items_serialized(q: str, limit: int = None, cursor: str = None) -> tuple[list[dict], str]:
     """
-    return Item.query.all()
+    Searches items, read through the cache.
 
+    :param q: The search query.
+    :param limit: The maximum number of items to return.
+    :param cursor: The cursor of the page to get, none for the first page.
+
+    :return: A tuple containing a list of serialized items, most relevant first, and the cursor of the next page, none if there are no more items.
+    :raises ValueError: If the cursor is invalid.
+    """
+    limit = clamp_limit(limit)
+    terms = ' '.join(search_service.tokenize(q))
+
+    def load():
+        rows, next_cursor = search_service.search_items(terms, limit, cursor)
+        return {'data': [Item.serialize_row(row) for row in rows], 'next': next_cursor}
+
+    page = cache.cached(PAGE_SCOPE, f'search:{limit}:{cursor or ""}:{terms}', load, current_app.config['ITEM_CACHE_TTL'])
+    return page['data'], page['next']
+
+@replica()
+def get_item_serialized(id: int) -> dict:
+    """
+    Gets a serialized item, read through the cache.
+
+    :param id: The ID of the item to get.
+
+    :return: The serialized item, none if the item does not exist.
+    """
+    def load():
+        row = db.session.execute(row_statement(id)).first()
+        return Item.serialize_row(row) if row else None
+
+    return cache.cached(item_scope(id), 'item', load, current_app.config['ITEM_CACHE_TTL'])
+
+@replica()
+def get_items_version(limit: int = None, cursor: str = None, sort: str = 'id') -> tuple[datetime, str]:
+    """
+    Gets the validators of a page of items from the ids and update times of its rows, read through the cache.
+
+    :param limit: The maximum number of items in the page.
+    :param cursor: The cursor of the page, none for the first page.
+    :param sort: The column the items are ordered by, id or updated_at.
+
+    :return: A tuple containing when the page was last modified and a fingerprint of the page.
+    """
+    limit = clamp_limit(limit)
+
+    def load():
+        rows, next_cursor = paginate(db.session.query(Item.id, Item.updated_at), Item, limit, cursor, sort)
+        return dump_version(version_of(rows, next_cursor))
+
+    return load_version(cache.cached(PAGE_SCOPE, f'version:{page_key(sort, limit, cursor)}', load, current_app.config['ITEM_CACHE_TTL']))
+
+@replica()
+def get_item_version(id: int) -> tuple[datetime, str]:
+    """
+    Gets the validators of an item without loading it, read through the cache.
+
+    :param id: The ID of the item.
+
+    :return: A tuple containing when the item was last modified and a fingerprint of the item, none if the item does not exist.
+    """
+    def load():
+        row = db.session.execute(version_statement(id)).first()
+        return dump_version(version_of([row])) if row else None
+
+    return load_version(cache.cached(item_scope(id), 'version', load, current_app.config['ITEM_CACHE_TTL']))
+
+@replica()
 def get_item(id: int) -> Item:
     """
     Gets an item from the database.
@@ -76,21 +283,39 @@ def create_item(item: Item, image: FileStorage) -> Item:
     Creates an item in the database.
 
     :param item: An item object.
+    :param image: An image file to upload.
 
     :return: The created item, none if the item name already exists.
+    :raises ImageTooLarge: If the image is larger than IMAGE_MAX_BYTES.
+    :raises InvalidImage: If the image is not a JPEG, PNG, GIF or WebP file.
     """
     item_exists = Item.query.filter_by(name=item.name).first()
     if item_exists:
         return None
-    # file name is name with file extension
-    item.image_url = _upload_image(image, item.name) if image else None
-
-    max_id = db.session.query(func.max(Item.id)).scalar()
-    new_id = int(max_id) + 1 if max_id else 1
-    item.id = new_id
-
-    db.session.add(item)
-    db.session.commit()
+    item.image_url = None
+    item.id = allocate_id(Item)
+
+    image_url = None
+    try:
+        if image:
+            temp_path, image_url = image_service.receive_image(image)
+            try:
+                with _image_lock(image_url):
+                    item.image_url = image_service.place_image(temp_path, image_url)
+                    db.session.add(item)
+            finally:
+                image_service.discard_upload(temp_path)
+        else:
+            db.session.add(item)
+            db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        # another request created an item with the same name since the check
+        if not _name_taken(item.name):
+            raise
+        _release_image(image_url)
+        return None
+    items_changed([item.id])
 
     return item
 
@@ -102,6 +327,7 @@ def update_item(id: int, new_item: Item) -> Item:
     :param new_item: An item object with the updated data.
 
     :return: The updated item, none if the item does not exist.
+    :raises ItemNameTaken: If another item has the new name.
     """
     item = Item.query.filter_by(id=id).first()
     if not item:
@@ -115,11 +341,14 @@ def update_item(id: int, new_item: Item) -> Item:
     item.color = new_item.color
     item.stock = new_item.stock
 
-    new_path = _update_image_name(item.image_url, new_item.name)
-    if not new_path:
-        item.image_url = None
-
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        if not _name_taken(new_item.name, id):
+            raise
+        raise ItemNameTaken(f'An item named {new_item.name} already exists')
+    items_changed([id])
 
     return item
 
@@ -131,15 +360,23 @@ def update_item_image(id: int, image: FileStorage) -> Item:
     :param image: An image file to upload.
 
     :return: The updated item, none if the item does not exist.
+    :raises ImageTooLarge: If the image is larger than IMAGE_MAX_BYTES.
+    :raises InvalidImage: If the image is not a JPEG, PNG, GIF or WebP file.
     """
     item = Item.query.filter_by(id=id).first()
     if not item:
         return None
     
-    deleted = _delete_image(item.image_url)
-    item.image_url = _upload_image(image, item.name)
-
-    db.session.commit()
+    old_image_url = item.image_url
+    temp_path, image_url = image_service.receive_image(image)
+    try:
+        with _image_lock(image_url):
+            item.image_url = image_service.place_image(temp_path, image_url)
+    finally:
+        image_service.discard_upload(temp_path)
+    items_changed([id])
+    if old_image_url != item.image_url:
+        _release_image(old_image_url)
 
     return item
 
@@ -155,8 +392,10 @@ def delete_item(id: int) -> bool:
     if not item:
         return False
     
-    deleted = _delete_image(item.image_url)
+    image_url = item.image_url
     db.session.delete(item)
     db.session.commit()
+    items_changed([id])
+    _release_image(image_url)
 
     return True
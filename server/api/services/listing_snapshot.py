@@ -0,0 +1,223 @@
+import gzip
+import hashlib
+import threading
+from flask import current_app, has_request_context
+from redis import RedisError
+from werkzeug.datastructures import Accept
+from api import db
+from api.models.item import Item
+from api.services.pagination import clamp_limit, paginate
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# incremented before every build, a higher version has seen every write committed before a lower one was numbered
+VERSION_KEY = 'listing:version'
+# the version of the snapshot being served
+CURRENT_KEY = 'listing:current'
+# followed by the version, a hash of content coding -> body
+SNAPSHOT_PREFIX = 'listing:'
+# seconds a replaced snapshot is kept for processes that read the old version just before it was replaced
+RETIRED_TTL = 60
+
+# stores a snapshot and makes it current unless a newer one already is, returns 1 if it did
+PUBLISH_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local version = tonumber(ARGV[1])
+if version <= current then
+    return 0
+end
+redis.call('HSET', ARGV[3] .. version, unpack(ARGV, 4))
+redis.call('SET', KEYS[1], version)
+if current > 0 then
+    redis.call('EXPIRE', ARGV[3] .. current, ARGV[2])
+end
+return 1
+"""
+
+class Listing:
+    """
+    The response of GET /item without arguments, the first page of items by ID, encoded as JSON once
+    and compressed with gzip and, if it is installed, brotli.
+    """
+
+    def __init__(self, version: int, bodies: dict[str, bytes]):
+        """
+        :param version: The number of the build, from VERSION_KEY.
+        :param bodies: Content coding -> body, identity for the uncompressed JSON.
+        """
+        self.version = version
+        self.bodies = bodies
+        # Redis may have lost VERSION_KEY and numbered a different catalog the same, the digest keeps ETags apart
+        self.digest = hashlib.sha1(bodies['identity']).hexdigest()[:16]
+
+    @classmethod
+    def build(cls, version: int, body: bytes) -> 'Listing':
+        """
+        Compresses a body with every content coding.
+
+        :param version: The number of the build.
+        :param body: The JSON of the response.
+
+        :return: The listing.
+        """
+        bodies = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            bodies['br'] = brotli.compress(body, quality=current_app.config['LISTING_BROTLI_QUALITY'])
+        return cls(version, bodies)
+
+    def negotiate(self, accept_encodings: Accept) -> str:
+        """
+        Picks the content coding to send.
+
+        :param accept_encodings: The Accept-Encoding header of the request.
+
+        :return: The content coding, br or gzip if the client accepts them, identity otherwise.
+        """
+        return accept_encodings.best_match([encoding for encoding in ('br', 'gzip') if encoding in self.bodies]) or 'identity'
+
+    def etag(self, encoding: str) -> str:
+        """
+        Gets the entity tag of the listing in a content coding, every coding is a different representation.
+
+        :param encoding: The content coding.
+
+        :return: The strong entity tag.
+        """
+        etag = f'listing-{self.version}-{self.digest}'
+        return etag if encoding == 'identity' else f'{etag}-{encoding}'
+
+def enabled() -> bool:
+    return current_app.config['LISTING_SNAPSHOT']
+
+def _client():
+    return current_app.config['CACHE_REDIS']
+
+def snapshot_key(version: int) -> str:
+    return f'{SNAPSHOT_PREFIX}{version}'
+
+def _state() -> dict:
+    state = current_app.extensions.get('listing')
+    if state is None:
+        state = current_app.extensions.setdefault('listing', {
+            'listing': None,
+            'lock': threading.Lock()
+        })
+    return state
+
+def current() -> Listing:
+    """
+    Gets the listing this process has in memory.
+
+    :return: The listing, None if it has none yet.
+    """
+    return _state()['listing']
+
+def kept(version) -> Listing:
+    """
+    Gets the listing this process has in memory if it is the one Redis points to.
+
+    :param version: The value of CURRENT_KEY, None if Redis has no listing.
+
+    :return: The listing, None if Redis points to another or to none.
+    """
+    listing = current()
+    if version is not None and listing is not None and listing.version == int(version):
+        return listing
+    return None
+
+def keep(listing: Listing) -> Listing:
+    """
+    Keeps the listing Redis points to in memory, requests are served from it until Redis points to another.
+
+    :param listing: The listing.
+
+    :return: The listing.
+    """
+    _state()['listing'] = listing
+    return listing
+
+def load(version: int, fields: dict) -> Listing:
+    """
+    Converts a snapshot read from Redis to a listing.
+
+    :param version: The version of the snapshot.
+    :param fields: The hash of the snapshot, content coding -> body.
+
+    :return: The listing, None if the snapshot is missing.
+    """
+    if not fields:
+        return None
+    return Listing(version, {encoding.decode(): body for encoding, body in fields.items()})
+
+def _encode() -> bytes:
+    """
+    Encodes the first page of items by ID, the same bytes jsonify gives the route.
+    Writes outside of a request, like flask import-items, build the image URLs as a request to the app's root would.
+    """
+    if not has_request_context():
+        with current_app.test_request_context():
+            return _encode()
+    rows, next_cursor = paginate(db.session.query(*Item.serialized_columns()), Item, clamp_limit(), None, 'id')
+    page = {'data': [Item.serialize_row(row) for row in rows], 'next': next_cursor}
+    return current_app.json.response(page).get_data()
+
+def rebuild() -> Listing:
+    """
+    Builds the listing from the items table and makes it current, unless a newer one already is.
+    Call it after a write to the items table has been committed.
+
+    :return: The listing, None if listings are disabled or Redis is unavailable.
+    """
+    if not enabled():
+        return None
+
+    client = _client()
+    try:
+        version = client.incr(VERSION_KEY)
+        listing = Listing.build(version, _encode())
+        fields = [value for encoding, body in listing.bodies.items() for value in (encoding, body)]
+        published = client.register_script(PUBLISH_SCRIPT)(keys=[CURRENT_KEY], args=[version, RETIRED_TTL, SNAPSHOT_PREFIX] + fields)
+    except RedisError:
+        current_app.logger.exception('Failed to rebuild the item listing')
+        return None
+    # a listing numbered later was published first, it has seen this write too
+    return keep(listing) if published else listing
+
+def build_missing() -> Listing:
+    """
+    Builds the listing when Redis has none yet, one thread of the process at a time.
+
+    :return: The listing, None if Redis is unavailable.
+    """
+    state = _state()
+    with state['lock']:
+        # another thread may have built it while this one waited
+        try:
+            version = _client().get(CURRENT_KEY)
+        except RedisError:
+            return None
+        return kept(version) or rebuild()
+
+def get_listing() -> Listing:
+    """
+    Gets the current listing, from memory if this process has the version Redis points to,
+    from Redis otherwise, built on the spot only if Redis has none.
+
+    :return: The listing, None if listings are disabled or Redis is unavailable.
+    """
+    if not enabled():
+        return None
+
+    client = _client()
+    try:
+        version = client.get(CURRENT_KEY)
+        listing = kept(version)
+        if listing is not None:
+            return listing
+        listing = load(int(version), client.hgetall(snapshot_key(int(version)))) if version is not None else None
+    except RedisError:
+        return None
+    return keep(listing) if listing else build_missing()
@@ -0,0 +1,179 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Callable
+from flask import current_app
+from sqlalchemy import and_, or_
+from api import db
+
+SORT_KEYS = ('id', 'updated_at')
+# a cursor key outside a BIGINT cannot be bound as a parameter
+MAX_KEY = 2 ** 63 - 1
+
+def _encode_cursor(sort: str, row: db.Model) -> str:
+    """
+    Encodes the position of a row as an opaque cursor.
+
+    :param sort: The column the page is sorted by.
+    :param row: The last row of the page.
+
+    :return: A URL safe cursor string.
+    """
+    if sort == 'updated_at':
+        key = [row.updated_at.isoformat(), row.id]
+    else:
+        key = [row.id]
+    return _encode_key([sort] + key)
+
+def _encode_key(key: list) -> str:
+    """
+    Encodes the key values of a cursor as a URL safe string.
+
+    :param key: The sort name followed by the key values.
+
+    :return: A URL safe cursor string.
+    """
+    raw = json.dumps(key, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def _decode_cursor(cursor: str, sort: str) -> list:
+    """
+    Decodes a cursor created by _encode_cursor.
+
+    :param cursor: The cursor string.
+    :param sort: The column the page is sorted by.
+
+    :return: The key values of the last row of the previous page.
+    :raises ValueError: If the cursor is malformed or was made for a different sort.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        key = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+    if not isinstance(key, list) or not key or key[0] != sort:
+        raise ValueError('Invalid cursor')
+
+    if sort == 'updated_at':
+        if len(key) != 3 or not isinstance(key[1], str) or not _is_int(key[2]):
+            raise ValueError('Invalid cursor')
+        try:
+            return [datetime.fromisoformat(key[1]), key[2]]
+        except (TypeError, ValueError):
+            raise ValueError('Invalid cursor')
+
+    if len(key) != 2 or not _is_int(key[1]):
+        raise ValueError('Invalid cursor')
+    return [key[1]]
+
+def _is_int(value) -> bool:
+    # JSON true and false decode to bools, which are ints to isinstance
+    return isinstance(value, int) and not isinstance(value, bool) and -MAX_KEY <= value <= MAX_KEY
+
+def clamp_limit(limit: int = None) -> int:
+    """
+    Clamps a requested page size to the configured bounds.
+
+    :param limit: The requested page size, None for the default.
+
+    :return: A page size between 1 and PAGE_SIZE_MAX.
+    """
+    if limit is None:
+        return current_app.config['PAGE_SIZE_DEFAULT']
+    return max(1, min(limit, current_app.config['PAGE_SIZE_MAX']))
+
+def keyset(query, model: db.Model, limit: int = None, cursor: str = None, sort: str = 'id') -> tuple[object, int]:
+    """
+    Orders and filters a query or select statement down to one page of keyset pagination.
+    Rows are read in ascending order of the sort column with the id as a tie breaker,
+    so every page is an index range scan no matter how deep the cursor is.
+
+    :param query: The query or statement to paginate.
+    :param model: The model the query selects, must have id and updated_at columns.
+    :param limit: The page size, clamped to PAGE_SIZE_MAX.
+    :param cursor: The cursor returned with the previous page, None for the first page.
+    :param sort: The column to sort by, either id or updated_at.
+
+    :return: A tuple containing the query, limited to one row more than the page, and the clamped page size.
+    :raises ValueError: If the sort key or cursor is invalid.
+    """
+    if sort not in SORT_KEYS:
+        raise ValueError(f'Cannot sort by {sort}')
+    limit = clamp_limit(limit)
+
+    if sort == 'updated_at':
+        query = query.order_by(model.updated_at, model.id)
+        if cursor:
+            updated_at, id = _decode_cursor(cursor, sort)
+            query = query.filter(or_(
+                model.updated_at > updated_at,
+                and_(model.updated_at == updated_at, model.id > id)
+            ))
+    else:
+        query = query.order_by(model.id)
+        if cursor:
+            id, = _decode_cursor(cursor, sort)
+            query = query.filter(model.id > id)
+
+    # fetch one extra row to know if there is a next page
+    return query.limit(limit + 1), limit
+
+def keyset_page(rows: list, limit: int, sort: str = 'id') -> tuple[list, str]:
+    """
+    Cuts the rows of a query from keyset() down to the page.
+
+    :param rows: The rows of the query.
+    :param limit: The page size returned by keyset().
+    :param sort: The column the rows are sorted by.
+
+    :return: A tuple containing the rows of the page and the cursor of the next page, None if this is the last page.
+    """
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    return rows, _encode_cursor(sort, rows[-1])
+
+def paginate(query, model: db.Model, limit: int = None, cursor: str = None, sort: str = 'id') -> tuple[list, str]:
+    """
+    Fetches one page of a query using keyset pagination.
+
+    :param query: The query to paginate.
+    :param model: The model the query selects, must have id and updated_at columns.
+    :param limit: The page size, clamped to PAGE_SIZE_MAX.
+    :param cursor: The cursor returned with the previous page, None for the first page.
+    :param sort: The column to sort by, either id or updated_at.
+
+    :return: A tuple containing the rows of the page and the cursor of the next page, None if this is the last page.
+    :raises ValueError: If the sort key or cursor is invalid.
+    """
+    query, limit = keyset(query, model, limit, cursor, sort)
+    return keyset_page(query.all(), limit, sort)
+
+def paginate_offset(fetch: Callable[[int, int], list], limit: int = None, cursor: str = None, sort: str = 'rank') -> tuple[list, str]:
+    """
+    Fetches one page of an ordering that has no usable keyset, like search relevance, by offset.
+    Only use it where results are bounded, deep pages cost as much as every page before them.
+
+    :param fetch: Called with an offset and a count, returns at most count rows starting at offset.
+    :param limit: The page size, clamped to PAGE_SIZE_MAX.
+    :param cursor: The cursor returned with the previous page, None for the first page.
+    :param sort: The name of the ordering, a cursor is only valid for the ordering it was made for.
+
+    :return: A tuple containing the rows of the page and the cursor of the next page, None if this is the last page.
+    :raises ValueError: If the cursor is invalid.
+    """
+    limit = clamp_limit(limit)
+    offset = 0
+    if cursor:
+        offset, = _decode_cursor(cursor, sort)
+        if offset < 0:
+            raise ValueError('Invalid cursor')
+
+    # fetch one extra row to know if there is a next page
+    rows = fetch(offset, limit + 1)
+    if len(rows) <= limit:
+        return rows, None
+    return rows[:limit], _encode_key([sort, offset + limit])
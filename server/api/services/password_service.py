@@ -0,0 +1,74 @@
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+from api import metrics
+
+_pool = None
+_slots = None
+_pool_lock = threading.Lock()
+
+def _method() -> str:
+    config = current_app.config
+    return f"scrypt:{config['SCRYPT_N']}:{config['SCRYPT_R']}:{config['SCRYPT_P']}"
+
+def _get_pool() -> tuple[ProcessPoolExecutor, threading.BoundedSemaphore]:
+    global _pool, _slots
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=current_app.config['PASSWORD_HASH_WORKERS'])
+            _slots = threading.BoundedSemaphore(current_app.config['PASSWORD_HASH_CONCURRENCY'])
+    return _pool, _slots
+
+def _timed_call(function, *args) -> tuple:
+    # runs in the worker so the time does not include waiting for one
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+def _run(operation: str, function, *args):
+    """
+    Runs a hashing function on the password hashing pool and waits for the result.
+    At most PASSWORD_HASH_CONCURRENCY calls are handed to the pool at once, the rest wait their turn.
+    With PASSWORD_HASH_WORKERS set to 0 the function runs on the calling thread.
+    """
+    if not current_app.config['PASSWORD_HASH_WORKERS']:
+        result, seconds = _timed_call(function, *args)
+    else:
+        pool, slots = _get_pool()
+        with slots:
+            result, seconds = pool.submit(_timed_call, function, *args).result()
+    metrics.observe(metrics.PASSWORD_HASH_LATENCY, seconds, operation=operation)
+    return result
+
+def hash_password(password: str) -> str:
+    """
+    Hashes a password with the configured scrypt parameters.
+
+    :param password: The password in plain text.
+
+    :return: The password hash.
+    """
+    return _run('hash', generate_password_hash, password, _method(), current_app.config['PASSWORD_SALT_LENGTH'])
+
+def verify_password(password_hash: str, password: str) -> bool:
+    """
+    Checks a password against a hash made with any scrypt parameters.
+
+    :param password_hash: The stored password hash.
+    :param password: The password in plain text.
+
+    :return: True if the password is correct, False otherwise.
+    """
+    return _run('verify', check_password_hash, password_hash, password)
+
+def needs_rehash(password_hash: str) -> bool:
+    """
+    Checks if a hash was made with parameters other than the configured ones.
+
+    :param password_hash: The stored password hash.
+
+    :return: True if the password should be hashed again, False otherwise.
+    """
+    return password_hash.split('$', 1)[0] != _method()
@@ -0,0 +1,178 @@
+import re
+import threading
+from bisect import bisect_left, insort
+from flask import current_app
+from sqlalchemy import func, select
+from api import db
+from api.models.item import SEARCH_WEIGHTS, Item, search_document
+from api.services.pagination import paginate_offset
+
+# tsvector weight -> rank of a term found in a column of that weight, the defaults of Postgres' ts_rank
+WEIGHT_RANKS = {'A': 1.0, 'B': 0.4, 'C': 0.2, 'D': 0.1}
+MAX_TERMS = 8
+TOKEN = re.compile(r'\w+')
+
+def tokenize(text: str) -> list[str]:
+    """
+    Splits text into lowercase search terms, the way the simple text search configuration does.
+
+    :param text: The text to split.
+
+    :return: A list of terms in the order they appear.
+    """
+    return TOKEN.findall(text.lower()) if text else []
+
+class InvertedIndex:
+    """
+    An in-process index of item text for databases without full text search.
+    Maps every term to the items containing it, with terms kept sorted for prefix lookups.
+    The index only sees writes made through this process, so it is meant for SQLite test runs.
+    """
+
+    def __init__(self):
+        # term -> item ID -> rank of the term in the item
+        self.postings = {}
+        self.terms = []
+        # item ID -> terms of the item
+        self.documents = {}
+        self.lock = threading.Lock()
+
+    def _remove(self, id: int):
+        for term in self.documents.pop(id, ()):
+            posting = self.postings[term]
+            del posting[id]
+            if not posting:
+                del self.postings[term]
+                self.terms.pop(bisect_left(self.terms, term))
+
+    def add(self, item):
+        """
+        Indexes an item, replacing what was indexed for it before.
+
+        :param item: An item, or a row with the id and searched columns of an item.
+        """
+        ranks = {}
+        for column, weight in SEARCH_WEIGHTS.items():
+            for term in tokenize(getattr(item, column)):
+                ranks[term] = ranks.get(term, 0) + WEIGHT_RANKS[weight]
+
+        with self.lock:
+            self._remove(item.id)
+            self.documents[item.id] = list(ranks)
+            for term, rank in ranks.items():
+                if term not in self.postings:
+                    self.postings[term] = {}
+                    insort(self.terms, term)
+                self.postings[term][item.id] = rank
+
+    def remove(self, id: int):
+        """
+        Removes an item from the index.
+
+        :param id: The ID of the item to remove.
+        """
+        with self.lock:
+            self._remove(id)
+
+    def search(self, terms: list[str]) -> list[int]:
+        """
+        Finds the items that contain every term, as a whole word or as a prefix of one.
+
+        :param terms: The search terms.
+
+        :return: The IDs of the matching items, most relevant first and by ID on ties.
+        """
+        scores = None
+        with self.lock:
+            for prefix in terms:
+                # best rank of any indexed term starting with the prefix, per item
+                matches = {}
+                i = bisect_left(self.terms, prefix)
+                while i < len(self.terms) and self.terms[i].startswith(prefix):
+                    for id, rank in self.postings[self.terms[i]].items():
+                        if rank > matches.get(id, 0):
+                            matches[id] = rank
+                    i += 1
+
+                if scores is None:
+                    scores = matches
+                else:
+                    scores = {id: score + matches[id] for id, score in scores.items() if id in matches}
+                if not scores:
+                    return []
+
+        return sorted(scores, key=lambda id: (-scores[id], id))
+
+def _get_index() -> InvertedIndex:
+    """
+    Gets the in-process search index of the app, building it from the items table on first use.
+
+    :return: The search index.
+    """
+    index = current_app.extensions.get('item_search_index')
+    if index is None:
+        index = InvertedIndex()
+        columns = [getattr(Item, column) for column in SEARCH_WEIGHTS]
+        for row in db.session.query(Item.id, *columns).yield_per(current_app.config['EXPORT_BATCH_SIZE']):
+            index.add(row)
+        current_app.extensions['item_search_index'] = index
+    return index
+
+def _uses_database() -> bool:
+    return db.engine.dialect.name == 'postgresql'
+
+def refresh(ids: list[int] = None):
+    """
+    Brings the in-process index up to date after items were written. Postgres maintains its own index.
+
+    :param ids: The IDs of the items that were created, updated or deleted, none if any item may have changed.
+    """
+    index = current_app.extensions.get('item_search_index')
+    if index is None or _uses_database():
+        return
+    if not ids:
+        # rebuilt on the next search
+        current_app.extensions.pop('item_search_index', None)
+        return
+
+    columns = [getattr(Item, column) for column in SEARCH_WEIGHTS]
+    rows = {row.id: row for row in db.session.query(Item.id, *columns).filter(Item.id.in_(ids))}
+    for id in ids:
+        if id in rows:
+            index.add(rows[id])
+        else:
+            index.remove(id)
+
+def _search_database(terms: list[str], offset: int, count: int) -> list:
+    # every term is a prefix so the last word matches while it is still being typed
+    query = func.to_tsquery('simple', ' & '.join(f'{term}:*' for term in terms))
+    document = search_document()
+    rank = func.ts_rank(document, query)
+    statement = select(*Item.serialized_columns()).where(document.op('@@')(query)).order_by(rank.desc(), Item.id).offset(offset).limit(count)
+    return db.session.execute(statement).all()
+
+def _search_index(terms: list[str], offset: int, count: int) -> list:
+    ids = _get_index().search(terms)[offset:offset + count]
+    if not ids:
+        return []
+    rows = {row.id: row for row in db.session.query(*Item.serialized_columns()).filter(Item.id.in_(ids))}
+    return [rows[id] for id in ids if id in rows]
+
+def search_items(q: str, limit: int = None, cursor: str = None) -> tuple[list, str]:
+    """
+    Searches the name, description, category and color of items, most relevant first.
+    Every word of the query has to match the start of a word in the item.
+
+    :param q: The search query.
+    :param limit: The maximum number of items to return.
+    :param cursor: The cursor of the page to get, none for the first page.
+
+    :return: A tuple containing a list of rows of Item.serialized_columns and the cursor of the next page, none if there are no more items.
+    :raises ValueError: If the cursor is invalid.
+    """
+    terms = list(dict.fromkeys(tokenize(q)))[:MAX_TERMS]
+    if not terms:
+        return [], None
+
+    search = _search_database if _uses_database() else _search_index
+    return paginate_offset(lambda offset, count: search(terms, offset, count), limit, cursor)
@@ -0,0 +1,118 @@
+from flask import current_app
+from redis import RedisError
+from sqlalchemy import select
+from api import db
+from api.models.item import Item
+
+# item ID -> units left to admit, a hash so a bulk change can drop every counter at once
+COUNTERS_KEY = 'stock:admission'
+
+# checks every line before decrementing any, returns the first item that is missing a counter or is short
+ADMIT_SCRIPT = """
+for i = 1, #ARGV, 2 do
+    local left = redis.call('HGET', KEYS[1], ARGV[i])
+    if not left then
+        return {-1, ARGV[i]}
+    end
+    if tonumber(left) < tonumber(ARGV[i + 1]) then
+        return {0, ARGV[i]}
+    end
+end
+for i = 1, #ARGV, 2 do
+    redis.call('HINCRBY', KEYS[1], ARGV[i], -tonumber(ARGV[i + 1]))
+end
+return {1}
+"""
+
+# gives units back, unless the counter was dropped in the meantime and will be seeded again from the database
+RELEASE_SCRIPT = """
+for i = 1, #ARGV, 2 do
+    if redis.call('HEXISTS', KEYS[1], ARGV[i]) == 1 then
+        redis.call('HINCRBY', KEYS[1], ARGV[i], ARGV[i + 1])
+    end
+end
+return 1
+"""
+
+def enabled() -> bool:
+    return current_app.config['STOCK_ADMISSION']
+
+def _client():
+    return current_app.config['STOCK_REDIS']
+
+def _args(quantities: dict[int, int]) -> list:
+    return [value for item_id, quantity in sorted(quantities.items()) for value in (item_id, quantity)]
+
+def _seed(item_ids: list[int]):
+    """
+    Creates the counters of items from their stock in the database, leaving counters that already exist alone.
+
+    :param item_ids: The IDs of the items.
+    """
+    rows = db.session.execute(select(Item.id, Item.stock).where(Item.id.in_(item_ids))).all()
+    pipe = _client().pipeline(transaction=False)
+    for item_id, stock in rows:
+        pipe.hsetnx(COUNTERS_KEY, item_id, stock)
+    pipe.execute()
+
+def admit(quantities: dict[int, int]) -> int:
+    """
+    Takes units of every item from the Redis counters in one atomic step, before the database is touched.
+    Buyers of sold out items are turned away here without taking any row locks.
+    The counters are only a filter in front of the database, which still checks the stock of every line.
+    If Redis is unavailable every buyer is admitted.
+
+    :param quantities: Item ID -> quantity to take.
+
+    :return: None if the buyer was admitted, the ID of an item without enough units left otherwise.
+    """
+    if not enabled() or not quantities:
+        return None
+
+    client = _client()
+    try:
+        admit_script = client.register_script(ADMIT_SCRIPT)
+        for _ in range(2):
+            result = admit_script(keys=[COUNTERS_KEY], args=_args(quantities))
+            if result[0] != -1:
+                return None if result[0] == 1 else int(result[1])
+            _seed(list(quantities))
+    except RedisError:
+        current_app.logger.exception('Failed to admit checkout, falling back to the database')
+        return None
+
+    # an item was deleted between seeding and admitting, the database will report it
+    return None
+
+def release(quantities: dict[int, int]):
+    """
+    Gives back units taken by admit when the checkout did not go through.
+
+    :param quantities: Item ID -> quantity to give back.
+    """
+    if not enabled() or not quantities:
+        return
+
+    client = _client()
+    try:
+        client.register_script(RELEASE_SCRIPT)(keys=[COUNTERS_KEY], args=_args(quantities))
+    except RedisError:
+        current_app.logger.exception('Failed to release admitted stock')
+
+def reset(ids: list[int] = None):
+    """
+    Drops counters after stock was changed by something other than a checkout, they are seeded again on the next checkout.
+
+    :param ids: The IDs of the items whose stock changed, none to drop every counter.
+    """
+    if not enabled():
+        return
+
+    client = _client()
+    try:
+        if ids:
+            client.hdel(COUNTERS_KEY, *ids)
+        else:
+            client.delete(COUNTERS_KEY)
+    except RedisError:
+        current_app.logger.exception('Failed to reset stock counters')
@@ -0,0 +1,19 @@
+from sqlalchemy.dialects import postgresql, sqlite
+from api import db
+
+def insert(model: db.Model, dialect: str = None):
+    """
+    Creates an INSERT statement that supports ON CONFLICT clauses on the current database.
+
+    :param model: The model to insert into.
+    :param dialect: The name of the database dialect, that of the session's bind if not given.
+
+    :return: A dialect specific insert statement with on_conflict_do_update and on_conflict_do_nothing.
+    :raises NotImplementedError: If the database does not support ON CONFLICT.
+    """
+    dialect = dialect or db.session.get_bind(mapper=model).dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(model)
+    if dialect == 'sqlite':
+        return sqlite.insert(model)
+    raise NotImplementedError(f'Upserts are not supported on {dialect}')
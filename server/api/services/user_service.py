@@ -1,15 +1,97 @@
-from sqlalchemy import func
+from datetime import datetime
+from typing import Iterator
+from flask import current_app
 from api.models.user import User
+from api.replicas import primary, replica
 from api import db
+from api.services import cache, password_service
+from api.services.pagination import paginate
+from api.services.versions import version_of
+from api.services.id_allocator import allocate_id
 
-def get_users() -> list[User]:
+_session_users = None
+
+def session_user_cache() -> cache.LocalCache:
+    global _session_users
+    if _session_users is None:
+        _session_users = cache.LocalCache(
+            current_app.config['SESSION_USER_CACHE_SIZE'], current_app.config['SESSION_USER_TTL'])
+    return _session_users
+
+def _user_changed(id: int):
+    """
+    Called after a write to a user has been committed.
+    Invalidates the copies of the user stored with sessions and cached by this process.
+
+    :param id: The id of the user.
+    """
+    cache.invalidate(f'user:{id}')
+    session_user_cache().pop(id)
+
+@replica()
+def get_users(limit: int = None, cursor: str = None, sort: str = 'id') -> tuple[list[User], str]:
+    """
+    Gets a page of users from the database.
+
+    :param limit: The maximum number of users to return.
+    :param cursor: The cursor of the page to get, None for the first page.
+    :param sort: The column to order the users by, id or updated_at.
+
+    :return: A tuple containing a list of users and the cursor of the next page, None if there are no more users.
+    """
+    return paginate(User.query, User, limit, cursor, sort)
+
+@replica()
+def get_users_serialized(limit: int = None, cursor: str = None, sort: str = 'id') -> tuple[list[dict], str]:
+    """
+    Gets a page of serialized users, reading only the serialized columns instead of loading User objects.
+
+    :param limit: The maximum number of users to return.
+    :param cursor: The cursor of the page to get, None for the first page.
+    :param sort: The column to order the users by, id or updated_at.
+
+    :return: A tuple containing a list of serialized users and the cursor of the next page, None if there are no more users.
+    """
+    rows, next_cursor = paginate(db.session.query(*User.serialized_columns()), User, limit, cursor, sort)
+    return [User.serialize_row(row) for row in rows], next_cursor
+
+def export_users() -> Iterator[dict]:
+    """
+    Streams every user from the database in batches of EXPORT_BATCH_SIZE.
+
+    :return: An iterator of serialized users ordered by id.
+    """
+    batch_size = current_app.config['EXPORT_BATCH_SIZE']
+    for row in db.session.query(*User.serialized_columns()).order_by(User.id).yield_per(batch_size):
+        yield User.serialize_row(row)
+
+@replica()
+def get_users_version(limit: int = None, cursor: str = None, sort: str = 'id') -> tuple[datetime, str]:
+    """
+    Gets the validators of a page of users from the ids and update times of its rows.
+
+    :param limit: The maximum number of users in the page.
+    :param cursor: The cursor of the page, None for the first page.
+    :param sort: The column the users are ordered by, id or updated_at.
+
+    :return: A tuple containing when the page was last modified and a fingerprint of the page.
+    """
+    rows, next_cursor = paginate(db.session.query(User.id, User.updated_at), User, limit, cursor, sort)
+    return version_of(rows, next_cursor)
+
+@replica()
+def get_user_version(id: int) -> tuple[datetime, str]:
     """
-    Gets all users from the database.
+    Gets the validators of a user without loading it.
+
+    :param id: The id of the user.
 
-    :return: A list of users.
+    :return: A tuple containing when the user was last modified and a fingerprint of the user, None if the user does not exist.
     """
-    return User.query.all()
+    row = db.session.query(User.id, User.updated_at).filter_by(id=id).first()
+    return version_of([row]) if row else None
 
+@replica()
 def get_user(id) -> User:
     """
     Gets a user from the database.
@@ -21,6 +103,51 @@ def get_user(id) -> User:
     """
     return User.query.get(id)
 
+def stored_session_user(id: int, stored: dict, generation: int) -> dict:
+    """
+    Gets the user of the copy stored with a session if the user has not changed since it was made.
+
+    :param id: The id of the logged in user.
+    :param stored: The copy of the user stored with the session, None if there is none yet.
+    :param generation: The current generation of the user's cache namespace, None if Redis is unavailable.
+
+    :return: The serialized user, None if the copy is missing or stale.
+    """
+    if stored and generation is not None and stored.get('generation') == generation and stored['user']['id'] == id:
+        return stored['user']
+    return None
+
+def get_session_user(id: int, stored: dict = None) -> tuple[dict, dict]:
+    """
+    Gets the serialized user of a session without a database round trip when possible.
+    The user is read from a short lived in-process cache first, then from the copy stored
+    with the session if the user has not changed since it was made, then from the database.
+
+    :param id: The id of the logged in user.
+    :param stored: The copy of the user stored with the session, None if there is none yet.
+
+    :return: A tuple containing the serialized user and the copy to store with the session.
+    The user is None if it no longer exists.
+    """
+    user = session_user_cache().get(id)
+    if user is not None:
+        return user, stored
+
+    # read the generation before the user, so a concurrent update always leaves the copy stale
+    generation = cache.generation(f'user:{id}')
+    user = stored_session_user(id, stored, generation)
+    if user is None:
+        # stored with the generation read above, so it has to be the user as it is now
+        with primary():
+            found = get_user(id)
+        if not found:
+            return None, None
+        user = found.serialize()
+        stored = {'generation': generation, 'user': user}
+
+    session_user_cache().set(id, user)
+    return user, stored
+
 def register_user(username: str, password: str) -> User:
     """
     Creates a new user and adds it to the database.
@@ -34,11 +161,7 @@ def register_user(username: str, password: str) -> User:
     if user:
         return None
 
-    # Get the max id from the database and increment it by 1 to get the new id
-    max_id = db.session.query(func.max(User.id)).scalar()
-    new_id = int(max_id) + 1 if max_id else 1
-
-    new_user = User(id=new_id, username=username, password=password)
+    new_user = User(id=allocate_id(User), username=username, password=password)
 
     db.session.add(new_user)
     db.session.commit()
@@ -67,6 +190,7 @@ def update_user(user: User) -> tuple[User, str]:
         user_to_update.password = user.password
 
     db.session.commit()
+    _user_changed(user.id)
 
     return user_to_update, None
 
@@ -84,6 +208,7 @@ def delete_user(id: int) -> bool:
     
     db.session.delete(user)
     db.session.commit()
+    _user_changed(id)
 
     return True
 
@@ -102,5 +227,10 @@ def login(username: str, password: str):
     
     if not user.check_password(password):
         return None
+
+    # upgrade hashes made with outdated scrypt parameters while the password is at hand
+    if password_service.needs_rehash(user.password):
+        user.set_password(password)
+        db.session.commit()
     
     return user
@@ -0,0 +1,40 @@
+import hashlib
+from datetime import datetime
+
+def version_of(rows: list, *extra) -> tuple[datetime, str]:
+    """
+    Builds the validators of a resource from the key columns of its rows.
+
+    :param rows: Rows starting with an id followed by timestamps or counts.
+    :param extra: Any other values the representation depends on, like the next cursor.
+
+    :return: A tuple containing the latest timestamp of the rows and a fingerprint of every value.
+    """
+    values = [tuple(row) for row in rows] + list(extra)
+    last_modified = max((value for row in rows for value in row[1:] if isinstance(value, datetime)), default=None)
+    fingerprint = hashlib.sha1(repr(values).encode()).hexdigest()
+    return last_modified, fingerprint
+
+def dump_version(version: tuple[datetime, str]) -> list:
+    """
+    Converts a version to a JSON serializable list.
+
+    :param version: A version from version_of.
+
+    :return: A list of the timestamp in ISO format and the fingerprint.
+    """
+    last_modified, fingerprint = version
+    return [last_modified.isoformat() if last_modified else None, fingerprint]
+
+def load_version(data: list) -> tuple[datetime, str]:
+    """
+    Converts a list from dump_version back to a version.
+
+    :param data: A list from dump_version, or None.
+
+    :return: The version, None if data is None.
+    """
+    if data is None:
+        return None
+    last_modified, fingerprint = data
+    return datetime.fromisoformat(last_modified) if last_modified else None, fingerprint
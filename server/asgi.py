@@ -0,0 +1,5 @@
+from api import create_app
+from api.aio import create_async_app
+app = create_async_app(create_app())
+
+# hypercorn asgi:app
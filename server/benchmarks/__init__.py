@@ -0,0 +1,8 @@
+"""
+Offline benchmarks of every API route, run from the server directory:
+
+    python -m benchmarks --baseline benchmarks/baseline.json --save-baseline
+    python -m benchmarks --baseline benchmarks/baseline.json
+
+The database and Redis given with --database and --redis are wiped, by default a temporary SQLite file and fakeredis are used.
+"""
@@ -0,0 +1,150 @@
+import json
+import os
+import sys
+import tempfile
+from contextlib import nullcontext
+import click
+from sqlalchemy.engine import make_url
+
+# config connects nothing on import, but needs a Redis URL to parse
+os.environ.setdefault('REDIS_URL', 'redis://localhost:6379/0')
+
+DRIVERS = ('client', 'http')
+
+def _parse_overrides(overrides: tuple[str]) -> dict:
+    settings = {}
+    for override in overrides:
+        key, separator, value = override.partition('=')
+        if not separator:
+            raise click.BadParameter(f'{override} is not KEY=VALUE', param_hint='--config')
+        try:
+            settings[key] = json.loads(value)
+        except ValueError:
+            settings[key] = value
+    return settings
+
+def _redis_client(url: str):
+    if url == 'fake':
+        try:
+            import fakeredis
+        except ImportError:
+            raise click.UsageError('fakeredis is not installed, install it or pass --redis with the URL of a local Redis')
+        return fakeredis.FakeRedis()
+    import redis
+    client = redis.from_url(url)
+    try:
+        client.ping()
+    except redis.RedisError as e:
+        raise click.UsageError(f'Cannot connect to Redis at {url}: {e}')
+    return client
+
+@click.command()
+@click.option('--database', help='SQLAlchemy URL of a database the benchmark may wipe, a temporary SQLite file if not given.')
+@click.option('--redis', 'redis_url', default='fake', show_default=True, help='fake for fakeredis, or the URL of a Redis database the benchmark may flush.')
+@click.option('--users', default=200, show_default=True, help='Shoppers to seed, each with a cart.')
+@click.option('--items', default=1000, show_default=True, help='Items to seed.')
+@click.option('--lines', default=5, show_default=True, help='Lines in every seeded cart.')
+@click.option('--requests', default=200, show_default=True, help='Measured requests per scenario and driver.')
+@click.option('--warmup', default=10, show_default=True, help='Requests per scenario and driver sent before measuring.')
+@click.option('--concurrency', default=8, show_default=True, help='Concurrent connections of the HTTP driver.')
+@click.option('--driver', 'drivers', type=click.Choice(DRIVERS), multiple=True, help='Drivers to run, both if not given.')
+@click.option('--scenario', 'prefixes', multiple=True, help='Only run the scenarios whose name starts with this, like cart. or item.get.')
+@click.option('--seed', default=0, show_default=True, help='Seed of the dataset and the requests.')
+@click.option('--config', '-c', 'overrides', multiple=True, help='KEY=VALUE setting of the app, the value is parsed as JSON if it can be.')
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the results to this JSON file.')
+@click.option('--baseline', type=click.Path(dir_okay=False), help='Compare the results to this JSON file of an earlier run.')
+@click.option('--save-baseline', is_flag=True, help='Write the results to the --baseline file instead of comparing.')
+@click.option('--tolerance', default=0.2, show_default=True, help='How much slower a scenario may get than the baseline, 0.2 for 20%.')
+def main(database, redis_url, users, items, lines, requests, warmup, concurrency, drivers, prefixes, seed, overrides, output, baseline, save_baseline, tolerance):
+    """
+    Seeds a synthetic dataset and measures every API route, reporting the p50, p95 and p99 latency in milliseconds,
+    the requests per second and the queries per request of each. Exits with status 1 if a scenario regressed against the baseline.
+
+    Record a baseline on the machine you compare on, latencies from another machine mean little.
+    """
+    from config import ApplicationConfig
+    from api import create_app
+    from benchmarks import dataset as datasets
+    from benchmarks.report import compare, format_table
+    from benchmarks.runner import HttpDriver, Server, TestClientDriver, run_scenario
+    from benchmarks.scenarios import SCENARIOS
+
+    if save_baseline and not baseline:
+        raise click.UsageError('--save-baseline needs --baseline')
+    scenarios = {name: build for name, build in SCENARIOS.items() if not prefixes or name.startswith(prefixes)}
+    if not scenarios:
+        raise click.UsageError('No scenario matches --scenario')
+    drivers = drivers or DRIVERS
+
+    work_dir = tempfile.mkdtemp(prefix='benchmark-')
+    client = _redis_client(redis_url)
+    client.flushdb()
+    settings = {
+        'SQLALCHEMY_DATABASE_URI': database or f"sqlite:///{os.path.join(work_dir, 'benchmark.db')}",
+        'SECRET_KEY': os.getenv('SECRET_KEY') or 'benchmark',
+        'IMAGE_STORE_DIR': os.path.join(work_dir, 'images'),
+        # every response carries its query count, slow statements are not logged
+        'SQL_PROFILING': 'always',
+        'SLOW_QUERY_MS': 0,
+        **{name: client for name in dir(ApplicationConfig) if name.endswith('_REDIS')},
+        **_parse_overrides(overrides)
+    }
+    app = create_app(settings)
+
+    # every driver takes fresh pooled rows for its warm up and measured requests
+    spares = (requests + warmup) * len(drivers)
+    with app.app_context():
+        import api.models
+        click.echo(f'Seeding {users} users, {items} items and carts of {lines} lines into {settings["SQLALCHEMY_DATABASE_URI"]}', err=True)
+        dataset = datasets.seed(users, items, lines, spares, seed)
+
+    results = {}
+    for mode in drivers:
+        summaries = results[mode] = {}
+        with Server(app) if mode == 'http' else nullcontext() as server:
+            for number, (name, build) in enumerate(scenarios.items()):
+                if mode == 'http':
+                    connections = [HttpDriver('127.0.0.1', server.port) for _ in range(concurrency)]
+                else:
+                    # the test client measures the app on its own, one request at a time
+                    connections = [TestClientDriver(app)]
+                if warmup:
+                    run_scenario(connections, dataset, build, warmup, seed + number + 1)
+                summaries[name] = run_scenario(connections, dataset, build, requests, seed + number).summary()
+                for connection in connections:
+                    connection.close()
+                click.echo(f'[{mode}] {name} done', err=True)
+        click.echo(format_table(mode, summaries))
+
+    document = {
+        'settings': {
+            'database': make_url(settings['SQLALCHEMY_DATABASE_URI']).get_backend_name(),
+            'redis': 'fake' if redis_url == 'fake' else 'redis',
+            'users': users, 'items': items, 'lines': lines, 'requests': requests, 'concurrency': concurrency, 'seed': seed
+        },
+        'results': results
+    }
+    if output:
+        with open(output, 'w') as file:
+            json.dump(document, file, indent=2)
+    if not baseline:
+        return
+    if save_baseline:
+        with open(baseline, 'w') as file:
+            json.dump(document, file, indent=2)
+        click.echo(f'Baseline written to {baseline}')
+        return
+
+    with open(baseline) as file:
+        before = json.load(file)
+    if before['settings'] != document['settings']:
+        click.echo(f"Warning: the baseline was recorded with other settings: {before['settings']}", err=True)
+    regressions = compare(results, before['results'], tolerance)
+    for regression in regressions:
+        click.echo(f'Regression: {regression}')
+    if regressions:
+        sys.exit(1)
+    click.echo('No regressions against the baseline')
+
+if __name__ == '__main__':
+    main()
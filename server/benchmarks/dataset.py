@@ -0,0 +1,133 @@
+import random
+import threading
+from collections import deque
+from decimal import Decimal
+from sqlalchemy import insert, select
+from api import db
+from api.models.cart import Cart
+from api.models.cart_item import CartItem
+from api.models.item import Item
+from api.models.user import User
+from api.services import item_service, password_service
+from api.services.id_allocator import reserve_ids
+
+# every seeded user has this password, it is only hashed once
+PASSWORD = 'benchmark'
+
+CATEGORIES = ('shirts', 'pants', 'shoes', 'hats', 'jackets', 'socks', 'bags', 'belts')
+COLORS = ('black', 'white', 'red', 'blue', 'green', 'grey', 'brown', 'yellow')
+SIZES = ('XS', 'S', 'M', 'L', 'XL')
+ADJECTIVES = ('classic', 'vintage', 'slim', 'relaxed', 'organic', 'waterproof', 'lightweight', 'heavy')
+NOUNS = ('tee', 'hoodie', 'chino', 'sneaker', 'boot', 'beanie', 'parka', 'tote', 'sock', 'belt')
+
+# one-off rows that routes consume, every request takes a fresh one so runs are repeatable
+POOLS = ('user_update', 'user_delete', 'cart_create', 'cart_delete', 'checkout', 'item_delete')
+
+# plenty for every checkout of a run, so checkouts measure the happy path
+STOCK = 10 ** 6
+
+class Dataset:
+    """
+    The IDs of the rows seeded for a benchmark run.
+    Shoppers have a cart of K lines and are shared by every scenario, pooled rows are handed out once.
+    """
+
+    def __init__(self, shoppers: list[int], items: dict[int, dict], pools: dict[str, list[int]]):
+        self.shoppers = shoppers
+        # item ID -> the fields it was seeded with
+        self.items = items
+        self.item_ids = list(items)
+        self._pools = {name: deque(ids) for name, ids in pools.items()}
+        self._lock = threading.Lock()
+
+    def take(self, pool: str) -> int:
+        """
+        Takes an unused row from a pool.
+
+        :param pool: The name of the pool, one of POOLS.
+
+        :return: The ID of the row.
+        :raises LookupError: If the pool is used up.
+        """
+        with self._lock:
+            if not self._pools[pool]:
+                raise LookupError(f'The {pool} pool is used up, seed more spare rows')
+            return self._pools[pool].popleft()
+
+def _insert(model: db.Model, rows: list[dict], batch_size: int = 1000) -> list[int]:
+    """
+    Inserts rows into an empty table in batches and gets their IDs, reserved up front if the hi-lo allocator is on.
+    The table was empty, so IDs assigned by the database are read back in insertion order.
+
+    :param model: The model of the rows.
+    :param rows: The column values of the rows.
+    :param batch_size: The number of rows per INSERT.
+
+    :return: The IDs of the rows, in the order of rows.
+    """
+    if not rows:
+        return []
+    ids = reserve_ids(model, len(rows))
+    if ids is not None:
+        for row, id in zip(rows, ids):
+            row['id'] = id
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(insert(model), rows[start:start + batch_size])
+    db.session.commit()
+    if ids is None:
+        ids = list(db.session.scalars(select(model.id).order_by(model.id)))
+    return ids
+
+def _item_row(rng: random.Random, number: int) -> dict:
+    return {
+        'name': f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {number}',
+        'description': f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} for everyday wear',
+        'price': Decimal(rng.randint(100, 50000)).scaleb(-2),
+        'category': rng.choice(CATEGORIES),
+        'size': rng.choice(SIZES),
+        'color': rng.choice(COLORS),
+        'stock': STOCK
+    }
+
+def seed(users: int, items: int, lines: int, spares: int, seed: int = 0) -> Dataset:
+    """
+    Drops every table and fills the database with a synthetic dataset, the same one for the same arguments.
+
+    :param users: The number of shoppers, each with a cart.
+    :param items: The number of items in the catalog.
+    :param lines: The number of lines in each cart.
+    :param spares: The number of rows in every pool, one per request of the scenario that uses it.
+    :param seed: The seed of the random data.
+
+    :return: The IDs of the seeded rows.
+    """
+    rng = random.Random(seed)
+    db.drop_all()
+    db.create_all()
+
+    password = password_service.hash_password(PASSWORD)
+    pool_users = {name: spares for name in POOLS if name != 'item_delete'}
+    user_rows = [{'username': f'user{number}', 'password': password} for number in range(users + sum(pool_users.values()))]
+    user_ids = _insert(User, user_rows)
+    shoppers, rest = user_ids[:users], user_ids[users:]
+    pools = {}
+    for name, count in pool_users.items():
+        pools[name], rest = rest[:count], rest[count:]
+
+    item_rows = [_item_row(rng, number) for number in range(items + spares)]
+    item_ids = _insert(Item, item_rows)
+    catalog = {id: row for id, row in zip(item_ids[:items], item_rows[:items])}
+    pools['item_delete'] = item_ids[items:]
+
+    # shoppers and buyers get full carts, the carts of cart_delete are empty
+    with_lines = shoppers + pools['checkout']
+    db.session.execute(insert(Cart), [{'id': id} for id in with_lines + pools['cart_delete']])
+    db.session.commit()
+    _insert(CartItem, [
+        {'cart_id': cart_id, 'item_id': item_id, 'quantity': rng.randint(1, 3)}
+        for cart_id in with_lines
+        for item_id in rng.sample(list(catalog), min(lines, len(catalog)))
+    ])
+
+    item_service.items_changed()
+    return Dataset(shoppers, catalog, pools)
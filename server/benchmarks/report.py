@@ -0,0 +1,54 @@
+COLUMNS = ('requests', 'errors', 'p50_ms', 'p95_ms', 'p99_ms', 'throughput', 'queries')
+
+def _format(value) -> str:
+    if value is None:
+        return '-'
+    if isinstance(value, float):
+        return f'{value:.2f}'
+    return str(value)
+
+def format_table(mode: str, summaries: dict[str, dict]) -> str:
+    """
+    Lays out the summaries of a run as a text table.
+
+    :param mode: The driver the scenarios were run with.
+    :param summaries: Scenario name -> summary.
+
+    :return: The table, with the first error of every scenario that had errors below it.
+    """
+    rows = [(f'[{mode}]',) + COLUMNS] + [
+        (name,) + tuple(_format(summary[column]) for column in COLUMNS) for name, summary in summaries.items()
+    ]
+    widths = [max(len(row[index]) for row in rows) for index in range(len(rows[0]))]
+    lines = ['  '.join(cell.ljust(width) if index == 0 else cell.rjust(width) for index, (cell, width) in enumerate(zip(row, widths))) for row in rows]
+    lines += [f"  {name}: {summary['first_error']}" for name, summary in summaries.items() if summary.get('first_error')]
+    return '\n'.join(lines)
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Finds the scenarios that got slower or run more queries than in the baseline.
+    Latencies are compared at p50 and p95, p99 moves too much between runs to compare.
+
+    :param results: Mode -> scenario name -> summary of this run.
+    :param baseline: The results of the baseline run, in the same shape.
+    :param tolerance: How much slower a scenario may get, 0.2 for 20%.
+
+    :return: A line for every regression.
+    """
+    regressions = []
+    for mode, summaries in results.items():
+        for name, summary in summaries.items():
+            before = baseline.get(mode, {}).get(name)
+            if not before:
+                continue
+            for column in ('p50_ms', 'p95_ms'):
+                if before[column] and summary[column] > before[column] * (1 + tolerance):
+                    regressions.append(
+                        f'[{mode}] {name}: {column} {before[column]:.2f} -> {summary[column]:.2f} ({summary[column] / before[column] - 1:+.0%})'
+                    )
+            # queries per request do not depend on the machine, any increase counts
+            if before['queries'] is not None and summary['queries'] is not None and summary['queries'] > before['queries'] + 0.01:
+                regressions.append(f"[{mode}] {name}: queries {before['queries']:.2f} -> {summary['queries']:.2f}")
+            if summary['errors'] > before['errors']:
+                regressions.append(f"[{mode}] {name}: errors {before['errors']} -> {summary['errors']}")
+    return regressions
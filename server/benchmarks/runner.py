@@ -0,0 +1,217 @@
+import http.client
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from flask import Flask
+from werkzeug.serving import make_server
+from werkzeug.test import EnvironBuilder
+from benchmarks.dataset import Dataset
+from benchmarks.scenarios import Call
+
+class Reply:
+    """
+    The parts of a response the benchmark looks at.
+    """
+
+    def __init__(self, status: int, body: bytes, queries: int):
+        self.status = status
+        self.body = body
+        # statements run before the response was returned, from the profiler's X-Query-Count header
+        self.queries = queries
+
+def _queries(headers) -> int:
+    count = headers.get('X-Query-Count')
+    return int(count) if count is not None else None
+
+class TestClientDriver:
+    """
+    Sends requests through Flask's test client, measuring the app without a server or sockets in the way.
+    """
+
+    def __init__(self, app: Flask):
+        self.client = app.test_client()
+
+    def send(self, call: Call) -> Reply:
+        response = self.client.open(call.path, method=call.method, **call.options)
+        # reading the body runs streamed responses to the end
+        body = response.get_data()
+        response.close()
+        return Reply(response.status_code, body, _queries(response.headers))
+
+    def close(self):
+        pass
+
+class HttpDriver:
+    """
+    Sends requests over a keep-alive HTTP connection, with the cookies set by earlier responses.
+    """
+
+    def __init__(self, host: str, port: int):
+        self.connection = http.client.HTTPConnection(host, port, timeout=60)
+        self.cookies = SimpleCookie()
+
+    def send(self, call: Call) -> Reply:
+        builder = EnvironBuilder(call.path, method=call.method, **call.options)
+        try:
+            environ = builder.get_environ()
+            body = environ['wsgi.input'].read()
+            headers = {key: value for key, value in builder.headers.items() if key.lower() not in ('content-type', 'content-length')}
+            if environ.get('CONTENT_TYPE'):
+                # with the multipart boundary, which builder.content_type leaves out
+                headers['Content-Type'] = environ['CONTENT_TYPE']
+            if self.cookies:
+                headers['Cookie'] = '; '.join(f'{name}={morsel.value}' for name, morsel in self.cookies.items())
+            path = call.path + (f"?{environ['QUERY_STRING']}" if environ['QUERY_STRING'] else '')
+        finally:
+            builder.close()
+
+        self.connection.request(call.method, path, body=body or None, headers=headers)
+        response = self.connection.getresponse()
+        data = response.read()
+        for cookie in response.headers.get_all('Set-Cookie') or []:
+            self.cookies.load(cookie)
+        return Reply(response.status, data, _queries(response.headers))
+
+    def close(self):
+        self.connection.close()
+
+class Worker:
+    """
+    Runs the requests of a scenario on one thread, with its own driver, random numbers and state such as a login.
+    """
+
+    def __init__(self, driver, dataset: Dataset, rng: random.Random):
+        self.driver = driver
+        self.dataset = dataset
+        self.rng = rng
+        self.state = {}
+
+    def send(self, call: Call) -> Reply:
+        """
+        Sends a request that is not measured, for the setup of a scenario.
+
+        :param call: The request.
+
+        :return: The response.
+        :raises RuntimeError: If the response has an unexpected status.
+        """
+        reply = self.driver.send(call)
+        if reply.status != call.expect:
+            raise RuntimeError(f'{call.method} {call.path} returned {reply.status}: {reply.body[:200]!r}')
+        return reply
+
+class Result:
+    """
+    The measurements of one scenario.
+    """
+
+    def __init__(self):
+        self.latencies = []
+        self.queries = []
+        self.errors = 0
+        # the first unexpected response, to tell what went wrong
+        self.first_error = None
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, call: Call, reply: Reply, seconds: float):
+        with self._lock:
+            self.latencies.append(seconds)
+            if reply.queries is not None:
+                self.queries.append(reply.queries)
+            if reply.status != call.expect:
+                self.errors += 1
+                if self.first_error is None:
+                    self.first_error = f'{call.method} {call.path} returned {reply.status}: {reply.body[:200]!r}'
+
+    def summary(self) -> dict:
+        """
+        Sums up the measurements.
+
+        :return: The number of requests and errors, the p50, p95 and p99 latency in milliseconds,
+        the requests per second and the mean number of queries per request.
+        """
+        latencies = sorted(self.latencies)
+        summary = {
+            'requests': len(latencies),
+            'errors': self.errors,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'throughput': len(latencies) / self.seconds if self.seconds else 0.0,
+            'queries': sum(self.queries) / len(self.queries) if self.queries else None
+        }
+        if self.first_error:
+            summary['first_error'] = self.first_error
+        return summary
+
+def percentile(values: list[float], percent: float) -> float:
+    """
+    Gets a percentile with the nearest rank method.
+
+    :param values: The sorted values.
+    :param percent: The percentile, from 0 to 100.
+
+    :return: The smallest value that at least percent of the values are less than or equal to, 0 if there are no values.
+    """
+    if not values:
+        return 0.0
+    rank = max(-(-len(values) * percent // 100), 1)
+    return values[int(rank) - 1]
+
+def _run_worker(worker: Worker, build, requests: int, result: Result):
+    for _ in range(requests):
+        call = build(worker)
+        start = time.perf_counter()
+        reply = worker.driver.send(call)
+        result.record(call, reply, time.perf_counter() - start)
+
+def run_scenario(drivers: list, dataset: Dataset, build, requests: int, seed: int) -> Result:
+    """
+    Sends the requests of a scenario, split over one thread per driver.
+
+    :param drivers: The drivers to send the requests with, one per concurrent worker.
+    :param dataset: The seeded rows.
+    :param build: The function that builds the next request, from SCENARIOS.
+    :param requests: The number of measured requests.
+    :param seed: The seed of the workers' random numbers.
+
+    :return: The measurements.
+    """
+    workers = [Worker(driver, dataset, random.Random(seed * 1000 + number)) for number, driver in enumerate(drivers)]
+    shares = [requests // len(workers) + (number < requests % len(workers)) for number in range(len(workers))]
+    result = Result()
+
+    start = time.perf_counter()
+    if len(workers) == 1:
+        _run_worker(workers[0], build, shares[0], result)
+    else:
+        with ThreadPoolExecutor(max_workers=len(workers)) as executor:
+            futures = [executor.submit(_run_worker, worker, build, share, result) for worker, share in zip(workers, shares)]
+            for future in futures:
+                future.result()
+    result.seconds = time.perf_counter() - start
+    return result
+
+class Server:
+    """
+    Serves the app with werkzeug's threaded server on a free local port, in a background thread.
+    """
+
+    def __init__(self, app: Flask):
+        # the access log would cost more than some of the routes
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.port = self.server.port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.thread.join()
@@ -0,0 +1,191 @@
+import base64
+import io
+import itertools
+import json
+from benchmarks.dataset import CATEGORIES, COLORS, NOUNS, PASSWORD, STOCK
+
+# a 1x1 PNG, small enough that image requests measure the route rather than the upload
+PIXEL_PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1PeAAAADElEQVR4nGM4IScHAAK2AQU0pnWqAAAAAElFTkSuQmCC'
+)
+
+# unique names for the rows created during a run, shared by every worker
+_numbers = itertools.count()
+
+class Call:
+    """
+    A request to send, in the keyword arguments of werkzeug's EnvironBuilder so both drivers can send it.
+    A response with a status other than expect counts as an error.
+    """
+
+    def __init__(self, method: str, path: str, expect: int = 200, **options):
+        self.method = method
+        self.path = path
+        self.expect = expect
+        self.options = options
+
+def _basic_auth(username: str, password: str) -> dict:
+    return {'Authorization': 'Basic ' + base64.b64encode(f'{username}:{password}'.encode()).decode()}
+
+def _item_form(fields: dict) -> dict:
+    # the item routes read the item as a JSON encoded JSON string from the data field
+    item = {key: str(value) if key == 'price' else value for key, value in fields.items() if key != 'id'}
+    return {'data': json.dumps(json.dumps(item))}
+
+def _new_item(worker) -> dict:
+    return {
+        'name': f'new {worker.rng.choice(NOUNS)} {next(_numbers)}',
+        'price': f'{worker.rng.randint(100, 50000) / 100:.2f}',
+        'stock': STOCK,
+        'description': 'created by the benchmark',
+        'category': worker.rng.choice(CATEGORIES),
+        'color': worker.rng.choice(COLORS)
+    }
+
+def _logged_in(worker):
+    if not worker.state.get('logged_in'):
+        worker.send(Call('POST', '/api/user/login/', headers=_basic_auth('user0', PASSWORD)))
+        worker.state['logged_in'] = True
+
+def user_login(worker) -> Call:
+    # shoppers were seeded first, as user0 to userN
+    number = worker.rng.randrange(len(worker.dataset.shoppers))
+    return Call('POST', '/api/user/login/', headers=_basic_auth(f'user{number}', PASSWORD))
+
+def user_session(worker) -> Call:
+    _logged_in(worker)
+    return Call('GET', '/api/user/session/')
+
+def user_list(worker) -> Call:
+    return Call('GET', '/api/user/', query_string={'limit': 50})
+
+def user_export(worker) -> Call:
+    return Call('GET', '/api/user/export/')
+
+def user_create(worker) -> Call:
+    return Call('POST', '/api/user/', expect=201, headers=_basic_auth(f'new{next(_numbers)}', PASSWORD))
+
+def user_get(worker) -> Call:
+    return Call('GET', f'/api/user/{worker.rng.choice(worker.dataset.shoppers)}/')
+
+def user_update(worker) -> Call:
+    user_id = worker.dataset.take('user_update')
+    return Call('PUT', f'/api/user/{user_id}/', json={'username': f'renamed{user_id}', 'password': PASSWORD})
+
+def user_delete(worker) -> Call:
+    return Call('DELETE', f"/api/user/{worker.dataset.take('user_delete')}/")
+
+def item_list(worker) -> Call:
+    return Call('GET', '/api/item/', query_string={'limit': 50})
+
+def item_listing(worker) -> Call:
+    # without arguments, served from the precompressed listing
+    return Call('GET', '/api/item/', headers={'Accept-Encoding': 'gzip, deflate, br'})
+
+def item_search(worker) -> Call:
+    return Call('GET', '/api/item/search/', query_string={'q': worker.rng.choice(NOUNS)[:3], 'limit': 20})
+
+def item_browse(worker) -> Call:
+    return Call('GET', '/api/item/browse/', query_string={'category': worker.rng.choice(CATEGORIES), 'color': worker.rng.choice(COLORS)})
+
+def item_export(worker) -> Call:
+    return Call('GET', '/api/item/export/')
+
+def item_import(worker) -> Call:
+    rows = [_new_item(worker) for _ in range(10)]
+    lines = ['name,price,stock,description,category,color'] + [
+        f"{row['name']},{row['price']},{row['stock']},{row['description']},{row['category']},{row['color']}" for row in rows
+    ]
+    file = (io.BytesIO('\n'.join(lines).encode()), 'items.csv')
+    return Call('POST', '/api/item/import/', data={'file': file})
+
+def item_create(worker) -> Call:
+    return Call('POST', '/api/item/', expect=201, data=_item_form(_new_item(worker)))
+
+def item_get(worker) -> Call:
+    return Call('GET', f'/api/item/{worker.rng.choice(worker.dataset.item_ids)}/')
+
+def item_update(worker) -> Call:
+    item_id = worker.rng.choice(worker.dataset.item_ids)
+    return Call('PUT', f'/api/item/{item_id}/', data=_item_form(worker.dataset.items[item_id]))
+
+def item_delete(worker) -> Call:
+    return Call('DELETE', f"/api/item/{worker.dataset.take('item_delete')}/")
+
+def item_image_update(worker) -> Call:
+    item_id = worker.rng.choice(worker.dataset.item_ids)
+    return Call('PUT', f'/api/item/image/{item_id}/', data={'image': (io.BytesIO(PIXEL_PNG), 'pixel.png')})
+
+def item_image_get(worker) -> Call:
+    item_id = worker.dataset.item_ids[0]
+    if not worker.state.get('image'):
+        worker.send(Call('PUT', f'/api/item/image/{item_id}/', data={'image': (io.BytesIO(PIXEL_PNG), 'pixel.png')}))
+        worker.state['image'] = True
+    return Call('GET', f'/api/item/image/{item_id}/')
+
+def cart_list(worker) -> Call:
+    return Call('GET', '/api/cart/', query_string={'limit': 50})
+
+def cart_export(worker) -> Call:
+    return Call('GET', '/api/cart/export/')
+
+def cart_get(worker) -> Call:
+    return Call('GET', f'/api/cart/{worker.rng.choice(worker.dataset.shoppers)}/')
+
+def cart_create(worker) -> Call:
+    return Call('POST', f"/api/cart/{worker.dataset.take('cart_create')}/", expect=201)
+
+def cart_delete(worker) -> Call:
+    return Call('DELETE', f"/api/cart/{worker.dataset.take('cart_delete')}/")
+
+def cart_add(worker) -> Call:
+    cart_id = worker.rng.choice(worker.dataset.shoppers)
+    return Call('PUT', f'/api/cart/item/{cart_id}/', json={'item_id': worker.rng.choice(worker.dataset.item_ids), 'quantity': 1})
+
+def cart_remove(worker) -> Call:
+    cart_id = worker.rng.choice(worker.dataset.shoppers)
+    return Call('DELETE', f'/api/cart/item/{cart_id}/', json={'item_id': worker.rng.choice(worker.dataset.item_ids)})
+
+def cart_update(worker) -> Call:
+    cart_id = worker.rng.choice(worker.dataset.shoppers)
+    item_ids = worker.rng.sample(worker.dataset.item_ids, min(3, len(worker.dataset.item_ids)))
+    return Call('POST', f'/api/cart/{cart_id}/items/', json={
+        'add': [{'item_id': item_ids[0], 'quantity': 1}],
+        'set': [{'item_id': item_id, 'quantity': 2} for item_id in item_ids[1:]]
+    })
+
+def cart_checkout(worker) -> Call:
+    return Call('POST', f"/api/cart/{worker.dataset.take('checkout')}/checkout/", expect=201)
+
+# name -> function that builds the next request of the scenario, one scenario per route of every blueprint
+SCENARIOS = {
+    'user.login': user_login,
+    'user.session': user_session,
+    'user.list': user_list,
+    'user.export': user_export,
+    'user.create': user_create,
+    'user.get': user_get,
+    'user.update': user_update,
+    'user.delete': user_delete,
+    'item.list': item_list,
+    'item.listing': item_listing,
+    'item.search': item_search,
+    'item.browse': item_browse,
+    'item.export': item_export,
+    'item.import': item_import,
+    'item.create': item_create,
+    'item.get': item_get,
+    'item.update': item_update,
+    'item.delete': item_delete,
+    'item.image_update': item_image_update,
+    'item.image_get': item_image_get,
+    'cart.list': cart_list,
+    'cart.export': cart_export,
+    'cart.get': cart_get,
+    'cart.create': cart_create,
+    'cart.delete': cart_delete,
+    'cart.add': cart_add,
+    'cart.remove': cart_remove,
+    'cart.update': cart_update,
+    'cart.checkout': cart_checkout
+}
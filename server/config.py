@@ -9,7 +9,94 @@ class ApplicationConfig:
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
 
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # comma separated URLs of read replicas of SQLALCHEMY_DATABASE_URI, the read services are spread over them
+    SQLALCHEMY_REPLICA_URIS = [uri for uri in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if uri]
+    # seconds between health checks of the replicas, one that failed is skipped until it passes a check
+    REPLICA_CHECK_INTERVAL = float(os.getenv('REPLICA_CHECK_INTERVAL', 5))
+    # seconds the reads of a client stay on the primary after it wrote, keep it above the replication lag
+    REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 10))
+
     SESSION_TYPE = 'redis'
     SESSION_PERMANENT = False
     SESSION_USE_SIGNER = True
     SESSION_REDIS = redis.from_url(os.environ.get('REDIS_URL'))
+
+    PAGE_SIZE_DEFAULT = int(os.getenv('PAGE_SIZE_DEFAULT', 50))
+    PAGE_SIZE_MAX = int(os.getenv('PAGE_SIZE_MAX', 200))
+    EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+    # bytes of NDJSON collected into one write of an export, the first row is always written on its own
+    EXPORT_CHUNK_BYTES = int(os.getenv('EXPORT_CHUNK_BYTES', 64 * 1024))
+    IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 1000))
+
+    # 'identity' lets the database assign primary keys, 'hilo' reserves blocks of ID_BLOCK_SIZE ids.
+    # identity moves the PostgreSQL sequences past existing keys on the first insert of a process, flask resync-ids does it by hand
+    ID_ALLOCATOR = os.getenv('ID_ALLOCATOR', 'identity')
+    ID_BLOCK_SIZE = int(os.getenv('ID_BLOCK_SIZE', 100))
+
+    CACHE_REDIS = SESSION_REDIS
+    CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 10000))
+    CACHE_MAX_ENTRY_BYTES = int(os.getenv('CACHE_MAX_ENTRY_BYTES', 1024 * 1024))
+    ITEM_CACHE_TTL = int(os.getenv('ITEM_CACHE_TTL', 300))
+    # serve GET /api/item/ without arguments from a copy encoded and compressed once per write to the items table
+    LISTING_SNAPSHOT = os.getenv('LISTING_SNAPSHOT', 'true').lower() == 'true'
+    # rebuilt after checkouts too, 11 is about a tenth smaller but takes milliseconds per write instead of a fraction of one
+    LISTING_BROTLI_QUALITY = int(os.getenv('LISTING_BROTLI_QUALITY', 5))
+    # seconds between checks of the items table for changes made by other processes
+    CATALOG_REFRESH_INTERVAL = float(os.getenv('CATALOG_REFRESH_INTERVAL', 1))
+    # seconds the stock shown by the listing may lag behind checkouts, which then rebuild it once per delay instead of
+    # once per order. 0 rebuilds it on every checkout. Items and pages of items are always current
+    STOCK_REFRESH_DELAY = float(os.getenv('STOCK_REFRESH_DELAY', 0))
+
+    # turn away buyers of sold out items with Redis counters before they reach the database
+    STOCK_ADMISSION = os.getenv('STOCK_ADMISSION', 'false').lower() == 'true'
+    STOCK_REDIS = SESSION_REDIS
+
+    # 'redis' keeps active carts in Redis and writes them to the database in the background every CART_FLUSH_INTERVAL seconds.
+    # Lines get their IDs when they are added, so it needs an ID_ALLOCATOR that reserves them up front like hilo
+    CART_STORE = os.getenv('CART_STORE', 'database')
+    CART_REDIS = SESSION_REDIS
+    CART_REDIS_TTL = int(os.getenv('CART_REDIS_TTL', 7 * 24 * 60 * 60))
+    CART_FLUSH_INTERVAL = float(os.getenv('CART_FLUSH_INTERVAL', 2))
+    CART_FLUSH_BATCH = int(os.getenv('CART_FLUSH_BATCH', 500))
+
+    IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+    IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', 82))
+    IMAGE_STORE_DIR = os.getenv('IMAGE_STORE_DIR', os.path.join('resources', 'items'))
+    IMAGE_MAX_BYTES = int(os.getenv('IMAGE_MAX_BYTES', 10 * 1024 * 1024))
+    # let a front end server send image files with X-Sendfile instead of a worker
+    USE_X_SENDFILE = os.getenv('USE_X_SENDFILE', 'false').lower() == 'true'
+    IMAGE_MAX_AGE = int(os.getenv('IMAGE_MAX_AGE', 365 * 24 * 60 * 60))
+
+    # hashes made with other parameters are upgraded on the next successful login
+    SCRYPT_N = int(os.getenv('SCRYPT_N', 32768))
+    SCRYPT_R = int(os.getenv('SCRYPT_R', 8))
+    SCRYPT_P = int(os.getenv('SCRYPT_P', 1))
+    PASSWORD_SALT_LENGTH = int(os.getenv('PASSWORD_SALT_LENGTH', 16))
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_CONCURRENCY = int(os.getenv('PASSWORD_HASH_CONCURRENCY', 4))
+
+    SESSION_USER_TTL = float(os.getenv('SESSION_USER_TTL', 5))
+    SESSION_USER_CACHE_SIZE = int(os.getenv('SESSION_USER_CACHE_SIZE', 10000))
+
+    # exposes Prometheus metrics on /metrics, needs prometheus_client
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+
+    # off, header to profile requests sent with an X-Profile-SQL header, or always. Keep it off in production
+    SQL_PROFILING = os.getenv('SQL_PROFILING', 'off').lower()
+    # statements slower than this are logged to api.sql.slow, 0 to turn the log off
+    SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 200))
+    # a statement run this many times in one request is reported as a possible N+1
+    N_PLUS_ONE_THRESHOLD = int(os.getenv('N_PLUS_ONE_THRESHOLD', 5))
+
+    # orjson encodes responses with orjson when it is installed, json always uses Python's json
+    JSON_ENCODER = os.getenv('JSON_ENCODER', 'orjson')
+
+    # the async routes of asgi.py, SQLALCHEMY_DATABASE_URI with the asyncpg or aiosqlite driver if not set
+    ASYNC_DATABASE_URL = os.getenv('ASYNC_DATABASE_URL')
+    # connections of the async engine, requests beyond them wait for one without holding a thread
+    ASYNC_POOL_SIZE = int(os.getenv('ASYNC_POOL_SIZE', 20))
+    ASYNC_MAX_OVERFLOW = int(os.getenv('ASYNC_MAX_OVERFLOW', 20))
+    # read with redis.asyncio by the async routes, has to be the Redis of SESSION_REDIS and CACHE_REDIS
+    ASYNC_REDIS_URL = os.getenv('REDIS_URL')
+    # requests beyond these Redis connections wait for one instead of failing
+    ASYNC_REDIS_MAX_CONNECTIONS = int(os.getenv('ASYNC_REDIS_MAX_CONNECTIONS', 100))
@@ -0,0 +1,59 @@
+-- Brings a PostgreSQL database created before the cart upserts, the catalog import and checkout up to date.
+-- Run it once: psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -f 001_unique_lines_and_orders.postgresql.sql
+BEGIN;
+
+-- items named like an item with a lower ID get their ID appended, so no item or cart line is dropped
+UPDATE items SET name = substr(name, 1, 240) || ' (' || id || ')'
+WHERE id NOT IN (SELECT min(id) FROM items GROUP BY name);
+ALTER TABLE items ADD CONSTRAINT items_name_key UNIQUE (name);
+
+-- duplicate lines of a cart are merged into the line with the lowest ID
+UPDATE cart_items SET quantity = (
+    SELECT sum(line.quantity) FROM cart_items AS line
+    WHERE line.cart_id = cart_items.cart_id AND line.item_id = cart_items.item_id
+)
+WHERE id IN (SELECT min(id) FROM cart_items GROUP BY cart_id, item_id HAVING count(*) > 1);
+DELETE FROM cart_items WHERE id NOT IN (SELECT min(id) FROM cart_items GROUP BY cart_id, item_id);
+ALTER TABLE cart_items ADD CONSTRAINT uq_cart_items_cart_id_item_id UNIQUE (cart_id, item_id);
+
+-- keyset pagination by updated_at, and the lookup that deletes an image once no item uses it
+CREATE INDEX ix_items_updated_at_id ON items (updated_at, id);
+CREATE INDEX ix_items_image_url ON items (image_url);
+CREATE INDEX ix_users_updated_at_id ON users (updated_at, id);
+CREATE INDEX ix_carts_updated_at_id ON carts (updated_at, id);
+
+-- full text search, the expression has to stay the same as search_document in api/models/item.py
+CREATE INDEX ix_items_search ON items USING gin ((((setweight(to_tsvector('simple', coalesce(name, '')), 'A') || setweight(to_tsvector('simple', coalesce(category, '')), 'B')) || setweight(to_tsvector('simple', coalesce(color, '')), 'B')) || setweight(to_tsvector('simple', coalesce(description, '')), 'C')));
+
+-- blocks of the hi-lo id allocator
+CREATE TABLE id_blocks (
+    name VARCHAR(255) NOT NULL,
+    next_hi BIGINT NOT NULL,
+    PRIMARY KEY (name)
+);
+
+CREATE TABLE orders (
+    id SERIAL NOT NULL,
+    user_id INTEGER NOT NULL,
+    total NUMERIC(12, 2) NOT NULL,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    PRIMARY KEY (id),
+    FOREIGN KEY (user_id) REFERENCES users (id)
+);
+CREATE INDEX ix_orders_user_id ON orders (user_id);
+CREATE INDEX ix_orders_updated_at_id ON orders (updated_at, id);
+
+CREATE TABLE order_items (
+    id SERIAL NOT NULL,
+    order_id INTEGER NOT NULL,
+    item_id INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    price NUMERIC(10, 2) NOT NULL,
+    PRIMARY KEY (id),
+    FOREIGN KEY (order_id) REFERENCES orders (id),
+    FOREIGN KEY (item_id) REFERENCES items (id)
+);
+CREATE INDEX ix_order_items_order_id ON order_items (order_id);
+
+COMMIT;
@@ -0,0 +1,68 @@
+-- Brings a SQLite database created before the cart upserts, the catalog import and checkout up to date.
+-- Run it once: sqlite3 path/to/database.db < 001_unique_lines_and_orders.sqlite.sql
+-- SQLite cannot add a constraint to a table, unique indexes take the place of the constraints of api/models.
+BEGIN;
+
+-- timestamps written by CURRENT_TIMESTAMP have no fraction, the app writes them with microseconds now
+-- and compares them as text, so the existing ones get the same format
+UPDATE users SET created_at = strftime('%Y-%m-%d %H:%M:%f000', created_at) WHERE length(created_at) = 19;
+UPDATE users SET updated_at = strftime('%Y-%m-%d %H:%M:%f000', updated_at) WHERE length(updated_at) = 19;
+UPDATE items SET created_at = strftime('%Y-%m-%d %H:%M:%f000', created_at) WHERE length(created_at) = 19;
+UPDATE items SET updated_at = strftime('%Y-%m-%d %H:%M:%f000', updated_at) WHERE length(updated_at) = 19;
+UPDATE carts SET created_at = strftime('%Y-%m-%d %H:%M:%f000', created_at) WHERE length(created_at) = 19;
+UPDATE carts SET updated_at = strftime('%Y-%m-%d %H:%M:%f000', updated_at) WHERE length(updated_at) = 19;
+UPDATE cart_items SET created_at = strftime('%Y-%m-%d %H:%M:%f000', created_at) WHERE length(created_at) = 19;
+UPDATE cart_items SET updated_at = strftime('%Y-%m-%d %H:%M:%f000', updated_at) WHERE length(updated_at) = 19;
+
+-- items named like an item with a lower ID get their ID appended, so no item or cart line is dropped
+UPDATE items SET name = substr(name, 1, 240) || ' (' || id || ')'
+WHERE id NOT IN (SELECT min(id) FROM items GROUP BY name);
+CREATE UNIQUE INDEX items_name_key ON items (name);
+
+-- duplicate lines of a cart are merged into the line with the lowest ID
+UPDATE cart_items SET quantity = (
+    SELECT sum(line.quantity) FROM cart_items AS line
+    WHERE line.cart_id = cart_items.cart_id AND line.item_id = cart_items.item_id
+)
+WHERE id IN (SELECT min(id) FROM cart_items GROUP BY cart_id, item_id HAVING count(*) > 1);
+DELETE FROM cart_items WHERE id NOT IN (SELECT min(id) FROM cart_items GROUP BY cart_id, item_id);
+CREATE UNIQUE INDEX uq_cart_items_cart_id_item_id ON cart_items (cart_id, item_id);
+
+-- keyset pagination by updated_at, and the lookup that deletes an image once no item uses it
+CREATE INDEX ix_items_updated_at_id ON items (updated_at, id);
+CREATE INDEX ix_items_image_url ON items (image_url);
+CREATE INDEX ix_users_updated_at_id ON users (updated_at, id);
+CREATE INDEX ix_carts_updated_at_id ON carts (updated_at, id);
+
+-- blocks of the hi-lo id allocator
+CREATE TABLE id_blocks (
+    name VARCHAR(255) NOT NULL,
+    next_hi BIGINT NOT NULL,
+    PRIMARY KEY (name)
+);
+
+CREATE TABLE orders (
+    id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    total NUMERIC(12, 2) NOT NULL,
+    created_at TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (id),
+    FOREIGN KEY (user_id) REFERENCES users (id)
+);
+CREATE INDEX ix_orders_user_id ON orders (user_id);
+CREATE INDEX ix_orders_updated_at_id ON orders (updated_at, id);
+
+CREATE TABLE order_items (
+    id INTEGER NOT NULL,
+    order_id INTEGER NOT NULL,
+    item_id INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    price NUMERIC(10, 2) NOT NULL,
+    PRIMARY KEY (id),
+    FOREIGN KEY (order_id) REFERENCES orders (id),
+    FOREIGN KEY (item_id) REFERENCES items (id)
+);
+CREATE INDEX ix_order_items_order_id ON order_items (order_id);
+
+COMMIT;
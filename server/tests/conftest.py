@@ -0,0 +1,61 @@
+import os
+import pytest
+
+# config connects nothing on import, but needs a Redis URL to parse
+os.environ.setdefault('REDIS_URL', 'redis://localhost:6379/0')
+
+fakeredis = pytest.importorskip('fakeredis')
+
+# in-process state derived from the database, dropped with it between tests
+DERIVED_STATE = ('listing', 'catalog', 'item_search_index', 'id_allocator', 'stock_refresh')
+
+@pytest.fixture(scope='session')
+def redis_server():
+    return fakeredis.FakeServer()
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory, redis_server):
+    """
+    The app, on a temporary SQLite database or the database of TEST_DATABASE_URL, which the tests wipe, and fakeredis.
+    """
+    from config import ApplicationConfig
+    from api import create_app
+
+    work_dir = tmp_path_factory.mktemp('api')
+    client = fakeredis.FakeRedis(server=redis_server)
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': os.getenv('TEST_DATABASE_URL') or f"sqlite:///{work_dir / 'test.db'}",
+        'SECRET_KEY': 'test',
+        'IMAGE_STORE_DIR': str(work_dir / 'images'),
+        # hashes a password in a millisecond instead of a tenth of a second
+        'SCRYPT_N': 1024,
+        'PASSWORD_HASH_WORKERS': 0,
+        'SLOW_QUERY_MS': 0,
+        # rebuilds the listing on every checkout, no timer outlives its test
+        'STOCK_REFRESH_DELAY': 0,
+        **{name: client for name in dir(ApplicationConfig) if name.endswith('_REDIS')}
+    })
+    app.testing = True
+    return app
+
+@pytest.fixture
+def database(app):
+    """
+    Empties the database, Redis and the in-process state derived from them before a test.
+    """
+    import api.models
+    from api import db
+    from api.services import user_service
+
+    with app.app_context():
+        db.drop_all(bind_key=None)
+        db.create_all(bind_key=None)
+    app.config['CACHE_REDIS'].flushall()
+    for name in DERIVED_STATE:
+        app.extensions.pop(name, None)
+    user_service._session_users = None
+    return db
+
+@pytest.fixture
+def client(app, database):
+    return app.test_client()
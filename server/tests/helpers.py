@@ -0,0 +1,58 @@
+import base64
+import io
+import json
+
+def basic_auth(username: str, password: str) -> dict:
+    return {'Authorization': 'Basic ' + base64.b64encode(f'{username}:{password}'.encode()).decode()}
+
+def create_item(client, name: str, price: str = '1.00', stock: int = 10) -> int:
+    """
+    Creates an item through the API.
+
+    :return: The ID of the item.
+    """
+    # the route reads a JSON string encoded as JSON again
+    data = json.dumps(json.dumps({'name': name, 'price': price, 'stock': stock}))
+    response = client.post('/api/item/', data={'data': data})
+    assert response.status_code == 201, response.json
+    return response.json['id']
+
+def update_item(client, item_id: int, **fields):
+    """
+    Updates an item through the API, fields that are not given keep their values.
+    """
+    item = client.get(f'/api/item/{item_id}/').json
+    data = {field: item[field] for field in ('name', 'description', 'price', 'category', 'size', 'color', 'stock')}
+    data.update(fields)
+    response = client.put(f'/api/item/{item_id}/', data={'data': json.dumps(json.dumps(data))})
+    assert response.status_code == 200, response.json
+    return response.json
+
+def create_shopper(client, username: str) -> int:
+    """
+    Registers a user and creates their cart through the API.
+
+    :return: The ID of the user, which is also the ID of the cart.
+    """
+    response = client.post('/api/user/', headers=basic_auth(username, 'password'))
+    assert response.status_code == 201, response.json
+    user_id = response.json['id']
+    assert client.post(f'/api/cart/{user_id}/').status_code == 201
+    return user_id
+
+def add_line(client, cart_id: int, item_id: int, quantity: int):
+    response = client.put(f'/api/cart/item/{cart_id}/', json={'item_id': item_id, 'quantity': quantity})
+    assert response.status_code == 200, response.json
+
+def png(size: tuple = (4, 4)) -> bytes:
+    """
+    Draws a PNG image, needs Pillow.
+    """
+    from PIL import Image
+
+    data = io.BytesIO()
+    Image.new('RGB', size, 'red').save(data, format='PNG')
+    return data.getvalue()
+
+def upload_image(client, item_id: int, content: bytes, filename: str):
+    return client.put(f'/api/item/image/{item_id}/', data={'image': (io.BytesIO(content), filename)})
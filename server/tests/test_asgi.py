@@ -0,0 +1,85 @@
+import asyncio
+import json
+import pytest
+from api.profiler import query_budget
+from tests.helpers import basic_auth
+
+fakeredis = pytest.importorskip('fakeredis')
+pytest.importorskip('quart')
+pytest.importorskip('asgiref')
+httpx = pytest.importorskip('httpx')
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+def anyio_backend():
+    return 'asyncio'
+
+@pytest.fixture
+def sql_profiling():
+    return 'off'
+
+@pytest.fixture
+async def asgi_client(app, database, redis_server, sql_profiling, monkeypatch):
+    """
+    A client of the ASGI app of asgi.py, with its async Redis client on the tests' fakeredis server.
+    """
+    from api.aio import create_async_app
+    from api.aio.database import async_url, dispose
+
+    pytest.importorskip(async_url(app.config['SQLALCHEMY_DATABASE_URI']).get_driver_name())
+    monkeypatch.setitem(app.config, 'SQL_PROFILING', sql_profiling)
+    asgi_app = create_async_app(app)
+    app.extensions['async_database']['redis'] = fakeredis.FakeAsyncRedis(server=redis_server)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=asgi_app), base_url='http://localhost') as client:
+        yield client
+    await dispose(app)
+
+async def _create_item(client, name: str) -> int:
+    # the route reads a JSON string encoded as JSON again
+    data = json.dumps(json.dumps({'name': name, 'price': '1.00', 'stock': 3}))
+    response = await client.post('/api/item/', data={'data': data})
+    assert response.status_code == 201, response.text
+    return response.json()['id']
+
+async def _create_user(client, username: str) -> int:
+    response = await client.post('/api/user/', headers=basic_auth(username, 'password'))
+    assert response.status_code == 201, response.text
+    return response.json()['id']
+
+async def test_async_routes_answer_like_sync_routes(asgi_client, client):
+    # POST /api/item/ has no async route, the dispatcher hands it to the Flask app
+    item_id = await _create_item(asgi_client, 'lamp')
+
+    response = await asgi_client.get(f'/api/item/{item_id}/')
+
+    assert response.status_code == 200
+    assert response.json() == client.get(f'/api/item/{item_id}/').json
+    not_modified = await asgi_client.get(f'/api/item/{item_id}/', headers={'If-None-Match': response.headers['ETag']})
+    assert not_modified.status_code == 304
+    assert not_modified.headers['ETag'] == response.headers['ETag']
+
+async def test_sessions_are_shared_with_sync_routes(asgi_client):
+    user_id = await _create_user(asgi_client, 'ada')
+    assert (await asgi_client.get('/api/user/session/')).status_code == 401
+
+    # logged in by the Flask app, read by the async route
+    login = await asgi_client.post('/api/user/login/', headers=basic_auth('ada', 'password'))
+    assert login.status_code == 200
+    response = await asgi_client.get('/api/user/session/')
+
+    assert response.status_code == 200
+    assert response.json()['id'] == user_id
+
+@pytest.mark.parametrize('sql_profiling', ['always'])
+async def test_concurrent_requests_count_their_own_queries(asgi_client):
+    user_ids = [await _create_user(asgi_client, f'user{i}') for i in range(10)]
+    with query_budget(2):
+        single = await asgi_client.get(f'/api/user/{user_ids[0]}/')
+    count = single.headers['X-Query-Count']
+
+    responses = await asyncio.gather(*[asgi_client.get(f'/api/user/{user_id}/') for user_id in user_ids])
+
+    assert [response.status_code for response in responses] == [200] * len(user_ids)
+    assert [response.headers['X-Query-Count'] for response in responses] == [count] * len(user_ids)
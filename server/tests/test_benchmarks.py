@@ -0,0 +1,44 @@
+import json
+import os
+import subprocess
+import sys
+from benchmarks.report import compare
+from benchmarks.scenarios import SCENARIOS
+
+def _summary(p50: float, queries: float = 1.0, errors: int = 0) -> dict:
+    return {'p50_ms': p50, 'p95_ms': p50 * 2, 'queries': queries, 'errors': errors}
+
+def test_every_scenario_runs_without_errors(tmp_path):
+    baseline = tmp_path / 'baseline.json'
+
+    # in its own process, the app can only be created once per process. A tiny dataset and cheap password hashes,
+    # this checks the scenarios, not the timings
+    result = subprocess.run([
+        sys.executable, '-m', 'benchmarks', '--users', '3', '--items', '10', '--lines', '2', '--requests', '2',
+        '--warmup', '1', '--concurrency', '2', '-c', 'SCRYPT_N=1024', '-c', 'PASSWORD_HASH_WORKERS=0',
+        '--baseline', str(baseline), '--save-baseline'
+    ], cwd=os.path.dirname(os.path.dirname(__file__)), capture_output=True, text=True, timeout=300)
+
+    assert result.returncode == 0, result.stderr
+    results = json.loads(baseline.read_text())['results']
+    assert set(results) == {'client', 'http'}
+    for summaries in results.values():
+        assert set(summaries) == set(SCENARIOS)
+        assert {name: summary['first_error'] for name, summary in summaries.items() if summary['errors']} == {}
+
+def test_compare_reports_slower_scenarios_extra_queries_and_errors():
+    baseline = {'client': {'fast': _summary(1.0), 'steady': _summary(1.0), 'gone': _summary(1.0)}}
+    results = {'client': {
+        'fast': _summary(1.5, queries=2.0, errors=1),
+        'steady': _summary(1.1),
+        'new': _summary(9.0)
+    }}
+
+    regressions = compare(results, baseline, 0.2)
+
+    assert regressions == [
+        '[client] fast: p50_ms 1.00 -> 1.50 (+50%)',
+        '[client] fast: p95_ms 2.00 -> 3.00 (+50%)',
+        '[client] fast: queries 1.00 -> 2.00',
+        '[client] fast: errors 0 -> 1'
+    ]
@@ -0,0 +1,26 @@
+import pytest
+from tests.helpers import create_item
+
+pytest.importorskip('numpy')
+
+def _names(client, query: str) -> list[str]:
+    response = client.get(f'/api/item/browse/?{query}')
+    assert response.status_code == 200, response.json
+    return [item['name'] for item in response.json['data']]
+
+@pytest.mark.parametrize('query, names', [
+    ('min_price=1.01', ['b', 'c']),
+    ('min_price=1.005', ['b', 'c']),
+    ('max_price=1.01', ['a', 'b']),
+    ('max_price=1.015', ['a', 'b']),
+    ('min_price=1.001&max_price=1.009', [])
+])
+def test_price_bounds_between_cents_round_inwards(client, query, names):
+    for name, price in (('a', '1.00'), ('b', '1.01'), ('c', '1.02')):
+        create_item(client, name, price)
+
+    assert _names(client, f'{query}&sort=price') == names
+
+def test_invalid_price_is_bad_request(client):
+    assert client.get('/api/item/browse/?min_price=abc').status_code == 400
+    assert client.get('/api/item/browse/?max_price=Infinity').status_code == 400
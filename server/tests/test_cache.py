@@ -0,0 +1,63 @@
+import pytest
+from api.services import cache
+from tests.helpers import create_item, update_item
+
+fakeredis = pytest.importorskip('fakeredis')
+
+@pytest.fixture
+def loads():
+    """
+    A loader that counts its calls.
+    """
+    calls = []
+
+    def load(value):
+        calls.append(value)
+        return {'value': value}
+
+    load.calls = calls
+    return load
+
+def test_values_are_loaded_once_per_generation(app, database, loads):
+    with app.app_context():
+        assert cache.cached('things', 'a', lambda: loads(1), 60) == {'value': 1}
+        assert cache.cached('things', 'a', lambda: loads(2), 60) == {'value': 1}
+        cache.invalidate('things')
+        assert cache.cached('things', 'a', lambda: loads(3), 60) == {'value': 3}
+
+    assert loads.calls == [1, 3]
+
+def test_values_of_several_namespaces_are_invalidated_by_any(app, database, loads):
+    with app.app_context():
+        cache.cached(('things', 'thing:1'), 'a', lambda: loads(1), 60)
+        cache.invalidate('thing:2')
+        cache.cached(('things', 'thing:1'), 'a', lambda: loads(2), 60)
+        cache.invalidate('thing:1')
+        cache.cached(('things', 'thing:1'), 'a', lambda: loads(3), 60)
+        cache.invalidate('things')
+        cache.cached(('things', 'thing:1'), 'a', lambda: loads(4), 60)
+
+    assert loads.calls == [1, 3, 4]
+
+def test_without_redis_values_are_loaded(app, database, loads, monkeypatch):
+    server = fakeredis.FakeServer()
+    server.connected = False
+    monkeypatch.setitem(app.config, 'CACHE_REDIS', fakeredis.FakeRedis(server=server))
+
+    with app.app_context():
+        assert cache.cached('things', 'a', lambda: loads(1), 60) == {'value': 1}
+        cache.invalidate('things')
+        assert cache.cached('things', 'a', lambda: loads(2), 60) == {'value': 2}
+
+def test_item_writes_invalidate_items_and_pages(client):
+    item_id = create_item(client, 'lamp', '2.00')
+    assert client.get(f'/api/item/{item_id}/').json['price'] == '2.00'
+    assert client.get('/api/item/?limit=5').json['data'][0]['price'] == '2.00'
+
+    update_item(client, item_id, price='3.00')
+
+    assert client.get(f'/api/item/{item_id}/').json['price'] == '3.00'
+    assert client.get('/api/item/?limit=5').json['data'][0]['price'] == '3.00'
+    assert client.delete(f'/api/item/{item_id}/').status_code == 200
+    assert client.get(f'/api/item/{item_id}/').status_code == 404
+    assert client.get('/api/item/?limit=5').json['data'] == []
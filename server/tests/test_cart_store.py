@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+from types import SimpleNamespace
+import pytest
+from sqlalchemy import select
+from api.models.cart_item import CartItem
+from api.services import cart_store, checkout_service
+from tests.helpers import add_line, create_item, create_shopper
+
+@pytest.fixture
+def redis_carts(app, database, monkeypatch):
+    """
+    Keeps carts in Redis, with line IDs from the hi-lo allocator.
+    """
+    monkeypatch.setitem(app.config, 'CART_STORE', 'redis')
+    monkeypatch.setitem(app.config, 'ID_ALLOCATOR', 'hilo')
+    # no background writer, the tests flush by hand
+    monkeypatch.setitem(app.extensions, 'cart_writer', {'pid': os.getpid(), 'thread': None})
+
+def _lines(app, database, cart_id: int) -> dict:
+    with app.app_context():
+        return dict(database.session.execute(select(CartItem.item_id, CartItem.quantity).where(CartItem.cart_id == cart_id)).all())
+
+def test_lines_have_their_ids_before_they_are_written(app, database, redis_carts, client):
+    item_ids = [create_item(client, name) for name in ('lamp', 'desk')]
+    cart_id = create_shopper(client, 'ada')
+    for item_id in item_ids:
+        add_line(client, cart_id, item_id, 1)
+
+    unflushed = client.get(f'/api/cart/{cart_id}/').json
+    with app.app_context():
+        cart_store.flush([cart_id])
+        cart_store.forget(cart_id)
+    flushed = client.get(f'/api/cart/{cart_id}/').json
+
+    assert None not in [line['id'] for line in unflushed['items']]
+    assert unflushed == flushed
+
+def test_redis_carts_need_ids_up_front():
+    cart_store.check_config(SimpleNamespace(config={'CART_STORE': 'redis', 'ID_ALLOCATOR': 'hilo'}))
+    with pytest.raises(ValueError):
+        cart_store.check_config(SimpleNamespace(config={'CART_STORE': 'redis', 'ID_ALLOCATOR': 'identity'}))
+
+def test_flush_does_not_bring_back_checked_out_lines(app, database, redis_carts, client, monkeypatch):
+    item_id = create_item(client, 'lamp', stock=10)
+    cart_id = create_shopper(client, 'ada')
+    add_line(client, cart_id, item_id, 2)
+
+    # the checkout stops after taking the lines, until the flush is waiting for the cart
+    taken, resume = threading.Event(), threading.Event()
+    reserve = checkout_service._reserve
+
+    def paused_reserve(quantities):
+        taken.set()
+        resume.wait(5)
+        return reserve(quantities)
+
+    monkeypatch.setattr(checkout_service, '_reserve', paused_reserve)
+    statuses = []
+    checkout = threading.Thread(target=lambda: statuses.append(app.test_client().post(f'/api/cart/{cart_id}/checkout/').status_code))
+    checkout.start()
+    assert taken.wait(5)
+
+    def flush():
+        with app.app_context():
+            cart_store.flush([cart_id])
+
+    writer = threading.Thread(target=flush)
+    writer.start()
+    time.sleep(0.2)
+    resume.set()
+    checkout.join()
+    writer.join()
+
+    assert statuses == [201]
+    assert _lines(app, database, cart_id) == {}
+    assert client.get(f'/api/cart/{cart_id}/').json['items'] == []
+    assert client.get(f'/api/item/{item_id}/').json['stock'] == 8
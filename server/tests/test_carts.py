@@ -0,0 +1,85 @@
+import threading
+import pytest
+from tests.helpers import add_line, create_item, create_shopper
+
+@pytest.fixture(params=['identity', 'hilo'])
+def allocator(request, app, monkeypatch):
+    monkeypatch.setitem(app.config, 'ID_ALLOCATOR', request.param)
+    # every reservation reaches the id_blocks table
+    monkeypatch.setitem(app.config, 'ID_BLOCK_SIZE', 1)
+    return request.param
+
+def test_batch_applies_removes_sets_and_adds(client, allocator):
+    lamp, desk, chair = [create_item(client, name) for name in ('lamp', 'desk', 'chair')]
+    cart_id = create_shopper(client, 'ada')
+    add_line(client, cart_id, lamp, 1)
+    add_line(client, cart_id, desk, 1)
+
+    # the remove runs before the IDs of the new lines would have been reserved
+    response = client.post(f'/api/cart/{cart_id}/items/', json={
+        'remove': [{'item_id': lamp}, {'item_id': 999}],
+        'set': [{'item_id': desk, 'quantity': 4}],
+        'add': [{'item_id': chair, 'quantity': 2}]
+    })
+
+    assert response.status_code == 200, response.json
+    lines = {line['item_id']: line['quantity'] for line in response.json['cart']['items']}
+    assert lines == {desk: 4, chair: 2}
+    assert [error['item_id'] for error in response.json['errors']] == [999]
+    assert None not in [line['id'] for line in response.json['cart']['items']]
+
+def test_batch_on_missing_cart_is_not_found(client):
+    response = client.post('/api/cart/999/items/', json={'add': []})
+
+    assert response.status_code == 404
+
+def test_cart_embeds_items_and_totals(client):
+    lamp = create_item(client, 'lamp', '2.50', stock=7)
+    desk = create_item(client, 'desk', '10.00')
+    cart_id = create_shopper(client, 'ada')
+    add_line(client, cart_id, lamp, 2)
+    add_line(client, cart_id, desk, 1)
+
+    cart = client.get(f'/api/cart/{cart_id}/').json
+
+    assert [(line['item_id'], line['quantity'], line['subtotal']) for line in cart['items']] == [(lamp, 2, '5.00'), (desk, 1, '10.00')]
+    assert cart['items'][0]['item'] == {'name': 'lamp', 'price': '2.50', 'image_url': None, 'stock': 7}
+    assert cart['subtotal'] == '15.00'
+    assert client.get('/api/cart/').json['data'] == [cart]
+
+def test_empty_cart_has_zero_subtotal(client):
+    cart_id = create_shopper(client, 'ada')
+
+    assert client.get(f'/api/cart/{cart_id}/').json == {'id': cart_id, 'items': [], 'subtotal': '0.00'}
+
+def test_concurrent_adds_of_one_item_make_one_line(app, client):
+    item_id = create_item(client, 'lamp')
+    cart_id = create_shopper(client, 'ada')
+    barrier = threading.Barrier(8)
+    statuses = []
+
+    def add():
+        thread_client = app.test_client()
+        barrier.wait()
+        statuses.append(thread_client.put(f'/api/cart/item/{cart_id}/', json={'item_id': item_id, 'quantity': 1}).status_code)
+
+    threads = [threading.Thread(target=add) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert statuses == [200] * 8
+    assert [line['quantity'] for line in client.get(f'/api/cart/{cart_id}/').json['items']] == [8]
+
+def test_add_and_remove_report_missing_rows(client):
+    item_id = create_item(client, 'lamp')
+    cart_id = create_shopper(client, 'ada')
+
+    assert client.put(f'/api/cart/item/{cart_id}/', json={'item_id': 999, 'quantity': 1}).status_code == 404
+    assert client.put('/api/cart/item/999/', json={'item_id': item_id, 'quantity': 1}).status_code == 404
+    assert client.delete(f'/api/cart/item/{cart_id}/', json={'item_id': 999}).status_code == 404
+    add_line(client, cart_id, item_id, 1)
+    response = client.delete(f'/api/cart/item/{cart_id}/', json={'item_id': item_id})
+    assert response.status_code == 200
+    assert response.json['items'] == []
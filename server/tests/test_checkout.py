@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import Counter
+import pytest
+from sqlalchemy import func, select
+from api.models.item import Item
+from api.models.order import Order
+from api.models.order_item import OrderItem
+from api.services import listing_snapshot
+from tests.helpers import add_line, create_item, create_shopper
+
+@pytest.fixture(params=[False, True], ids=['database', 'admission'])
+def admission(request, app, monkeypatch):
+    monkeypatch.setitem(app.config, 'STOCK_ADMISSION', request.param)
+    return request.param
+
+def _checkout_concurrently(app, cart_ids: list[int]) -> Counter:
+    """
+    Checks out every cart at once, one thread per cart ID, released together by a barrier.
+
+    :return: HTTP status -> number of responses.
+    """
+    statuses = Counter()
+    barrier = threading.Barrier(len(cart_ids))
+
+    def checkout(cart_id: int):
+        client = app.test_client()
+        barrier.wait()
+        statuses[client.post(f'/api/cart/{cart_id}/checkout/').status_code] += 1
+
+    threads = [threading.Thread(target=checkout, args=(cart_id,)) for cart_id in cart_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses
+
+def _sold(app, database, item_id: int) -> tuple[int, int]:
+    with app.app_context():
+        sold = database.session.scalar(select(func.coalesce(func.sum(OrderItem.quantity), 0)).where(OrderItem.item_id == item_id))
+        stock = database.session.scalar(select(Item.stock).where(Item.id == item_id))
+    return sold, stock
+
+def test_checkout_takes_stock_and_empties_cart(client):
+    item_id = create_item(client, 'lamp', '2.50', stock=5)
+    cart_id = create_shopper(client, 'ada')
+    add_line(client, cart_id, item_id, 2)
+
+    response = client.post(f'/api/cart/{cart_id}/checkout/')
+
+    assert response.status_code == 201
+    assert response.json['total'] == '5.00'
+    assert client.get(f'/api/item/{item_id}/').json['stock'] == 3
+    assert client.get(f'/api/cart/{cart_id}/').json['items'] == []
+
+def test_checkout_of_short_cart_changes_nothing(client, admission):
+    item_id = create_item(client, 'lamp', stock=1)
+    cart_id = create_shopper(client, 'ada')
+    add_line(client, cart_id, item_id, 2)
+
+    response = client.post(f'/api/cart/{cart_id}/checkout/')
+
+    assert response.status_code == 409
+    assert response.json['items'] == [{'item_id': item_id, 'requested': 2, 'available': 1}]
+    assert client.get(f'/api/item/{item_id}/').json['stock'] == 1
+    assert len(client.get(f'/api/cart/{cart_id}/').json['items']) == 1
+
+def test_concurrent_checkouts_of_one_cart_place_one_order(app, client, database, admission):
+    item_id = create_item(client, 'lamp', stock=100)
+    cart_id = create_shopper(client, 'ada')
+    add_line(client, cart_id, item_id, 3)
+
+    statuses = _checkout_concurrently(app, [cart_id] * 4)
+
+    assert statuses == {201: 1, 400: 3}
+    assert _sold(app, database, item_id) == (3, 97)
+    with app.app_context():
+        assert database.session.scalar(select(func.count()).select_from(Order)) == 1
+
+def test_concurrent_checkouts_never_oversell(app, client, database, admission):
+    item_id = create_item(client, 'drop', stock=25)
+    cart_ids = [create_shopper(client, f'buyer{i}') for i in range(30)]
+    for cart_id in cart_ids:
+        add_line(client, cart_id, item_id, 2)
+
+    statuses = _checkout_concurrently(app, cart_ids)
+
+    assert statuses == {201: 12, 409: 18}
+    assert _sold(app, database, item_id) == (24, 1)
+
+def test_checkouts_rebuild_listing_once_per_delay(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'STOCK_REFRESH_DELAY', 0.5)
+    rebuilds = []
+    rebuild = listing_snapshot.rebuild
+    monkeypatch.setattr(listing_snapshot, 'rebuild', lambda: rebuilds.append(1) or rebuild())
+    item_id = create_item(client, 'lamp', stock=10)
+    assert client.get('/api/item/?limit=5').json['data'][0]['stock'] == 10
+    assert client.get('/api/item/').json['data'][0]['stock'] == 10
+    cart_ids = [create_shopper(client, f'buyer{i}') for i in range(3)]
+    for cart_id in cart_ids:
+        add_line(client, cart_id, item_id, 1)
+    rebuilds.clear()
+
+    for cart_id in cart_ids:
+        assert client.post(f'/api/cart/{cart_id}/checkout/').status_code == 201
+
+    # the item and the pages are current right away, the listing once the delay has passed
+    assert client.get(f'/api/item/{item_id}/').json['stock'] == 7
+    assert client.get('/api/item/?limit=5').json['data'][0]['stock'] == 7
+    assert client.get('/api/item/').json['data'][0]['stock'] == 10
+    time.sleep(1)
+    assert client.get('/api/item/').json['data'][0]['stock'] == 7
+    assert len(rebuilds) == 1
+
+def test_checkout_shows_current_stock_everywhere_by_default(client):
+    item_id = create_item(client, 'lamp', stock=10)
+    assert client.get('/api/item/').json['data'][0]['stock'] == 10
+    assert client.get('/api/item/?limit=5').json['data'][0]['stock'] == 10
+    cart_id = create_shopper(client, 'ada')
+    add_line(client, cart_id, item_id, 2)
+
+    assert client.post(f'/api/cart/{cart_id}/checkout/').status_code == 201
+
+    assert client.get('/api/item/').json['data'][0]['stock'] == 8
+    assert client.get('/api/item/?limit=5').json['data'][0]['stock'] == 8
@@ -0,0 +1,31 @@
+import pytest
+from tests.helpers import add_line, create_item, create_shopper, update_item
+
+def test_item_answers_not_modified_until_it_changes(client):
+    item_id = create_item(client, 'lamp')
+    response = client.get(f'/api/item/{item_id}/')
+    etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+
+    assert client.get(f'/api/item/{item_id}/', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get(f'/api/item/{item_id}/', headers={'If-Modified-Since': last_modified}).status_code == 304
+    update_item(client, item_id, stock=3)
+    changed = client.get(f'/api/item/{item_id}/', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert changed.json['stock'] == 3
+
+@pytest.mark.parametrize('path', ['/api/item/?limit=5', '/api/item/', '/api/user/', '/api/cart/', '/api/cart/{cart}/'])
+def test_lists_and_carts_answer_not_modified_until_a_line_changes(client, path):
+    item_id = create_item(client, 'lamp')
+    cart_id = create_shopper(client, 'ada')
+    path = path.format(cart=cart_id)
+    etag = client.get(path).headers['ETag']
+
+    not_modified = client.get(path, headers={'If-None-Match': etag})
+    assert not_modified.status_code == 304
+    assert not_modified.data == b''
+    if 'cart' in path:
+        add_line(client, cart_id, item_id, 1)
+    else:
+        create_item(client, 'desk') if 'item' in path else create_shopper(client, 'bob')
+    assert client.get(path, headers={'If-None-Match': etag}).status_code == 200
@@ -0,0 +1,29 @@
+import json
+import pytest
+from tests.helpers import add_line, create_item, create_shopper
+
+def _rows(response) -> list[dict]:
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+@pytest.mark.parametrize('chunk_bytes', [0, 64, 64 * 1024])
+def test_exports_stream_every_row_like_the_pages(app, client, monkeypatch, chunk_bytes):
+    monkeypatch.setitem(app.config, 'EXPORT_CHUNK_BYTES', chunk_bytes)
+    # several batches of the export queries
+    monkeypatch.setitem(app.config, 'EXPORT_BATCH_SIZE', 2)
+    item_ids = [create_item(client, f'item{i}') for i in range(5)]
+    cart_ids = [create_shopper(client, f'user{i}') for i in range(3)]
+    add_line(client, cart_ids[0], item_ids[0], 2)
+
+    items = _rows(client.get('/api/item/export/'))
+    users = _rows(client.get('/api/user/export/'))
+    carts = _rows(client.get('/api/cart/export/'))
+
+    assert items == client.get('/api/item/?limit=10').json['data']
+    assert users == client.get('/api/user/?limit=10').json['data']
+    assert carts == client.get('/api/cart/?limit=10').json['data']
+    assert [line['quantity'] for line in carts[0]['items']] == [2]
+
+def test_export_of_empty_table_is_empty(client):
+    assert _rows(client.get('/api/item/export/')) == []
@@ -0,0 +1,47 @@
+import threading
+from api.models.item import Item
+from api.services.id_allocator import HiLoAllocator
+from tests.helpers import create_item
+
+def test_hilo_keys_are_unique_across_allocators(app, database):
+    # two allocators stand for two processes sharing the id_blocks table
+    allocators = [HiLoAllocator(block_size=3), HiLoAllocator(block_size=3)]
+    keys = []
+    barrier = threading.Barrier(4)
+
+    def reserve(allocator: HiLoAllocator):
+        with app.app_context():
+            barrier.wait()
+            for count in (1, 2, 5):
+                keys.extend(allocator.reserve(Item, count))
+
+    threads = [threading.Thread(target=reserve, args=(allocator,)) for allocator in allocators * 2]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(keys) == 4 * 8
+    assert len(set(keys)) == len(keys)
+
+def test_hilo_starts_past_existing_keys(app, client, monkeypatch):
+    existing = [create_item(client, f'item{i}') for i in range(4)]
+    monkeypatch.setitem(app.config, 'ID_ALLOCATOR', 'hilo')
+    monkeypatch.setitem(app.config, 'ID_BLOCK_SIZE', 3)
+    app.extensions.pop('id_allocator', None)
+
+    created = [create_item(client, f'new{i}') for i in range(4)]
+
+    assert min(created) > max(existing)
+    assert len(set(created)) == len(created)
+
+def test_identity_continues_after_hilo_keys(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'ID_ALLOCATOR', 'hilo')
+    hilo = [create_item(client, f'hilo{i}') for i in range(3)]
+    # a new process with the identity allocator resyncs the sequences before its first insert
+    monkeypatch.setitem(app.config, 'ID_ALLOCATOR', 'identity')
+    app.extensions.pop('id_allocator', None)
+
+    identity = create_item(client, 'identity')
+
+    assert identity > max(hilo)
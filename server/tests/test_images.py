@@ -0,0 +1,98 @@
+import io
+import pytest
+from api.services import image_service
+from tests.helpers import create_item, png, upload_image
+
+Image = pytest.importorskip('PIL.Image')
+
+@pytest.mark.parametrize('content, filename', [
+    (b'<html><script>alert(1)</script></html>', 'x.html'),
+    (b'<svg xmlns="http://www.w3.org/2000/svg"><script>alert(1)</script></svg>', 'x.svg'),
+    # a PNG signature followed by markup does not pass verify()
+    (b'\x89PNG\r\n\x1a\n<script>alert(1)</script>', 'x.png')
+])
+def test_upload_that_is_not_a_raster_image_is_rejected(client, content, filename):
+    item_id = create_item(client, 'lamp')
+
+    response = upload_image(client, item_id, content, filename)
+
+    assert response.status_code == 400
+    assert client.get(f'/api/item/{item_id}/').json['image_url'] is None
+
+def test_image_is_stored_and_served_as_its_detected_format(client):
+    item_id = create_item(client, 'lamp')
+
+    response = upload_image(client, item_id, png(), 'x.html')
+
+    assert response.status_code == 200
+    assert response.json['image_url'].endswith('.png')
+    image = client.get(response.json['images']['original']['src'])
+    assert image.status_code == 200
+    assert image.mimetype == 'image/png'
+    assert image.headers['X-Content-Type-Options'] == 'nosniff'
+    assert image.data == png()
+
+@pytest.fixture
+def renders(monkeypatch):
+    """
+    Collects the futures of the derivatives rendered by uploads.
+    """
+    futures = []
+    generate = image_service.generate_derivatives
+    monkeypatch.setattr(image_service, 'generate_derivatives', lambda path: futures.append(generate(path)))
+    return futures
+
+def test_upload_renders_every_variant_in_both_formats(client, renders):
+    item_id = create_item(client, 'lamp')
+
+    images = upload_image(client, item_id, png((600, 300)), 'x.png').json['images']
+    assert renders
+    for future in renders:
+        future.result(30)
+
+    assert set(images) == {'original', *image_service.VARIANTS}
+    for variant, box in image_service.VARIANTS.items():
+        for url, mimetype in ((images[variant]['src'], 'image/png'), (images[variant]['webp'], 'image/webp')):
+            response = client.get(url)
+            assert response.status_code == 200
+            assert response.mimetype == mimetype
+            with Image.open(io.BytesIO(response.data)) as image:
+                # scaled into the bounding box keeping the aspect ratio, never up
+                width = min(600, box[0])
+                assert image.size == (width, width // 2)
+
+def test_versioned_image_urls_are_cached_forever(app, client):
+    item_id = create_item(client, 'lamp')
+    images = upload_image(client, item_id, png(), 'x.png').json['images']
+
+    versioned = client.get(images['original']['src'])
+    unversioned = client.get(f'/api/item/image/{item_id}/')
+
+    assert versioned.cache_control.max_age == app.config['IMAGE_MAX_AGE']
+    assert versioned.cache_control.immutable
+    assert unversioned.cache_control.max_age is None
+    assert client.get(f'/api/item/image/{item_id}/', headers={'If-None-Match': unversioned.headers['ETag']}).status_code == 304
+    partial = client.get(images['original']['src'], headers={'Range': 'bytes=0-7'})
+    assert partial.status_code == 206
+    assert partial.data == png()[:8]
+
+def test_variant_that_is_still_rendering_falls_back_to_the_original(client, monkeypatch):
+    monkeypatch.setattr(image_service, 'generate_derivatives', lambda path: None)
+    item_id = create_item(client, 'lamp')
+    # stored under the hash of its contents, an image no other test renders
+    images = upload_image(client, item_id, png((5, 5)), 'x.png').json['images']
+
+    response = client.get(images['thumbnail']['webp'])
+
+    assert response.status_code == 200
+    assert response.data == png((5, 5))
+    # revalidated until the derivative exists
+    assert response.cache_control.max_age is None
+
+def test_missing_image_and_unknown_variant(client):
+    item_id = create_item(client, 'lamp')
+
+    assert client.get(f'/api/item/image/{item_id}/').status_code == 404
+    assert client.get('/api/item/image/999/').status_code == 404
+    upload_image(client, item_id, png(), 'x.png')
+    assert client.get(f'/api/item/image/{item_id}/?variant=huge').status_code == 400
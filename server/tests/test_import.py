@@ -0,0 +1,35 @@
+import json
+import pytest
+from tests.helpers import create_item, png, upload_image
+
+def _import(app, tmp_path, rows: list[dict]):
+    path = tmp_path / 'items.ndjson'
+    path.write_text(''.join(json.dumps(row) + '\n' for row in rows))
+    return app.test_cli_runner().invoke(args=['import-items', str(path)])
+
+def test_import_rebuilds_listing_with_image_urls(app, client, tmp_path):
+    pytest.importorskip('PIL.Image')
+    item_id = create_item(client, 'lamp')
+    assert upload_image(client, item_id, png(), 'lamp.png').status_code == 200
+    assert client.get('/api/item/').status_code == 200
+
+    result = _import(app, tmp_path, [{'name': 'desk', 'price': '20.00', 'stock': 3}])
+
+    assert result.exit_code == 0, result.output
+    listing = client.get('/api/item/').json['data']
+    assert [item['name'] for item in listing] == ['lamp', 'desk']
+    assert listing[0]['images'] == client.get(f'/api/item/{item_id}/').json['images']
+
+def test_rows_with_invalid_stock_are_reported_and_the_rest_written(app, client, tmp_path):
+    result = _import(app, tmp_path, [
+        {'name': 'lamp', 'price': '1.00', 'stock': 3.7},
+        {'name': 'desk', 'price': '1.00', 'stock': 2 ** 31},
+        {'name': 'chair', 'price': '1.00', 'stock': 'many'},
+        {'name': 'shelf', 'price': '1.00', 'stock': -1},
+        {'name': 'stool', 'price': '1.00', 'stock': True},
+        {'name': 'table', 'price': '1.00', 'stock': '4.0'}
+    ])
+
+    assert result.exit_code == 0, result.output
+    assert [line.split(':')[0] for line in result.output.splitlines() if line.startswith('line ')] == [f'line {n}' for n in range(1, 6)]
+    assert [(item['name'], item['stock']) for item in client.get('/api/item/').json['data']] == [('table', 4)]
@@ -0,0 +1,56 @@
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from decimal import Decimal
+import pytest
+from flask.json.provider import DefaultJSONProvider
+from tests.helpers import basic_auth, create_item, update_item
+
+pytest.importorskip('orjson')
+
+@dataclass
+class Point:
+    x: int
+    y: int
+
+VALUES = [
+    {'price': Decimal('2.50'), 'stock': 3, 'name': 'lamp', 'image_url': None, 'tags': ['a', 'b']},
+    {'updated_at': datetime(2024, 5, 1, 12, 30, 15, 123456), 'aware': datetime(2024, 5, 1, tzinfo=timezone.utc), 'day': date(2024, 5, 1)},
+    {'id': uuid.UUID(int=1), 'point': Point(1, 2)},
+    # escaped to ASCII by json, orjson is skipped
+    {'name': 'café ☕', 'control': '\x7f'},
+    # exponents are written differently, orjson is skipped
+    [1e16, 1e-7, 0.1, 1.5, -0.0, 2 ** 70],
+    {'b': 1, 'a': {'d': 2, 'c': 3}}
+]
+
+@pytest.fixture
+def providers(app):
+    from api.json_provider import OrjsonProvider
+    return OrjsonProvider(app), DefaultJSONProvider(app)
+
+@pytest.mark.parametrize('value', VALUES)
+def test_orjson_writes_the_same_bytes_as_json(app, providers, value):
+    fast, default = providers
+
+    with app.app_context():
+        assert fast.response(value).data == default.response(value).data
+    assert fast.dumps(value, separators=(',', ':')) == default.dumps(value, separators=(',', ':'))
+    assert fast.dumps(value, indent=2) == default.dumps(value, indent=2)
+    assert fast.loads(default.dumps(value)) == default.loads(default.dumps(value))
+
+def test_orjson_reads_what_json_reads(providers):
+    fast, _ = providers
+
+    assert fast.loads('{"a": [1, 2.5, null]}') == {'a': [1, 2.5, None]}
+    assert fast.loads(str(2 ** 70)) == 2 ** 70
+    assert str(fast.loads('NaN')) == 'nan'
+
+def test_row_serialization_matches_objects(client):
+    # writes answer with loaded objects, pages are serialized from rows
+    items = [update_item(client, create_item(client, name, '2.50'), description='café', color='red') for name in ('lamp', 'desk')]
+    users = [client.post('/api/user/', headers=basic_auth(name, 'password')).json for name in ('ada', 'grace')]
+
+    assert client.get('/api/item/').json['data'] == items
+    assert client.get('/api/user/').json['data'] == users
+    assert [client.get(f"/api/user/{user['id']}/").json for user in users] == users
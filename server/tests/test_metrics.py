@@ -0,0 +1,35 @@
+import pytest
+from tests.helpers import basic_auth, create_item
+
+prometheus_client = pytest.importorskip('prometheus_client')
+
+def _sample(name: str, **labels) -> float:
+    return prometheus_client.REGISTRY.get_sample_value(name, labels) or 0
+
+def test_requests_are_counted_per_route(client):
+    item_id = create_item(client, 'lamp')
+    labels = {'blueprint': 'api.item', 'endpoint': 'api.item.get_item', 'method': 'GET'}
+    before = _sample('http_requests_total', status='200', **labels)
+    unmatched = _sample('http_requests_total', blueprint='', endpoint='unmatched', method='GET', status='404')
+
+    client.get(f'/api/item/{item_id}/')
+    client.get(f'/api/item/{item_id}/')
+    client.get('/no/such/route/')
+
+    assert _sample('http_requests_total', status='200', **labels) == before + 2
+    assert _sample('http_request_duration_seconds_count', **labels) >= 2
+    assert _sample('http_requests_total', blueprint='', endpoint='unmatched', method='GET', status='404') == unmatched + 1
+
+def test_metrics_endpoint_exposes_sessions_and_password_hashing(client):
+    before = _sample('password_hash_duration_seconds_count', operation='verify')
+    client.post('/api/user/', headers=basic_auth('ada', 'password'))
+    client.post('/api/user/login/', headers=basic_auth('ada', 'password'))
+
+    response = client.get('/metrics')
+
+    assert response.status_code == 200
+    assert response.content_type == prometheus_client.CONTENT_TYPE_LATEST
+    assert _sample('password_hash_duration_seconds_count', operation='verify') == before + 1
+    text = response.get_data(as_text=True)
+    assert 'session_store_duration_seconds_count{operation="open"}' in text
+    assert 'session_store_duration_seconds_count{operation="save"}' in text
@@ -0,0 +1,47 @@
+import pytest
+from tests.helpers import create_item, create_shopper
+
+def _walk(client, path: str, **args) -> list[int]:
+    """
+    Reads every page of a list endpoint, following the cursors.
+
+    :return: The IDs of the rows in the order they were read.
+    """
+    ids, cursor = [], None
+    while True:
+        query = {**args, **({'cursor': cursor} if cursor else {})}
+        response = client.get(path, query_string=query)
+        assert response.status_code == 200, response.json
+        ids += [row['id'] for row in response.json['data']]
+        cursor = response.json['next']
+        if cursor is None:
+            return ids
+
+@pytest.mark.parametrize('sort', ['id', 'updated_at'])
+def test_cursors_walk_every_row_once(client, sort):
+    item_ids = [create_item(client, f'item{i}') for i in range(5)]
+    cart_ids = [create_shopper(client, f'user{i}') for i in range(5)]
+
+    assert sorted(_walk(client, '/api/item/', limit=2, sort=sort)) == item_ids
+    assert sorted(_walk(client, '/api/user/', limit=2, sort=sort)) == cart_ids
+    assert sorted(_walk(client, '/api/cart/', limit=2, sort=sort)) == cart_ids
+
+def test_limit_is_clamped(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'PAGE_SIZE_MAX', 3)
+    for i in range(5):
+        create_item(client, f'item{i}')
+
+    assert len(client.get('/api/item/?limit=1000').json['data']) == 3
+    assert len(client.get('/api/item/?limit=0').json['data']) == 1
+
+@pytest.mark.parametrize('path', ['/api/item/', '/api/user/', '/api/cart/'])
+def test_invalid_cursor_or_sort_is_bad_request(client, path):
+    create_item(client, 'lamp')
+    create_item(client, 'desk')
+    next_cursor = client.get(path, query_string={'limit': 1}).json['next']
+
+    assert client.get(path, query_string={'cursor': 'garbage'}).status_code == 400
+    assert client.get(path, query_string={'sort': 'password'}).status_code == 400
+    if next_cursor:
+        # a cursor is only valid for the sort it was made for
+        assert client.get(path, query_string={'cursor': next_cursor, 'sort': 'updated_at'}).status_code == 400
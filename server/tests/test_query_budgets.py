@@ -0,0 +1,50 @@
+import pytest
+from api.profiler import QueryBudgetExceeded, query_budget
+from tests.helpers import add_line, create_item, create_shopper
+
+ITEMS = 5
+SHOPPERS = 5
+
+# route -> (statements of the first request, statements once it is cached), with more rows than either,
+# so a lazy load per row cannot stay under the budget
+BUDGETS = {
+    # served from the listing snapshot built by the writes
+    '/api/item/': (0, 0),
+    '/api/item/?limit=3': (2, 0),
+    '/api/item/{item}/': (2, 0),
+    '/api/item/search/?q=lamp': (2, 0),
+    '/api/item/browse/': (2, 1),
+    '/api/cart/': (3, 3),
+    '/api/cart/{cart}/': (3, 3),
+    '/api/user/': (2, 2),
+    '/api/user/{user}/': (2, 2)
+}
+
+@pytest.fixture
+def catalog(client) -> dict:
+    """
+    Fills every cart with every item.
+
+    :return: The IDs of an item, a cart and its user to put in the routes.
+    """
+    item_ids = [create_item(client, f'lamp {i}') for i in range(ITEMS)]
+    cart_ids = [create_shopper(client, f'shopper{i}') for i in range(SHOPPERS)]
+    for cart_id in cart_ids:
+        for item_id in item_ids:
+            add_line(client, cart_id, item_id, 1)
+    return {'item': item_ids[0], 'cart': cart_ids[0], 'user': cart_ids[0]}
+
+@pytest.mark.parametrize('route', BUDGETS)
+def test_route_stays_within_query_budget(client, catalog, route):
+    first, cached = BUDGETS[route]
+    path = route.format(**catalog)
+
+    with query_budget(first):
+        assert client.get(path).status_code == 200
+    with query_budget(cached):
+        assert client.get(path).status_code == 200
+
+def test_query_budget_fails_when_exceeded(client, catalog):
+    with pytest.raises(QueryBudgetExceeded, match='2 queries ran, the budget is 1'):
+        with query_budget(1):
+            client.get(f'/api/user/{catalog["user"]}/')
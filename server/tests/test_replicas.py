@@ -0,0 +1,55 @@
+import itertools
+import os
+import pytest
+from sqlalchemy import create_engine
+from api import replicas
+from tests.helpers import basic_auth
+
+@pytest.fixture
+def lagging_replica(app, database, tmp_path, monkeypatch):
+    """
+    A replica that never receives the primary's writes, so the tests can tell which database answered a read.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    database.metadata.create_all(engine)
+    replica = replicas.Replica('replica0', engine)
+    # checked by the test, no health check thread
+    monkeypatch.setitem(app.extensions, 'replicas', {'replicas': [replica], 'turn': itertools.count(), 'checker': os.getpid()})
+    # what init_replicas registers when SQLALCHEMY_REPLICA_URIS is set
+    monkeypatch.setitem(app.after_request_funcs, None, [*app.after_request_funcs.get(None, []), replicas._pin_primary])
+    yield replica
+    engine.dispose()
+
+def _usernames(client) -> list[str]:
+    return [user['username'] for user in client.get('/api/user/').json['data']]
+
+def test_writers_read_their_writes_from_the_primary(app, client, lagging_replica):
+    response = client.post('/api/user/', headers=basic_auth('ada', 'password'))
+
+    pin, = [cookie for cookie in response.headers.getlist('Set-Cookie') if cookie.startswith(replicas.PIN_COOKIE)]
+    assert f"Max-Age={app.config['REPLICA_PIN_SECONDS']}" in pin
+    assert _usernames(client) == ['ada']
+    # other clients read the replica, which has not caught up
+    assert _usernames(app.test_client()) == []
+    client.delete_cookie(replicas.PIN_COOKIE)
+    assert _usernames(client) == []
+
+def test_reads_that_fill_caches_go_to_the_primary(app, client, lagging_replica):
+    user_id = client.post('/api/user/', headers=basic_auth('ada', 'password')).json['id']
+    reader = app.test_client()
+
+    assert reader.post('/api/user/login/', headers=basic_auth('ada', 'password')).status_code == 200
+    assert reader.get(f'/api/user/{user_id}/').status_code == 404
+    assert reader.get('/api/user/session/').json == {'id': user_id, 'username': 'ada'}
+
+def test_unhealthy_replica_is_skipped(app, client, lagging_replica, tmp_path):
+    client.post('/api/user/', headers=basic_auth('ada', 'password'))
+    reader = app.test_client()
+    assert _usernames(reader) == []
+
+    lagging_replica.healthy = False
+    assert _usernames(reader) == ['ada']
+
+    broken = replicas.Replica('broken', create_engine(f"sqlite:///{tmp_path / 'missing' / 'replica.db'}"))
+    assert not broken.check()
+    assert lagging_replica.check()
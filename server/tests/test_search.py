@@ -0,0 +1,52 @@
+from tests.helpers import create_item, update_item
+
+def _search(client, q: str, **params) -> list[str]:
+    response = client.get('/api/item/search/', query_string={'q': q, **params})
+    assert response.status_code == 200, response.json
+    return [item['name'] for item in response.json['data']]
+
+def test_search_ranks_names_above_other_columns(client):
+    update_item(client, create_item(client, 'desk'), description='a desk with a lamp clamp')
+    update_item(client, create_item(client, 'stool'), color='lamp black')
+    create_item(client, 'lamp')
+    create_item(client, 'chair')
+
+    assert _search(client, 'lamp') == ['lamp', 'stool', 'desk']
+
+def test_every_word_matches_the_start_of_a_word(client):
+    update_item(client, create_item(client, 'desk lamp'), color='black')
+    update_item(client, create_item(client, 'floor lamp'), color='white')
+    create_item(client, 'clamp')
+
+    assert _search(client, 'LA') == ['desk lamp', 'floor lamp']
+    assert _search(client, 'lamp bla') == ['desk lamp']
+    assert _search(client, 'lamp red') == []
+    assert _search(client, '  ') == []
+
+def test_search_follows_writes(client):
+    lamp = create_item(client, 'lamp')
+    desk = create_item(client, 'desk')
+    assert _search(client, 'lamp') == ['lamp']
+
+    update_item(client, lamp, name='sconce')
+    update_item(client, desk, description='lamp included')
+    assert _search(client, 'lamp') == ['desk']
+    assert client.delete(f'/api/item/{desk}/').status_code == 200
+    assert _search(client, 'lamp') == []
+    assert _search(client, 'sconce') == ['sconce']
+
+def test_search_pages(client):
+    for i in range(5):
+        create_item(client, f'lamp {i}')
+
+    names, cursor = [], None
+    while True:
+        params = {'limit': 2, 'cursor': cursor} if cursor else {'limit': 2}
+        page = client.get('/api/item/search/', query_string={'q': 'lamp', **params}).json
+        names += [item['name'] for item in page['data']]
+        cursor = page['next']
+        if not cursor:
+            break
+
+    assert names == [f'lamp {i}' for i in range(5)]
+    assert client.get('/api/item/search/', query_string={'q': 'lamp', 'cursor': 'nonsense'}).status_code == 400
@@ -0,0 +1,65 @@
+import pytest
+from api.models.user import User
+from api.profiler import query_budget
+from api.services import user_service
+from tests.helpers import basic_auth
+
+def _register(client, username: str, password: str = 'password') -> int:
+    response = client.post('/api/user/', headers=basic_auth(username, password))
+    assert response.status_code == 201, response.json
+    return response.json['id']
+
+def _stored_hash(app, database, user_id: int) -> str:
+    with app.app_context():
+        return database.session.get(User, user_id).password
+
+@pytest.mark.parametrize('workers', [0, 1])
+def test_login_checks_the_password(app, client, monkeypatch, workers):
+    # 1 hashes on the process pool
+    monkeypatch.setitem(app.config, 'PASSWORD_HASH_WORKERS', workers)
+    _register(client, 'ada', 'secret')
+
+    assert client.post('/api/user/login/', headers=basic_auth('ada', 'secret')).status_code == 200
+    assert client.post('/api/user/login/', headers=basic_auth('ada', 'wrong')).status_code == 401
+    assert client.post('/api/user/login/', headers=basic_auth('bob', 'secret')).status_code == 401
+
+def test_login_rehashes_passwords_made_with_other_parameters(app, database, client, monkeypatch):
+    user_id = _register(client, 'ada', 'secret')
+    assert _stored_hash(app, database, user_id).startswith('scrypt:1024:8:1$')
+
+    monkeypatch.setitem(app.config, 'SCRYPT_N', 2048)
+    assert client.post('/api/user/login/', headers=basic_auth('ada', 'secret')).status_code == 200
+    rehashed = _stored_hash(app, database, user_id)
+    assert rehashed.startswith('scrypt:2048:8:1$')
+
+    # the old hash is only replaced once, and the new one still checks out
+    assert client.post('/api/user/login/', headers=basic_auth('ada', 'secret')).status_code == 200
+    assert _stored_hash(app, database, user_id) == rehashed
+
+@pytest.fixture(params=['in-process', 'session'])
+def session_cache(request, app, monkeypatch):
+    """
+    Serves session users from the in-process cache, or with it expiring at once, from the copy stored with the session.
+    """
+    if request.param == 'session':
+        monkeypatch.setitem(app.config, 'SESSION_USER_TTL', 0)
+    user_service._session_users = None
+    yield request.param
+    user_service._session_users = None
+
+def test_session_user_follows_updates_and_deletes(client, session_cache):
+    user_id = _register(client, 'ada')
+    client.post('/api/user/login/', headers=basic_auth('ada', 'password'))
+    assert client.get('/api/user/session/').json == {'id': user_id, 'username': 'ada'}
+
+    # either copy is current, no query is needed
+    with query_budget(0):
+        assert client.get('/api/user/session/').json == {'id': user_id, 'username': 'ada'}
+
+    assert client.put(f'/api/user/{user_id}/', json={'username': 'grace', 'password': 'password'}).status_code == 200
+    assert client.get('/api/user/session/').json == {'id': user_id, 'username': 'grace'}
+
+    assert client.delete(f'/api/user/{user_id}/').status_code == 200
+    assert client.get('/api/user/session/').status_code == 401
+    # the session was cleared with the user
+    assert client.get('/api/user/session/').status_code == 401